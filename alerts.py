@@ -0,0 +1,260 @@
+import json
+import logging
+import math
+import time
+from dataclasses import asdict, dataclass
+
+import requests
+
+from ring_buffer import extract_metric
+
+# Used when there is no rules file: a loaded 15 A outlet, an overheating plug, sudden jumps
+# in power and a voltage reading that stops changing
+DEFAULT_RULES = [
+    {"name": "Overload", "type": "threshold", "metric": "apower", "above": 1800, "for": 5},
+    {"name": "Overheating", "type": "threshold", "metric": "temperature.tF", "above": 176, "for": 30},
+    {"name": "Power spike", "type": "zscore", "metric": "apower", "threshold": 5, "min_deviation": 50, "when_on": True},
+    {"name": "Stuck voltage", "type": "stuck", "metric": "voltage", "seconds": 900},
+]
+
+
+@dataclass(frozen=True)
+class Alert:
+    """A rule starting (``firing``) or stopping (``resolved``) to match a device's samples."""
+    device: str
+    rule: str
+    metric: str
+    value: float
+    message: str
+    state: str
+    timestamp: float
+
+
+class Rule:
+    """A condition evaluated on one metric of every sample, keeping O(1) state per device.
+
+    ``check`` returns a description while the condition holds and None
+    otherwise. Debouncing is left to ``AlertEngine``: a rule must hold for
+    ``for_seconds`` before it fires, a device is notified about the same rule
+    at most once per ``cooldown`` seconds, and ``auto_off`` switches the outlet
+    off when the rule fires. ``devices`` limits a rule to some devices and
+    ``when_on`` skips samples taken while the outlet is off.
+    """
+
+    def __init__(self, name, metric, for_seconds=0.0, cooldown=300.0, auto_off=False, devices=None, when_on=False):
+        self.name = name
+        self.metric = metric
+        self.for_seconds = for_seconds
+        self.cooldown = cooldown
+        self.auto_off = auto_off
+        self.devices = set(devices) if devices else None
+        self.when_on = when_on
+        self.states = {}
+
+    def check(self, ip_address, value, now):
+        raise NotImplementedError
+
+
+class ThresholdRule(Rule):
+    """Matches while a metric is above ``above`` or below ``below``."""
+
+    def __init__(self, name, metric, above=None, below=None, **options):
+        super().__init__(name, metric, **options)
+        self.above = above
+        self.below = below
+
+    def check(self, ip_address, value, now):
+        if self.above is not None and value > self.above:
+            return f"{self.metric} {value:g} above {self.above:g}"
+        if self.below is not None and value < self.below:
+            return f"{self.metric} {value:g} below {self.below:g}"
+        return None
+
+
+class RateRule(Rule):
+    """Matches when a metric changes faster than ``max_rate`` units per second between samples."""
+
+    def __init__(self, name, metric, max_rate, **options):
+        super().__init__(name, metric, **options)
+        self.max_rate = max_rate
+
+    def check(self, ip_address, value, now):
+        previous = self.states.get(ip_address)
+        self.states[ip_address] = (value, now)
+        if previous is None or now <= previous[1]:
+            return None
+        rate = (value - previous[0]) / (now - previous[1])
+        if abs(rate) > self.max_rate:
+            return f"{self.metric} changing {rate:+.1f}/s, over {self.max_rate:g}/s"
+        return None
+
+
+class ZScoreRule(Rule):
+    """Matches samples more than ``threshold`` standard deviations from the metric's moving average.
+
+    The mean and variance are exponentially weighted with weight ``alpha``, so
+    old samples fade out without being stored. Nothing matches during the
+    first ``warmup`` samples, nor deviations smaller than ``min_deviation``,
+    which keeps a nearly constant signal from alerting on noise.
+    """
+
+    def __init__(self, name, metric, threshold=4.0, alpha=0.05, warmup=30, min_deviation=0.0, **options):
+        super().__init__(name, metric, **options)
+        self.threshold = threshold
+        self.alpha = alpha
+        self.warmup = warmup
+        self.min_deviation = min_deviation
+
+    def check(self, ip_address, value, now):
+        state = self.states.get(ip_address)
+        if state is None:
+            self.states[ip_address] = [value, 0.0, 1]
+            return None
+        mean, variance, count = state
+        deviation = value - mean
+        std = math.sqrt(variance)
+        # Scored against the average before this sample, so a spike does not hide itself
+        matched = (count >= self.warmup and abs(deviation) > self.min_deviation
+                   and abs(deviation) > self.threshold * std)
+        state[0] = mean + self.alpha * deviation
+        state[1] = (1 - self.alpha) * (variance + self.alpha * deviation * deviation)
+        state[2] = count + 1
+        if matched:
+            return f"{self.metric} {value:g} is {abs(deviation) / std if std else math.inf:.1f} std from its average {mean:.1f}"
+        return None
+
+
+class StuckRule(Rule):
+    """Matches when a metric has stayed within ``tolerance`` of one value for ``seconds``."""
+
+    def __init__(self, name, metric, seconds=600.0, tolerance=0.0, **options):
+        super().__init__(name, metric, **options)
+        self.seconds = seconds
+        self.tolerance = tolerance
+
+    def check(self, ip_address, value, now):
+        state = self.states.get(ip_address)
+        if state is None or abs(value - state[0]) > self.tolerance:
+            self.states[ip_address] = (value, now)
+            return None
+        if now - state[1] >= self.seconds:
+            return f"{self.metric} stuck at {value:g} for {now - state[1]:.0f}s"
+        return None
+
+
+RULE_TYPES = {"threshold": ThresholdRule, "rate": RateRule, "zscore": ZScoreRule, "stuck": StuckRule}
+
+
+def build_rule(spec):
+    """Create a rule from a JSON rule spec, in which ``for`` stands for ``for_seconds``."""
+    spec = dict(spec)
+    rule_type = RULE_TYPES[spec.pop("type")]
+    if "for" in spec:
+        spec["for_seconds"] = spec.pop("for")
+    return rule_type(**spec)
+
+
+def load_rules(path):
+    """Read rule specs from a JSON file, falling back to ``DEFAULT_RULES`` if it does not exist."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            specs = json.load(file)
+    except FileNotFoundError:
+        specs = DEFAULT_RULES
+    return [build_rule(spec) for spec in specs]
+
+
+class Debounce:
+    """Notification state of one rule on one device."""
+    __slots__ = ("matching_since", "firing", "notified", "last_notified")
+
+    def __init__(self):
+        self.matching_since = None
+        self.firing = False
+        self.notified = False
+        self.last_notified = -math.inf
+
+
+class AlertEngine:
+    """Evaluates alert rules on every sample as it arrives.
+
+    ``add_sample`` is a poller sample sink: it runs on the poller loop and only
+    does a constant amount of arithmetic per rule, so its cost does not grow
+    with history. When a rule fires or resolves, each notifier is called with
+    the ``Alert``; a notifier must not block, and webhooks are posted from the
+    poller's worker pool. ``auto_off`` rules send ``Switch.Set`` off as a task
+    on the loop.
+    """
+
+    def __init__(self, rules, poller=None, notifiers=(), webhook=None):
+        self.rules = list(rules)
+        self.poller = poller
+        self.notifiers = list(notifiers)
+        self.webhook = webhook
+        self.debounces = {}
+
+    def add_sample(self, ip_address, status):
+        """Run every rule that applies to the device on a DeviceStatus sample."""
+        now = time.monotonic()
+        for rule in self.rules:
+            if (rule.devices is not None and ip_address not in rule.devices) or (rule.when_on and not status.output):
+                continue
+            value = extract_metric(status, rule.metric)
+            self.update(ip_address, rule, value, rule.check(ip_address, value, now), now)
+
+    def update(self, ip_address, rule, value, message, now):
+        """Advance a rule's debounce state on a device and notify on firing and resolving."""
+        key = (ip_address, rule.name)
+        debounce = self.debounces.get(key)
+        if debounce is None:
+            debounce = self.debounces[key] = Debounce()
+        if message is None:
+            debounce.matching_since = None
+            if debounce.firing:
+                debounce.firing = False
+                if debounce.notified:
+                    self.notify(Alert(ip_address, rule.name, rule.metric, value, f"{rule.metric} back to {value:g}", "resolved", time.time()))
+            return
+        if debounce.matching_since is None:
+            debounce.matching_since = now
+        if debounce.firing or now - debounce.matching_since < rule.for_seconds:
+            return
+        debounce.firing = True
+        if rule.auto_off:
+            self.switch_off(ip_address, rule)
+            message += ", switching off"
+        debounce.notified = now - debounce.last_notified >= rule.cooldown
+        if debounce.notified:
+            debounce.last_notified = now
+            self.notify(Alert(ip_address, rule.name, rule.metric, value, message, "firing", time.time()))
+
+    def notify(self, alert):
+        """Hand an alert to every notifier, logging failures rather than letting them reach the poll loop."""
+        logging.warning(f"Alert {alert.state}: {alert.rule} on {alert.device}: {alert.message}")
+        for notifier in self.notifiers:
+            try:
+                notifier(alert)
+            except Exception as e:
+                logging.error(f"Alert notifier failed for {alert.device}: {e}")
+        if self.webhook and self.poller is not None:
+            self.poller.loop.run_in_executor(self.poller.executor, self.post_webhook, alert)
+
+    def post_webhook(self, alert):
+        """POST an alert as JSON to the webhook; runs on a worker thread."""
+        try:
+            requests.post(self.webhook, json=asdict(alert), timeout=5).raise_for_status()
+        except requests.RequestException as e:
+            logging.error(f"Failed to post alert to {self.webhook}: {e}")
+
+    def switch_off(self, ip_address, rule):
+        """Switch a device's outlet off in the background after an auto-off rule fired."""
+        if self.poller is None:
+            return
+
+        async def send():
+            try:
+                await self.poller.call(ip_address, "Switch.Set", {"id": 0, "on": False})
+            except requests.RequestException as e:
+                logging.error(f"Failed to switch off {ip_address} after {rule.name}: {e}")
+
+        self.poller.loop.create_task(send())
@@ -0,0 +1,164 @@
+"""Local HTTP API serving the collector's latest samples to other tools.
+
+``GET /api/devices`` returns the latest sample of every device as one JSON
+object keyed by device, ``GET /api/devices/<ip>`` the latest sample of one,
+and ``GET /api/stream`` a Server-Sent Events stream: a ``snapshot`` event
+with the same object as ``/api/devices``, then a ``sample`` event for each new
+sample (``?devices=ip,ip`` limits both to some devices). Each event has an
+``id``; a client reconnecting with ``Last-Event-ID`` resumes where it left off
+as long as the events it missed are still in the backlog, and otherwise gets
+a fresh snapshot. Samples are those the collector already polls, so consumers
+never cause device RPCs.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from metrics import REGISTRY, LocalHttpServer
+
+API_SUBSCRIBERS = REGISTRY.gauge("api_stream_subscribers", "Clients connected to the live sample stream.")
+
+
+class LiveApi(LocalHttpServer):
+    """Serves the latest samples and a live stream of them on a local port, from background threads.
+
+    ``add_sample`` is a poller sample sink: it serializes each sample once and
+    appends the resulting event to a shared backlog of ``backlog`` events.
+    Every stream client runs on its own server thread, waits for the backlog
+    to grow and writes the same bytes as everyone else, so a subscriber costs
+    a socket write per batch of events and no per-client queue or encoding.
+    A client that falls more than the backlog behind is sent a new snapshot.
+    """
+    KEEPALIVE = 15.0
+    name = "api"
+    description = "the API"
+
+    def __init__(self, port, host="127.0.0.1", poller=None, backlog=4096):
+        super().__init__(port, host)
+        self.poller = poller
+        self.events = deque(maxlen=backlog)  # (id, ip_address, SSE frame)
+        self.last_id = 0
+        self.latest = {}  # ip_address -> serialized sample
+        self.snapshot_body = None
+        self.subscribers = 0
+        self.condition = threading.Condition()
+        self.stopping = False
+
+    def add_sample(self, ip_address, status):
+        """Serialize a DeviceStatus sample once and publish it; runs on the poller loop."""
+        document = status.to_document()
+        document["device"] = ip_address
+        document["timestamp"] = round(time.time(), 3)
+        if status.unixtime is not None:
+            document["unixtime"] = status.unixtime
+        if self.poller is not None:
+            document["health"] = self.poller.health[ip_address].state
+        body = json.dumps(document, separators=(",", ":")).encode()
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, ip_address, b"id: %d\nevent: sample\ndata: %s\n\n" % (self.last_id, body)))
+            self.latest[ip_address] = body
+            self.snapshot_body = None
+            self.condition.notify_all()
+
+    def snapshot(self, devices=None):
+        """Return the latest samples of every device (or of ``devices``) as a JSON object; call with the condition held."""
+        if devices is None and self.snapshot_body is not None:
+            return self.snapshot_body
+        body = b"{" + b",".join(json.dumps(ip_address).encode() + b":" + sample for ip_address, sample in self.latest.items()
+                                if devices is None or ip_address in devices) + b"}"
+        if devices is None:
+            self.snapshot_body = body
+        return body
+
+    def events_after(self, event_id):
+        """Return the events after ``event_id``, or None if some of them already left the backlog; call with the condition held."""
+        if not self.events or event_id >= self.last_id:
+            return []
+        first_id = self.events[0][0]
+        if event_id + 1 < first_id:
+            return None
+        return list(itertools.islice(self.events, event_id + 1 - first_id, None))
+
+    def stream(self, write, devices=None, last_event_id=None):
+        """Write events to one client with ``write(bytes)`` until it disconnects or the server stops."""
+        with self.condition:
+            self.subscribers += 1
+            API_SUBSCRIBERS.labels().set(self.subscribers)
+            event_id = last_event_id if last_event_id is not None and last_event_id <= self.last_id else -1
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.last_id > event_id or self.stopping, timeout=self.KEEPALIVE)
+                    if self.stopping:
+                        return
+                    events = self.events_after(event_id) if event_id >= 0 else None
+                    if events is None:
+                        event_id = self.last_id
+                        data = b"id: %d\nevent: snapshot\ndata: %s\n\n" % (event_id, self.snapshot(devices))
+                    elif events:
+                        event_id = events[-1][0]
+                        data = b"".join(frame for _, ip_address, frame in events if devices is None or ip_address in devices)
+                    else:
+                        data = b": keepalive\n\n"
+                if data:
+                    write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+                API_SUBSCRIBERS.labels().set(self.subscribers)
+
+    def handle_get(self, request):
+        """Answer snapshot and stream requests from the shared serialized samples."""
+        url = urlsplit(request.path)
+        devices = parse_qs(url.query).get("devices")
+        devices = set(",".join(devices).split(",")) if devices else None
+        if url.path == "/api/devices":
+            with self.condition:
+                body = self.snapshot(devices)
+            self.send_json(request, body)
+        elif url.path.startswith("/api/devices/"):
+            with self.condition:
+                body = self.latest.get(unquote(url.path[len("/api/devices/"):]))
+            if body is None:
+                request.send_error(404, "No samples from this device")
+                return
+            self.send_json(request, body)
+        elif url.path == "/api/stream":
+            try:
+                last_event_id = int(request.headers.get("Last-Event-ID", ""))
+            except ValueError:
+                last_event_id = None
+            request.send_response(200)
+            request.send_header("Content-Type", "text/event-stream")
+            request.send_header("Cache-Control", "no-cache")
+            request.end_headers()
+            request.wfile.flush()
+
+            def write(data):
+                request.wfile.write(data)
+                request.wfile.flush()
+
+            self.stream(write, devices, last_event_id)
+        else:
+            request.send_error(404)
+
+    @staticmethod
+    def send_json(request, body):
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def stop(self):
+        """Close the streams, stop serving and release the port."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        super().stop()
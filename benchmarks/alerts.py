@@ -0,0 +1,50 @@
+"""Alert engine benchmark: cost of evaluating the alert rules on every sample.
+
+Feeds synthetic samples for N devices through ``AlertEngine.add_sample``
+with the built-in rules (thresholds, z-score and stuck value), the way the poller's
+sample sink calls it, and reports the time per sample and the share of one
+core the engine would use with every device polled at 1 Hz:
+
+    python benchmarks/alerts.py --devices 100 500 1000 --rounds 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import DEFAULT_RULES, AlertEngine, build_rule  # noqa: E402
+from status import DeviceStatus  # noqa: E402
+
+
+def measure(count, rounds, seed=1):
+    """Return the mean seconds ``add_sample`` takes over ``rounds`` samples of ``count`` devices."""
+    rng = random.Random(seed)
+    engine = AlertEngine([build_rule(spec) for spec in DEFAULT_RULES])
+    devices = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(count)]
+    base = {ip_address: rng.uniform(5, 1500) for ip_address in devices}
+    samples = [[DeviceStatus(output=True, apower=base[ip_address] * rng.uniform(0.95, 1.05), voltage=round(rng.gauss(120, 0.5), 1),
+                             temperature_f=rng.uniform(80, 120)) for ip_address in devices] for _ in range(rounds)]
+    started = time.perf_counter()
+    for round_samples in samples:
+        for ip_address, status in zip(devices, round_samples):
+            engine.add_sample(ip_address, status)
+    return (time.perf_counter() - started) / (count * rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--rounds", type=int, default=200, help="samples per device")
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'us/sample':>10} {'core % at 1 Hz':>15}")
+    for count in args.devices:
+        per_sample = measure(count, args.rounds)
+        print(f"{count:>8} {per_sample * 1e6:>10.1f} {per_sample * count * 100:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""API fan-out benchmark: cost of serving the live sample stream to more subscribers.
+
+Publishes synthetic samples for ``--devices`` devices at ``--rate`` samples
+per second through ``LiveApi.add_sample``, the way the poller's sample sink
+calls it, while a separate process holds N stream connections open and counts
+the events it receives. Reports the publishing cost per sample and the
+serving process's CPU for each subscriber count:
+
+    python benchmarks/api.py --subscribers 0 1 10 50 --devices 100 --rate 500
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import LiveApi  # noqa: E402
+from status import DeviceStatus  # noqa: E402
+
+
+def subscribe(port, counts, index, stopping):
+    """Read one stream until ``stopping`` is set, counting its events."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("GET", "/api/stream")
+    response = connection.getresponse()
+    while not stopping.is_set():
+        line = response.fp.readline()
+        if not line:
+            break
+        if line.startswith(b"event:"):
+            counts[index] += 1
+
+
+def run_subscribers(port, count, duration):
+    """Child process: hold ``count`` streams open for ``duration`` seconds and print the events received."""
+    counts = [0] * count
+    stopping = threading.Event()
+    for index in range(count):
+        threading.Thread(target=subscribe, args=(port, counts, index, stopping), daemon=True).start()
+    time.sleep(duration)
+    stopping.set()
+    print(sum(counts))
+
+
+def measure(subscribers, devices, rate, duration, port):
+    """Publish at ``rate`` with ``subscribers`` clients; return (us per add_sample, CPU %, events delivered per second)."""
+    api = LiveApi(port)
+    api.start()
+    child = None
+    if subscribers:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", "--port", str(port),
+                                  "--subscribers", str(subscribers), "--duration", str(duration + 1)],
+                                 stdout=subprocess.PIPE, text=True)
+        time.sleep(1)  # Let the streams connect
+    rng = random.Random(1)
+    addresses = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(devices)]
+    samples = [DeviceStatus(output=True, apower=rng.uniform(5, 1500), voltage=120.0, current=1.0, aenergy_total=rng.uniform(0, 1e5))
+               for _ in range(1000)]
+    published, publish_seconds = 0, 0.0
+    cpu_started, started = time.process_time(), time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < duration:
+        due = int(elapsed * rate)
+        while published < due:
+            before = time.perf_counter()
+            api.add_sample(addresses[published % devices], samples[published % len(samples)])
+            publish_seconds += time.perf_counter() - before
+            published += 1
+        time.sleep(0.001)
+    cpu = time.process_time() - cpu_started
+    delivered = int(child.communicate()[0].strip() or 0) if child else 0
+    api.stop()
+    return publish_seconds / published * 1e6, 100 * cpu / duration, delivered / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[0, 1, 10, 50])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=500, help="samples published per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_subscribers(args.port, args.subscribers[0], args.duration)
+        return
+
+    print(f"{'subscribers':>11} {'us/sample':>10} {'cpu %':>7} {'events/s':>10}")
+    for count in args.subscribers:
+        per_sample, cpu, delivered = measure(count, args.devices, args.rate, args.duration, args.port)
+        print(f"{count:>11} {per_sample:>10.1f} {cpu:>7.1f} {delivered:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
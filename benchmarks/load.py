@@ -0,0 +1,144 @@
+"""Load benchmark: poll throughput, sample latency, CPU and memory as the device count grows.
+
+For each device count, a simulated fleet (``simulator.py``) runs in its own
+process and a headless collector polls it with Shelly.GetStatus from a fresh
+interpreter, without storage. Every device is polled at the fixed interval
+(adaptive slow-down is disabled), so the target rate is devices / interval:
+
+    python benchmarks/load.py --devices 10 50 100 200 500 --interval 1 --latency 0.02 --jitter 0.01
+
+Latency is measured from the device's ``sys.unixtime`` in each response to
+the sample reaching the collector's sinks, so it includes simulated network
+latency, parsing and scheduling delay. CPU and RSS are the collector
+process's own; the simulator's cost is not counted.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resident_memory_mb():
+    """Return the current resident set size in MB (the peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    """Return the value below which ``fraction`` of the sorted ``values`` fall."""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(addresses, interval, warmup, duration):
+    """Poll ``addresses`` with a headless collector and return throughput, latency, CPU and RSS."""
+    sys.path.insert(0, ROOT)
+    from collector import Collector
+    from rpc_client import ShellyRpcClient
+
+    collector = Collector(addresses, ShellyRpcClient(), interval=interval, status_method="Shelly.GetStatus", keep_results=False)
+    for health in collector.poller.health.values():
+        health.steady_interval = health.off_interval = interval
+    latencies = []
+    errors = {}
+
+    def timed_sink(ip_address, status):
+        if status.unixtime is not None:
+            latencies.append(time.time() - status.unixtime)
+
+    collector.poller.sample_sinks.append(timed_sink)
+    collector.start()
+    time.sleep(warmup)
+
+    latencies.clear()
+    cpu_started, started = time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    samples = sorted(latencies)
+    rss = resident_memory_mb()
+    for ip_address, health in collector.poller.health.items():
+        if health.failures:
+            errors[ip_address] = health.failures
+    collector.stop()
+
+    return {
+        "throughput": len(samples) / elapsed,
+        "target": len(addresses) / interval,
+        "p50": percentile(samples, 0.50) if samples else None,
+        "p95": percentile(samples, 0.95) if samples else None,
+        "p99": percentile(samples, 0.99) if samples else None,
+        "mean": statistics.fmean(samples) if samples else None,
+        "cpu": 100 * cpu / elapsed,
+        "rss": rss,
+        "failing": len(errors),
+    }
+
+
+def run(count, args):
+    """Start a simulated fleet of ``count`` devices and measure a collector against it."""
+    with tempfile.TemporaryDirectory() as workdir:
+        ready_file = os.path.join(workdir, "addresses")
+        simulator = subprocess.Popen([sys.executable, os.path.join(ROOT, "simulator.py"), "--devices", str(count), "--base-port", "0",
+                                      "--latency", str(args.latency), "--jitter", str(args.jitter), "--loss", str(args.loss),
+                                      "--seed", "1", "--ready-file", ready_file], stdout=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 60
+            while not os.path.exists(ready_file) and simulator.poll() is None and time.monotonic() < deadline:
+                time.sleep(0.1)
+            if not os.path.exists(ready_file):
+                raise RuntimeError("simulator did not start")
+            with open(ready_file, encoding="utf-8") as file:
+                addresses = file.read().split()
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--interval", str(args.interval),
+                                    "--warmup", str(args.warmup), "--duration", str(args.duration)],
+                                   input="\n".join(addresses), cwd=workdir, capture_output=True, text=True)
+        finally:
+            simulator.terminate()
+            simulator.wait()
+    if child.returncode != 0:
+        raise RuntimeError(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else child.returncode)
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 50, 100, 200, 500])
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval per device in seconds")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="simulated latency jitter in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of simulated requests dropped")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        addresses = sys.stdin.read().split()
+        print(json.dumps(measure(addresses, args.interval, args.warmup, args.duration)))
+        return
+
+    print(f"{'devices':>8} {'target/s':>9} {'samples/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cpu %':>7} {'rss MB':>7} {'failing':>7}")
+    for count in args.devices:
+        try:
+            result = run(count, args)
+        except RuntimeError as e:
+            print(f"{count:>8} failed: {e}")
+            continue
+        latencies = [f"{result[name] * 1000:>8.1f}" if result[name] is not None else f"{'-':>8}" for name in ("p50", "p95", "p99")]
+        print(f"{count:>8} {result['target']:>9.1f} {result['throughput']:>9.1f} {' '.join(latencies)} "
+              f"{result['cpu']:>7.1f} {result['rss']:>7.1f} {result['failing']:>7}")
+
+
+if __name__ == "__main__":
+    main()
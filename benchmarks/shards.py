@@ -0,0 +1,111 @@
+"""Sharding benchmark: collector throughput as polling is spread over more worker processes.
+
+Runs a simulated fleet split over several simulator processes, then polls
+it with an in-process collector and with sharded collectors of increasing
+worker counts, each in a fresh interpreter. The poll interval is set low
+enough that demand outstrips what one process can poll, so the samples
+reaching the coordinator per second show how throughput scales with cores:
+
+    python benchmarks/shards.py --devices 400 --interval 0.25 --shards 0 1 2 4
+
+A shard count of 0 is the single-process ``Collector``. The simulators need
+cores of their own, so on a machine with few cores they become the limit.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(addresses, shards, interval, warmup, duration):
+    """Poll ``addresses`` with ``shards`` workers (0: in-process) and return samples per second and coordinator CPU."""
+    sys.path.insert(0, ROOT)
+    from collector import Collector
+    from rpc_client import ShellyRpcClient
+    from shards import ShardedCollector
+
+    options = {"interval": interval, "status_method": "Shelly.GetStatus", "keep_results": False}
+    if shards:
+        collector = ShardedCollector(addresses, ShellyRpcClient(), shards=shards, steady_interval=interval, off_interval=interval, **options)
+    else:
+        collector = Collector(addresses, ShellyRpcClient(), **options)
+        for health in collector.poller.health.values():
+            health.steady_interval = health.off_interval = interval
+    received = [0]
+
+    def count_sample(ip_address, status):
+        received[0] += 1
+
+    collector.poller.sample_sinks.append(count_sample)
+    collector.start()
+    time.sleep(warmup)
+    before, cpu_started, started = received[0], time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - started
+    result = {"throughput": (received[0] - before) / elapsed, "cpu": 100 * (time.process_time() - cpu_started) / elapsed}
+    collector.stop()
+    return result
+
+
+def start_simulators(count, processes, workdir):
+    """Start ``count`` simulated devices over ``processes`` simulator processes and return them with all addresses."""
+    simulators, addresses = [], []
+    for i in range(processes):
+        devices = count // processes + (1 if i < count % processes else 0)
+        ready_file = os.path.join(workdir, f"addresses-{i}")
+        simulators.append((subprocess.Popen([sys.executable, os.path.join(ROOT, "simulator.py"), "--devices", str(devices),
+                                             "--base-port", "0", "--seed", str(i), "--ready-file", ready_file],
+                                            stdout=subprocess.DEVNULL), ready_file))
+    for simulator, ready_file in simulators:
+        while not os.path.exists(ready_file) and simulator.poll() is None:
+            time.sleep(0.1)
+        with open(ready_file, encoding="utf-8") as file:
+            addresses += file.read().split()
+    return [simulator for simulator, _ in simulators], addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=400)
+    parser.add_argument("--interval", type=float, default=0.25, help="poll interval per device in seconds")
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--simulators", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="simulator processes")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        addresses = sys.stdin.read().split()
+        print(json.dumps(measure(addresses, args.child, args.interval, args.warmup, args.duration)))
+        return
+
+    print(f"{args.devices} devices every {args.interval}s: {args.devices / args.interval:.0f} samples/s wanted, {os.cpu_count()} cores")
+    print(f"{'shards':>8} {'samples/s':>10} {'speedup':>8} {'coord cpu %':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        simulators, addresses = start_simulators(args.devices, args.simulators, workdir)
+        try:
+            baseline = None
+            for shards in args.shards:
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(shards), "--interval", str(args.interval),
+                                        "--warmup", str(args.warmup), "--duration", str(args.duration)],
+                                       input="\n".join(addresses), cwd=workdir, capture_output=True, text=True)
+                if child.returncode != 0:
+                    print(f"{shards:>8} failed: {child.stderr.strip().splitlines()[-1] if child.stderr.strip() else child.returncode}")
+                    continue
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                baseline = baseline or result["throughput"]
+                print(f"{shards if shards else 'local':>8} {result['throughput']:>10.0f} {result['throughput'] / baseline:>7.2f}x {result['cpu']:>12.1f}")
+        finally:
+            for simulator in simulators:
+                simulator.terminate()
+                simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Startup benchmark: time to first frame and to first data with N simulated devices.
+
+Each device count runs in a fresh interpreter so module imports are part of
+the measurement (interpreter start-up itself is not). The clock starts just
+before ``import monitor``:
+
+    python benchmarks/startup.py --devices 1 10 50 100
+
+The Tk window needs a display; on a headless machine run under ``xvfb-run``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(count, timeout):
+    """Run the monitor against the ``count`` simulated devices in the local inventory and return its startup timings in seconds."""
+    os.environ.update(MONGO_URI="", DISCOVERY="0", PUSH_NOTIFICATIONS="0",
+                      INVENTORY_FILE=os.path.join(os.getcwd(), "inventory.json"))
+    sys.path.insert(0, ROOT)
+
+    started = time.perf_counter()
+    import monitor
+    imported = time.perf_counter() - started
+    app = monitor.MonitoringApp()
+    marks = {"import": imported, "constructed": time.perf_counter() - started}
+    reported = set()
+
+    def first_frame(event):
+        marks.setdefault("first_frame", time.perf_counter() - started)
+
+    process_device_data = app.process_device_data
+
+    def timed_process_device_data(ip_address, status):
+        marks.setdefault("first_data", time.perf_counter() - started)
+        reported.add(ip_address)
+        if len(reported) == count:
+            marks.setdefault("all_data", time.perf_counter() - started)
+        process_device_data(ip_address, status)
+
+    def finish_when_done():
+        if "all_data" in marks or time.perf_counter() - started > timeout:
+            app.on_close()
+        else:
+            app.after(10, finish_when_done)
+
+    app.bind("<Expose>", first_frame, add="+")
+    app.process_device_data = timed_process_device_data
+    app.after(10, finish_when_done)
+    app.mainloop()
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for every device to report")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child, args.timeout)))
+        return
+
+    print(f"{'devices':>8} {'import':>8} {'window':>8} {'frame':>8} {'1st data':>8} {'all data':>8}  (ms)")
+    for count in args.devices:
+        # Run from an empty directory so a local .env does not add devices; the simulator fills its inventory
+        with tempfile.TemporaryDirectory() as workdir:
+            ready_file = os.path.join(workdir, "addresses")
+            simulator = subprocess.Popen([sys.executable, os.path.join(ROOT, "simulator.py"), "--devices", str(count), "--base-port", "0",
+                                          "--seed", "1", "--inventory", os.path.join(workdir, "inventory.json"), "--ready-file", ready_file],
+                                         stdout=subprocess.DEVNULL)
+            try:
+                while not os.path.exists(ready_file) and simulator.poll() is None:
+                    time.sleep(0.1)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(count), "--timeout", str(args.timeout)],
+                                        cwd=workdir, capture_output=True, text=True)
+            finally:
+                simulator.terminate()
+                simulator.wait()
+        if output.returncode != 0:
+            print(f"{count:>8} failed: {output.stderr.strip().splitlines()[-1] if output.stderr.strip() else output.returncode}")
+            continue
+        marks = json.loads(output.stdout.strip().splitlines()[-1])
+        cells = [marks.get(name) for name in ("import", "constructed", "first_frame", "first_data", "all_data")]
+        print(f"{count:>8} " + " ".join(f"{cell * 1000:>8.0f}" if cell is not None else f"{'-':>8}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Storage benchmark: ingest and range-scan speed of the local store against MongoDB.
+
+Writes ``--hours`` of 1 Hz samples for each device through the batch write
+path of ``LocalSampleWriter`` and of ``SampleWriter``, then times history
+queries over the whole range at several bucket sizes, as the History chart
+issues them:
+
+    python benchmarks/store.py --devices 4 --hours 24 --mongo-uri mongodb://localhost:27017
+
+Without ``--mongo-uri`` the MongoDB path runs against mongomock, which shows
+the cost of the query interface but not of a real server; pass ``--mongo-uri``
+(a scratch server: the benchmark drops the databases it writes) for a fair
+comparison. Raw samples are queried in both cases, as no rollups are built.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import HistoryQuery  # noqa: E402
+from localstore import LocalHistoryQuery, LocalSampleWriter, LocalStore  # noqa: E402
+from status import DeviceStatus  # noqa: E402
+from storage import SampleWriter  # noqa: E402
+from timeseries import format_ip_address  # noqa: E402
+
+BATCH = 500
+BUCKETS = (60, 900, 3600)
+
+
+def make_samples(devices, hours, seed=1):
+    """Return ``(ip_address, status, timestamp)`` samples at 1 Hz, interleaved across devices as they arrive."""
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    totals = {ip_address: rng.uniform(0, 1e5) for ip_address in devices}
+    samples = []
+    for second in range(int(hours * 3600)):
+        timestamp = start + timedelta(seconds=second)
+        for ip_address in devices:
+            power = rng.uniform(0, 1500)
+            totals[ip_address] += power / 3600
+            samples.append((ip_address, DeviceStatus(output=True, apower=power, voltage=round(rng.gauss(120, 0.5), 1),
+                                                     current=power / 120, aenergy_total=totals[ip_address],
+                                                     temperature_f=rng.uniform(80, 120)), timestamp))
+    return start, samples
+
+
+def ingest(flush, batches):
+    """Return the samples per second ``flush`` writes across ``batches``."""
+    started = time.perf_counter()
+    for batch in batches:
+        flush(batch)
+    return sum(map(len, batches)) / (time.perf_counter() - started)
+
+
+def scan(history, devices, start, end, bucket_seconds):
+    """Return the mean milliseconds a query of the whole range takes per device."""
+    started = time.perf_counter()
+    for ip_address in devices:
+        history.query(ip_address, "apower", start, end, bucket_seconds)
+    return (time.perf_counter() - started) * 1000 / len(devices)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--hours", type=float, default=6.0, help="hours of 1 Hz samples per device")
+    parser.add_argument("--mongo-uri", help="MongoDB server to compare against (default: mongomock)")
+    args = parser.parse_args()
+
+    devices = [f"10.0.0.{i + 1}" for i in range(args.devices)]
+    start, samples = make_samples(devices, args.hours)
+    end = start + timedelta(hours=args.hours)
+    print(f"{len(samples)} samples, {args.devices} devices, {args.hours:g} h each")
+    print(f"{'store':<10} {'ingest/s':>10} {'bytes/sample':>13}" + "".join(f" {f'scan {s}s ms':>13}" for s in BUCKETS))
+
+    workdir = tempfile.mkdtemp()
+    try:
+        store = LocalStore(workdir)
+        writer = LocalSampleWriter(store)
+        rate = ingest(writer.flush, [samples[i:i + BATCH] for i in range(0, len(samples), BATCH)])
+        writer.stop()
+        history = LocalHistoryQuery(store)
+        scans = [scan(history, devices, start, end, seconds) for seconds in BUCKETS]
+        print(f"{'local':<10} {rate:>10.0f} {directory_size(workdir) / len(samples):>13.1f}" + "".join(f" {ms:>13.2f}" for ms in scans))
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client, name = MongoClient(args.mongo_uri), "mongodb"
+    else:
+        import mongomock
+        client, name = mongomock.MongoClient(), "mongomock"
+    try:
+        for ip_address in devices:
+            client.drop_database(format_ip_address(ip_address))
+        writer = SampleWriter(client)
+        rate = ingest(writer.flush, [samples[i:i + BATCH] for i in range(0, len(samples), BATCH)])
+        size = None
+        if args.mongo_uri:
+            size = sum(client[format_ip_address(ip_address)].command("dbstats")["storageSize"] for ip_address in devices)
+        history = HistoryQuery(client)
+        scans = [scan(history, devices, start, end, seconds) for seconds in BUCKETS]
+        size_text = f"{size / len(samples):>13.1f}" if size is not None else f"{'-':>13}"
+        print(f"{name:<10} {rate:>10.0f} {size_text}" + "".join(f" {ms:>13.2f}" for ms in scans))
+    finally:
+        for ip_address in devices:
+            client.drop_database(format_ip_address(ip_address))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""GUI-free collection core: polls devices, parses samples and stores them.
+
+Run ``python collector.py`` to collect into MongoDB as a long-lived service
+without a display. ``MonitoringApp`` uses the same ``Collector`` in-process.
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from alerts import AlertEngine, load_rules
+from discovery import Discovery, Inventory, read_ip_addresses
+from energy import EnergyMeter, Tariff
+from fleet import run_fleet_operation
+from metrics import MetricsServer
+from poller import DevicePoller
+from ring_buffer import METRICS, RingBuffer, extract_metric
+from rpc_client import ShellyRpcClient
+
+
+def extract_metrics(status):
+    """Return the numeric metrics of a DeviceStatus sample by metric name."""
+    return {name: extract_metric(status, name) for name in METRICS}
+
+
+class Collector:
+    """Polls a set of devices and keeps their samples in memory and in MongoDB or a local store.
+
+    Every sample lands in the device's ring buffer and energy rollups and, when
+    a Mongo client is given, in the buffered writer, with a compactor keeping
+    the history rollups up to date. With ``store_dir`` instead, samples are
+    appended to the embedded store in that directory (see ``localstore``). With ``keep_results`` the poller also queues
+    results for a GUI to drain; a headless collector turns that off so the
+    queue does not grow without a reader.
+    """
+
+    def __init__(self, ip_addresses, rpc_client, mongo_client=None, interval=1.0, status_method="Switch.GetStatus", push=False,
+                 reconcile_interval=60.0, tariff=None, raw_retention_days=None, discovery=None, keep_results=True, metrics_port=None,
+                 alert_rules=None, alert_webhook=None, store_dir=None, api_port=None, api_host="127.0.0.1"):
+        self.ip_addresses = list(ip_addresses)
+        self.rpc_client = rpc_client
+        self.mongo_client = mongo_client
+        self.local_store = None
+        self.poller = DevicePoller(self.ip_addresses, rpc_client, method=status_method, interval=interval, keep_results=keep_results)
+        self.ring_buffers = {ip_address: RingBuffer() for ip_address in self.ip_addresses}
+        self.poller.sample_sinks.append(self.record_sample)
+        # History queries get their own threads so long scans cannot hold up device polling
+        self.background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+        self.sample_writer = None
+        self.compactor = None
+        energy_store = None
+        if mongo_client is not None:
+            # Storage modules pull in pymongo, so they are only imported when storage is enabled
+            from rollups import Compactor
+            from storage import EnergyStore, SampleWriter
+            energy_store = EnergyStore(mongo_client)
+            self.sample_writer = SampleWriter(mongo_client)
+            self.poller.sample_sinks.append(self.sample_writer.add)
+            self.compactor = Compactor(mongo_client, self.ip_addresses, raw_retention_days=raw_retention_days, writer=self.sample_writer)
+        elif store_dir:
+            from localstore import LocalSampleWriter, LocalStore
+            self.local_store = LocalStore(store_dir)
+            self.sample_writer = LocalSampleWriter(self.local_store, retention_days=raw_retention_days)
+            self.poller.sample_sinks.append(self.sample_writer.add)
+        self.energy = EnergyMeter(energy_store, tariff)
+        self.poller.sample_sinks.append(self.energy.add_sample)
+        self.push_listener = None
+        if push:
+            from push import PushListener
+            self.push_listener = PushListener(self.poller, reconcile_interval=reconcile_interval)
+        self.alerts = None
+        if alert_rules:
+            # Alerts reach the GUI through the results queue, alongside the samples that raised them
+            self.alerts = AlertEngine(alert_rules, self.poller, notifiers=[lambda alert: self.poller.post(("alert", alert.device, alert))],
+                                      webhook=alert_webhook)
+            self.poller.sample_sinks.append(self.alerts.add_sample)
+        self.metrics_server = MetricsServer(metrics_port) if metrics_port else None
+        self.api = None
+        if api_port:
+            from api import LiveApi
+            self.api = LiveApi(api_port, api_host, self.poller)
+            self.poller.sample_sinks.append(self.api.add_sample)
+        self.discovery = discovery
+        if discovery is not None:
+            for ip_address, current_address in discovery.inventory.addresses().items():
+                rpc_client.set_address(ip_address, current_address)
+            discovery.on_moved = self.device_moved
+
+    @classmethod
+    def from_env(cls, ip_addresses, inventory=None, **kwargs):
+        """Create a collector configured from the environment (MONGO_URI, PUSH_NOTIFICATIONS, ...).
+
+        Setting MONGO_URI to an empty string disables storage, and LOCAL_STORE_DIR stores samples
+        in files in that directory instead of MongoDB. STATUS_METHOD=Shelly.GetStatus
+        polls the full device status (switch, sys, wifi, cloud) in a single call.
+        ENERGY_TARIFF and ENERGY_TARIFF_WEEKEND set time-of-use prices (see ``Tariff``).
+        RAW_RETENTION_DAYS drops raw samples older than that once they are rolled up.
+        With an ``inventory``, devices are discovered in the background unless DISCOVERY=0.
+        METRICS_PORT serves Prometheus metrics on that localhost port.
+        ALERT_RULES names the JSON file of alert rules (default alerts.json, built-in rules if it
+        does not exist, disabled if empty) and ALERT_WEBHOOK a URL that alerts are posted to.
+        API_PORT serves the latest samples and a live stream of them on that port (see ``api``),
+        on localhost unless API_HOST names another interface.
+        COLLECTOR_SHARDS above 1 polls the devices from that many worker processes (see ``ShardedCollector``).
+        """
+        alert_rules = os.getenv("ALERT_RULES", "alerts.json")
+        shards = int(os.getenv("COLLECTOR_SHARDS", 1))
+        if shards > 1:
+            from shards import ShardedCollector
+            cls, kwargs = ShardedCollector, dict(kwargs, shards=shards)
+        mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+        store_dir = os.getenv("LOCAL_STORE_DIR") or None
+        mongo_client = None
+        if mongo_uri and not store_dir:
+            from pymongo import MongoClient
+            mongo_client = MongoClient(mongo_uri)
+        return cls(ip_addresses, ShellyRpcClient.from_env(),
+                   mongo_client=mongo_client,
+                   interval=float(os.getenv("POLL_INTERVAL", 1.0)),
+                   status_method=os.getenv("STATUS_METHOD", "Switch.GetStatus"),
+                   push=os.getenv("PUSH_NOTIFICATIONS", "0") == "1",
+                   reconcile_interval=float(os.getenv("RECONCILE_INTERVAL", 60)),
+                   tariff=Tariff.from_env(),
+                   raw_retention_days=float(os.getenv("RAW_RETENTION_DAYS", 0)) or None,
+                   discovery=Discovery.from_env(inventory) if inventory is not None and os.getenv("DISCOVERY", "1") == "1" else None,
+                   metrics_port=int(os.getenv("METRICS_PORT", 0)) or None,
+                   alert_rules=load_rules(alert_rules) if alert_rules else None,
+                   alert_webhook=os.getenv("ALERT_WEBHOOK") or None,
+                   store_dir=store_dir,
+                   api_port=int(os.getenv("API_PORT", 0)) or None,
+                   api_host=os.getenv("API_HOST", "127.0.0.1"),
+                   **kwargs)
+
+    @property
+    def results(self):
+        """The queue of ``(kind, ip_address, payload)`` results for a GUI to drain."""
+        return self.poller.results
+
+    def start(self):
+        """Start storage and compaction, energy accounting, polling and (if enabled) push, discovery, the metrics endpoint and the API."""
+        if self.sample_writer:
+            self.sample_writer.start()
+        if self.compactor:
+            self.compactor.start()
+        self.energy.start(self.ip_addresses)
+        self.poller.start()
+        if self.push_listener:
+            self.push_listener.start()
+        if self.discovery:
+            self.discovery.start()
+        if self.metrics_server:
+            self.metrics_server.start()
+        if self.api:
+            self.api.start()
+
+    def stop(self):
+        """Stop polling, flush buffered samples and close device connections."""
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.api:
+            self.api.stop()
+        if self.discovery:
+            self.discovery.stop()
+        self.poller.stop()
+        if self.sample_writer:
+            self.sample_writer.stop()
+        if self.compactor:
+            self.compactor.stop()
+        self.energy.stop()
+        self.background.shutdown(wait=False, cancel_futures=True)
+        self.rpc_client.close()
+
+    def record_sample(self, ip_address, status):
+        """Keep a sample in the device's ring buffer; runs on the poller loop."""
+        self.ring_buffers[ip_address].append(status)
+
+    def history_query(self):
+        """Return a history query over the collector's storage, or None when storage is disabled."""
+        if self.local_store is not None:
+            from localstore import LocalHistoryQuery
+            return LocalHistoryQuery(self.local_store)
+        if self.mongo_client is not None:
+            from history import HistoryQuery
+            return HistoryQuery(self.mongo_client)
+        return None
+
+    def device_moved(self, ip_address, current_address):
+        """Follow a device to its new IP and poll it right away; runs on the discovery thread."""
+        if ip_address in self.poller.health:
+            self.rpc_client.set_address(ip_address, current_address)
+            self.poller.loop.call_soon_threadsafe(self.poller.wake, ip_address)
+
+    def call(self, ip_address, method, params=None):
+        """Run an RPC call with retries on the poller loop and return a concurrent future."""
+        return self.poller.submit(self.poller.call(ip_address, method, params))
+
+    def run_fleet_operation(self, ip_addresses, method, params=None, on_progress=None):
+        """Run an RPC method on many devices with bounded concurrency and return a concurrent future.
+
+        The limit comes from FLEET_CONCURRENCY (default 8); ``on_progress`` runs on the poller loop.
+        """
+        limit = int(os.getenv("FLEET_CONCURRENCY", 8))
+        return self.poller.submit(run_fleet_operation(self.poller, ip_addresses, method, params, limit, on_progress))
+
+    def run_in_background(self, func):
+        """Run a blocking function, such as a history query, off the device poll pool and return its future."""
+        return self.background.submit(func)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect Shelly plug samples without the GUI.")
+    parser.add_argument("--env-file", default=".env", help="file with IP_ADDRESS_n, MONGO_URI and other settings")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv(args.env_file)
+    inventory = Inventory.from_env()
+    ip_addresses = read_ip_addresses(inventory)
+    if not ip_addresses:
+        logging.error("No IP address found in .env file or device inventory.")
+        return 1
+
+    collector = Collector.from_env(ip_addresses, inventory=inventory, keep_results=False)
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    collector.start()
+    logging.info(f"Collecting from {len(ip_addresses)} devices")
+    while not stopping.wait(1):
+        pass
+    logging.info("Stopping collector")
+    collector.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
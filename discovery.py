@@ -0,0 +1,272 @@
+import ipaddress
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+SHELLY_SERVICE = "_shelly._tcp.local."
+
+
+def device_id_of(info):
+    """Return the stable id in a ``/shelly`` identification."""
+    return info.get("id") or info["mac"]
+
+
+def probe(ip_address, timeout=1.0):
+    """Return the ``/shelly`` identification of the device at an address, or None if it is not a Gen2+ Shelly switch.
+
+    Gen1 devices also answer ``/shelly`` but have no RPC interface to poll, and
+    Gen2 dimmers, sensors and meters have no ``switch:0`` to read, so a device
+    is only accepted once it answers the ``Switch.GetStatus`` call it will be
+    polled with.
+    """
+    try:
+        response = requests.get(f"http://{ip_address}/shelly", timeout=timeout)
+        info = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    if not isinstance(info, dict) or not info.get("id") or not isinstance(info.get("gen"), int) or info["gen"] < 2:
+        return None
+    try:
+        response = requests.get(f"http://{ip_address}/rpc/Switch.GetStatus", params={"id": 0}, timeout=timeout)
+        response.raise_for_status()
+        switch = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    if not isinstance(switch, dict) or "output" not in switch:
+        return None
+    return info
+
+
+def read_ip_addresses(inventory=None):
+    """Return the devices to monitor: IP_ADDRESS_1..IP_ADDRESS_99 from the environment plus the inventory.
+
+    Each device is listed once, under its inventory key when it has one, so an
+    address in the environment that DHCP has since given to a known device
+    still refers to that device.
+    """
+    addresses = [os.getenv(f'IP_ADDRESS_{i}') for i in range(1, 100) if os.getenv(f'IP_ADDRESS_{i}')]
+    if inventory is not None:
+        addresses = [inventory.key_for(ip_address) or ip_address for ip_address in addresses] + inventory.keys()
+    return list(dict.fromkeys(addresses))
+
+
+def local_subnet():
+    """Return the /24 network of the interface that routes to the internet, or None."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("192.0.2.1", 80))  # No packet is sent for a UDP connect
+            address = sock.getsockname()[0]
+    except OSError:
+        return None
+    return ipaddress.ip_network(f"{address}/24", strict=False)
+
+
+class Inventory:
+    """Persistent cache of discovered devices, keyed by device id.
+
+    Each record holds the device's model, firmware, MAC, last IP and last-seen
+    time, plus ``key``: the address the device was first monitored under,
+    which names its tab and database and stays fixed when DHCP hands it a new
+    IP. A device first seen at an address that is already another device's key
+    is keyed by its device id instead. The cache is a JSON file rewritten atomically on every change.
+    """
+
+    def __init__(self, path="inventory.json"):
+        self.path = path
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def from_env(cls):
+        """Open the inventory file named by INVENTORY_FILE (default inventory.json)."""
+        return cls(os.getenv("INVENTORY_FILE", "inventory.json"))
+
+    def load(self):
+        """Read the cache file, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                self.devices = json.load(file)
+        except FileNotFoundError:
+            self.devices = {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable device inventory {self.path}: {e}")
+            self.devices = {}
+
+    def save(self):
+        """Write the cache file atomically; the caller holds the lock."""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.devices, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def record(self, ip_address, info):
+        """Record a sighting of a device and return its previous IP if it moved, else None."""
+        device_id = device_id_of(info)
+        with self.lock:
+            device = self.devices.get(device_id)
+            moved = device is not None and device["ip"] != ip_address
+            previous_ip = device["ip"] if moved else None
+            if device is not None:
+                key = device["key"]
+            elif any(other["key"] == ip_address for other in self.devices.values()):
+                key = device_id  # The address still names a device that has since moved
+            else:
+                key = ip_address
+            updated = {
+                "id": device_id,
+                "key": key,
+                "name": info.get("name"),
+                "model": info.get("model") or info.get("type"),
+                "firmware": info.get("ver") or info.get("fw"),
+                "mac": info.get("mac"),
+                "ip": ip_address,
+                "last_seen": time.time(),
+            }
+            self.devices[device_id] = updated
+            # Skip the write when only the last-seen time changed, unless the saved one is over an hour old
+            unchanged = device is not None and all(device.get(key) == value for key, value in updated.items() if key != "last_seen")
+            if not unchanged or updated["last_seen"] - device["last_seen"] > 3600:
+                self.save()
+        return previous_ip
+
+    def key_of(self, device_id):
+        """Return the monitoring key of a device id, or None if it has never been seen."""
+        with self.lock:
+            device = self.devices.get(device_id)
+            return device["key"] if device else None
+
+    def keys(self):
+        """Return the monitoring keys of all known devices."""
+        with self.lock:
+            return [device["key"] for device in self.devices.values()]
+
+    def addresses(self):
+        """Return a ``{key: last_ip}`` map for devices whose IP has changed since they were first seen."""
+        with self.lock:
+            return {device["key"]: device["ip"] for device in self.devices.values() if device["ip"] != device["key"]}
+
+    def key_for(self, ip_address):
+        """Return the monitoring key of the device keyed by, or else last seen at, an address, or None."""
+        with self.lock:
+            for device in self.devices.values():
+                if device["key"] == ip_address:
+                    return device["key"]
+            for device in self.devices.values():
+                if device["ip"] == ip_address:
+                    return device["key"]
+        return None
+
+
+class Discovery:
+    """Finds Shelly devices in the background and keeps the inventory current.
+
+    On start, the devices already in the inventory are re-probed at their last
+    IP, so a restart never waits on a sweep. After that, mDNS browsing of
+    ``_shelly._tcp`` (when the ``zeroconf`` package is installed) reports
+    devices as they announce themselves, and a concurrent sweep of
+    ``subnets`` calling ``/shelly`` runs every ``sweep_interval`` seconds.
+    Whenever a known device turns up at a new IP, ``on_moved(key, ip_address)``
+    is called from the discovery thread.
+    """
+
+    def __init__(self, inventory, subnets=None, on_moved=None, sweep_interval=3600.0, max_workers=64, timeout=1.0):
+        self.inventory = inventory
+        self.subnets = subnets if subnets is not None else [subnet for subnet in [local_subnet()] if subnet]
+        self.on_moved = on_moved
+        self.sweep_interval = sweep_interval
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.zeroconf = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="discovery", daemon=True)
+
+    @classmethod
+    def from_env(cls, inventory, **kwargs):
+        """Create a discovery service for DISCOVERY_SUBNETS (comma-separated CIDRs, default: the local /24)."""
+        subnets = os.getenv("DISCOVERY_SUBNETS")
+        if subnets:
+            kwargs["subnets"] = [ipaddress.ip_network(subnet.strip(), strict=False) for subnet in subnets.split(",") if subnet.strip()]
+        return cls(inventory, sweep_interval=float(os.getenv("DISCOVERY_INTERVAL", 3600)), **kwargs)
+
+    def start(self):
+        """Start mDNS browsing and the background refresh and sweep thread."""
+        try:
+            from zeroconf import ServiceBrowser, Zeroconf
+            self.zeroconf = Zeroconf()
+            ServiceBrowser(self.zeroconf, SHELLY_SERVICE, handlers=[self.on_service_state_change])
+        except ImportError:
+            pass  # mDNS is optional; the subnet sweep still finds devices
+        except OSError as e:
+            logging.error(f"mDNS discovery unavailable: {e}")
+            self.zeroconf = None
+        self.thread.start()
+
+    def stop(self):
+        """Stop browsing and sweeping."""
+        self.stopping.set()
+        if self.zeroconf is not None:
+            self.zeroconf.close()
+
+    def run(self):
+        """Refresh known devices, then sweep the subnets periodically until stopped."""
+        with self.inventory.lock:
+            known = [device["ip"] for device in self.inventory.devices.values()]
+        self.probe_all(known)
+        while not self.stopping.is_set():
+            self.sweep()
+            self.stopping.wait(self.sweep_interval)
+
+    def sweep(self):
+        """Probe every host of the configured subnets once."""
+        for subnet in self.subnets:
+            self.probe_all(str(host) for host in subnet.hosts())
+
+    def probe_all(self, ip_addresses):
+        """Probe many addresses concurrently and record every device that answers."""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="discovery") as executor:
+            futures = {executor.submit(probe, ip_address, self.timeout): ip_address for ip_address in ip_addresses}
+            for future in as_completed(futures):
+                if self.stopping.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return
+                info = future.result()
+                if info is not None:
+                    self.found(futures[future], info)
+
+    def found(self, ip_address, info):
+        """Record a device sighting and report new devices and IP changes."""
+        device_id = device_id_of(info)
+        is_new = self.inventory.key_of(device_id) is None
+        previous_ip = self.inventory.record(ip_address, info)
+        key = self.inventory.key_of(device_id)
+        if previous_ip is not None:
+            logging.info(f"Device {key} moved from {previous_ip} to {ip_address}")
+            if self.on_moved:
+                self.on_moved(key, ip_address)
+        elif is_new:
+            logging.info(f"Discovered {info.get('model') or info.get('type')} {device_id} at {ip_address}")
+
+    def on_service_state_change(self, zeroconf, service_type, name, state_change):
+        """Handle an mDNS announcement by probing the announced address on a separate thread."""
+        from zeroconf import ServiceStateChange
+        if state_change in (ServiceStateChange.Added, ServiceStateChange.Updated):
+            threading.Thread(target=self.resolve_service, args=(zeroconf, service_type, name), daemon=True).start()
+
+    def resolve_service(self, zeroconf, service_type, name):
+        """Resolve an announced service to its IPv4 address and probe it."""
+        info = zeroconf.get_service_info(service_type, name, timeout=3000)
+        if info is None:
+            return
+        for ip_address in info.parsed_addresses():
+            if ":" not in ip_address:
+                device = probe(ip_address, self.timeout)
+                if device is not None:
+                    self.found(ip_address, device)
+                return
@@ -0,0 +1,227 @@
+import bisect
+import os
+import threading
+import time
+from datetime import datetime
+
+PERIOD_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+
+
+def period_keys(timestamp):
+    """Return the local-time hour, day and month keys an epoch timestamp falls in."""
+    local = datetime.fromtimestamp(timestamp)
+    return {period: local.strftime(fmt) for period, fmt in PERIOD_FORMATS.items()}
+
+
+class Tariff:
+    """Time-of-use electricity prices per kWh.
+
+    A schedule is a list of ``HH:MM=price`` entries, each price applying from its
+    start time until the next entry (wrapping past midnight), e.g.
+    ``00:00=0.12,07:00=0.31,21:00=0.12``. Weekends may use their own schedule.
+    """
+
+    def __init__(self, weekday="00:00=0", weekend=None):
+        self.weekday = self.parse(weekday)
+        self.weekend = self.parse(weekend) if weekend else self.weekday
+
+    @classmethod
+    def from_env(cls):
+        """Create a tariff from ENERGY_TARIFF and ENERGY_TARIFF_WEEKEND."""
+        return cls(os.getenv("ENERGY_TARIFF", "00:00=0"), os.getenv("ENERGY_TARIFF_WEEKEND"))
+
+    @staticmethod
+    def parse(spec):
+        """Parse a schedule into sorted ``(minute_of_day, price)`` pairs."""
+        periods = []
+        for entry in spec.split(","):
+            start, price = entry.split("=")
+            hour, minute = start.strip().split(":")
+            periods.append((int(hour) * 60 + int(minute), float(price)))
+        if not periods:
+            raise ValueError(f"Empty tariff schedule: {spec!r}")
+        return sorted(periods)
+
+    def rate_at(self, timestamp):
+        """Return the price per kWh in effect at an epoch timestamp (local time)."""
+        local = time.localtime(timestamp)
+        periods = self.weekend if local.tm_wday >= 5 else self.weekday
+        index = bisect.bisect_right(periods, (local.tm_hour * 60 + local.tm_min, float("inf"))) - 1
+        return periods[index][1]  # Index -1 wraps to the last entry of the previous day
+
+
+class EnergyMeter:
+    """Incremental kWh and cost accounting from the devices' aenergy counters.
+
+    Each sample adds the counter delta since the previous one to the device's
+    hour, day and month rollups, so reports read a few rollup rows instead of
+    rescanning raw samples. A counter that goes backwards means the device
+    rebooted, and its new total is counted as the delta. After a gap of more
+    than ``gap_seconds``, the complete minutes reported in ``by_minute`` are
+    backfilled to the minutes they belong to and any remaining energy is spread
+    evenly over the rest of the gap.
+
+    Rollups are kept in memory and, with an ``EnergyStore``, written to MongoDB
+    every ``flush_interval`` seconds alongside the counter state, so energy
+    used while the collector was stopped is still accounted for. Saved state is
+    loaded on the background thread, and a device's samples are only metered
+    once its state has loaded; if the store cannot be read, the remaining
+    devices start from their next sample instead. Rollups of past periods are
+    dropped from memory every ``flush_interval`` seconds, with or without a
+    store.
+    """
+
+    def __init__(self, store=None, tariff=None, gap_seconds=90.0, flush_interval=30.0):
+        self.store = store
+        self.tariff = tariff or Tariff()
+        self.gap_seconds = gap_seconds
+        self.flush_interval = flush_interval
+        self.counters = {}  # ip -> (last_total_wh, last_timestamp)
+        self.rollups = {}  # ip -> {(period, key): [kwh, cost]}
+        self.pending = {}  # ip -> {(period, key): [kwh, cost]} not yet written
+        self.ready = set()  # Devices whose saved state has been loaded (all of them without a store)
+        self.ip_addresses = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="energy-meter", daemon=True)
+
+    def start(self, ip_addresses):
+        """Start the background thread, which loads saved state and then flushes and prunes rollups."""
+        self.ip_addresses = list(ip_addresses)
+        if self.store is None:
+            self.ready.update(self.ip_addresses)
+        self.thread.start()
+
+    def load(self):
+        """Load each device's saved counter and current rollups; runs on the background thread.
+
+        After a failed load the store is not asked again: the remaining devices
+        are metered from their next sample.
+        """
+        keys = period_keys(time.time()).items()
+        for ip_address in self.ip_addresses:
+            loaded = None if self.stopping.is_set() else self.store.load(ip_address, keys)
+            if loaded is None:
+                with self.lock:
+                    self.ready.update(self.ip_addresses)
+                return
+            counter, rollups = loaded
+            with self.lock:
+                if counter is not None:
+                    self.counters[ip_address] = counter
+                self.rollups.setdefault(ip_address, {}).update(rollups)
+                self.ready.add(ip_address)
+
+    def stop(self, timeout=10):
+        """Write pending rollups and stop the flush thread."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def add_sample(self, ip_address, status, timestamp=None):
+        """Account for the energy used since the device's previous sample; runs on the poller loop."""
+        timestamp = time.time() if timestamp is None else timestamp
+        total = status.aenergy_total
+        with self.lock:
+            if ip_address not in self.ready:
+                return  # Its saved counter is still loading
+            previous = self.counters.get(ip_address)
+            self.counters[ip_address] = (total, timestamp)
+            if previous is None:
+                return
+            last_total, last_timestamp = previous
+            if timestamp <= last_timestamp:
+                return
+            delta = total - last_total
+            if delta < 0:  # Counter restarted with the device
+                delta = total
+            if timestamp - last_timestamp <= self.gap_seconds:
+                self.record(ip_address, timestamp, delta)
+                return
+
+            # by_minute holds the last complete minutes in mWh, newest first, ending at minute_ts
+            gap_end = timestamp
+            for i, milliwatt_hours in enumerate(status.aenergy_by_minute):
+                minute_start = status.aenergy_minute_ts - 60 * (i + 1)
+                if minute_start < last_timestamp:
+                    break
+                energy = min(milliwatt_hours / 1000, delta)
+                self.record(ip_address, minute_start + 30, energy)
+                delta -= energy
+                gap_end = minute_start
+            self.spread(ip_address, last_timestamp, gap_end, delta)
+
+    def spread(self, ip_address, start, end, energy):
+        """Record ``energy`` Wh evenly over [start, end), one share per hour it touches."""
+        if energy <= 0:
+            return
+        if end <= start:
+            self.record(ip_address, start, energy)
+            return
+        duration = end - start
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(end, (chunk_start // 3600 + 1) * 3600)
+            self.record(ip_address, (chunk_start + chunk_end) / 2, energy * (chunk_end - chunk_start) / duration)
+            chunk_start = chunk_end
+
+    def record(self, ip_address, timestamp, energy):
+        """Add ``energy`` Wh used at ``timestamp`` to the device's rollups; the caller holds the lock."""
+        if energy <= 0:
+            return
+        kwh = energy / 1000
+        cost = kwh * self.tariff.rate_at(timestamp)
+        rollups = self.rollups.setdefault(ip_address, {})
+        pending = self.pending.setdefault(ip_address, {})
+        for period, key in period_keys(timestamp).items():
+            for totals in (rollups.setdefault((period, key), [0.0, 0.0]), pending.setdefault((period, key), [0.0, 0.0])):
+                totals[0] += kwh
+                totals[1] += cost
+
+    def totals(self, ip_address, period, timestamp=None):
+        """Return ``(kwh, cost)`` of the hour, day or month containing ``timestamp`` (default now)."""
+        key = period_keys(time.time() if timestamp is None else timestamp)[period]
+        with self.lock:
+            kwh, cost = self.rollups.get(ip_address, {}).get((period, key), (0.0, 0.0))
+        return kwh, cost
+
+    def run(self):
+        """Load saved state, then flush (or, without a store, prune) rollups every ``flush_interval`` seconds until stopped."""
+        if self.store is not None:
+            self.load()
+        while not self.stopping.wait(self.flush_interval):
+            if self.store is not None:
+                self.flush()
+            else:
+                with self.lock:
+                    self.prune()
+        if self.store is not None:
+            self.flush()
+
+    def flush(self):
+        """Write pending rollup increments and counter state; failed writes are retried next time."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            counters = dict(self.counters)
+            self.prune()
+        for ip_address in set(pending) | set(counters):
+            increments = pending.get(ip_address, {})
+            if not self.store.write(ip_address, increments, counters.get(ip_address)):
+                self.restore(ip_address, increments)
+
+    def restore(self, ip_address, increments):
+        """Put unwritten increments back in front of anything accumulated since."""
+        with self.lock:
+            pending = self.pending.setdefault(ip_address, {})
+            for key, (kwh, cost) in increments.items():
+                totals = pending.setdefault(key, [0.0, 0.0])
+                totals[0] += kwh
+                totals[1] += cost
+
+    def prune(self):
+        """Drop in-memory rollups of past hours, days and months (they remain in the store, if any); the caller holds the lock."""
+        current = period_keys(time.time())
+        for rollups in self.rollups.values():
+            for period, key in list(rollups):
+                if key < current[period]:
+                    del rollups[(period, key)]
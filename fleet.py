@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+import time
+
+import requests
+
+from rpc_client import is_idempotent
+
+TOGGLE_CALLS = '[{"method":"switch.toggle","params":{"id":0}}]'
+
+
+def schedule_create_params(day, hour, minute):
+    """Return Schedule.Create params for a job that toggles switch 0 at the given day and time."""
+    return {"timespec": f"0 {int(minute)} {int(hour)} * * {day}", "calls": TOGGLE_CALLS}
+
+
+def read_device_groups(ip_addresses):
+    """Return named device groups from DEVICE_GROUP_<NAME>=ip,ip,... entries, plus "All devices"."""
+    groups = {"All devices": list(ip_addresses)}
+    for key, value in os.environ.items():
+        if key.startswith("DEVICE_GROUP_"):
+            name = key[len("DEVICE_GROUP_"):].replace("_", " ").title()
+            groups[name] = [ip.strip() for ip in value.split(",") if ip.strip() in ip_addresses]
+    return groups
+
+
+def summarize_result(method, result):
+    """Return a one-line description of an RPC result for the fleet view."""
+    if method == "Switch.Toggle":
+        return "turned off" if result.get("was_on") else "turned on"
+    if method == "Schedule.List":
+        jobs = result.get("jobs", [])
+        return f"{len(jobs)} jobs" + (f": ids {', '.join(str(job.get('id')) for job in jobs)}" if jobs else "")
+    if method == "Schedule.Create":
+        return f"created job {result.get('id', '?')}"
+    if method == "Schedule.Delete":
+        return "deleted"
+    return str(result)
+
+
+async def run_fleet_operation(poller, ip_addresses, method, params=None, limit=8, on_progress=None):
+    """Run one RPC method on many devices concurrently, at most ``limit`` at a time.
+
+    Each device reports ``on_progress(ip_address, state, detail, latency)`` with
+    state "running", then "ok" or "failed", or "unknown" when a method that is
+    not retried once sent (a toggle or schedule change) timed out waiting for
+    the answer and may or may not have been applied. A failing or slow device
+    never holds up the others. Returns the final ``(ip_address, state, detail, latency)``
+    tuples in input order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    def report(*outcome):
+        if on_progress:
+            on_progress(*outcome)
+        return outcome
+
+    async def run_one(ip_address):
+        async with semaphore:
+            report(ip_address, "running", "", None)
+            started = time.perf_counter()
+            try:
+                result = await poller.call(ip_address, method, params)
+            except requests.ReadTimeout as e:
+                if is_idempotent(method):
+                    logging.error(f"Fleet {method} failed on {ip_address}: {e}")
+                    return report(ip_address, "failed", str(e), time.perf_counter() - started)
+                logging.warning(f"Fleet {method} timed out on {ip_address} after it was sent")
+                return report(ip_address, "unknown", "no answer in time, it may have been applied", time.perf_counter() - started)
+            except Exception as e:
+                logging.error(f"Fleet {method} failed on {ip_address}: {e}")
+                return report(ip_address, "failed", str(e), time.perf_counter() - started)
+            return report(ip_address, "ok", summarize_result(method, result), time.perf_counter() - started)
+
+    return await asyncio.gather(*(run_one(ip_address) for ip_address in ip_addresses))
@@ -0,0 +1,76 @@
+import math
+import tkinter as tk
+from functools import lru_cache
+
+BAR_COLOR = "#1f538d"
+TEXT_COLOR = "white"
+
+
+@lru_cache(maxsize=None)
+def dial_layout(title, max_value, width, height):
+    """Compute the static dial items for a gauge once per (title, max_value, size).
+
+    Returns a tuple of ``(kind, coords, options)`` entries that a canvas can draw
+    directly, along with the geometry the dynamic items need.
+    """
+    cx, cy = width / 2, height - 22
+    radius = min(width / 2 - 30, height - 70)
+    ring = radius * 0.28
+    arc_box = (cx - radius, cy - radius, cx + radius, cy + radius)
+
+    items = [
+        ("text", (cx, 10), {"text": title, "fill": TEXT_COLOR, "font": ("Helvetica", 11, "bold")}),
+        # Two shaded steps across the dial, matching the old plotly gauge
+        ("arc", arc_box, {"start": 90, "extent": 90, "style": "arc", "width": ring, "outline": "lightgray"}),
+        ("arc", arc_box, {"start": 0, "extent": 90, "style": "arc", "width": ring, "outline": "gray"}),
+    ]
+    for fraction in (0, 0.25, 0.5, 0.75, 1):
+        angle = math.pi * (1 - fraction)
+        outer = radius + ring / 2
+        x, y = cx + (outer + 10) * math.cos(angle), cy - (outer + 10) * math.sin(angle)
+        label = f"{max_value * fraction:g}"
+        items.append(("text", (x, y), {"text": label, "fill": TEXT_COLOR, "font": ("Helvetica", 8)}))
+
+    geometry = {"center": (cx, cy), "radius": radius, "ring": ring, "arc_box": arc_box}
+    return tuple(items), geometry
+
+
+class GaugeWidget(tk.Canvas):
+    """A semicircular gauge drawn directly on a Tk canvas.
+
+    The dial is drawn once when the widget is created; ``set_value`` only moves
+    the bar and needle and changes the number text.
+    """
+
+    def __init__(self, master, title, max_value, width=230, height=147, bg="#2b2b2b", **kwargs):
+        super().__init__(master, width=width, height=height, bg=bg, highlightthickness=0, **kwargs)
+        self.title = title
+        self.max_value = max_value
+        self.value = None
+        items, self.geometry = dial_layout(title, max_value, width, height)
+        for kind, coords, options in items:
+            getattr(self, f"create_{kind}")(*coords, **options)
+
+        cx, cy = self.geometry["center"]
+        ring = self.geometry["ring"]
+        self.bar = self.create_arc(*self.geometry["arc_box"], start=180, extent=0, style="arc", width=ring * 0.6, outline=BAR_COLOR)
+        self.needle = self.create_line(cx, cy, cx, cy, fill="black", width=2)
+        self.number = self.create_text(cx, cy - 12, text="0", fill=TEXT_COLOR, font=("Helvetica", 22, "bold"))
+        self.set_value(0)
+
+    def set_value(self, value):
+        """Move the bar and needle to ``value`` and update the number text."""
+        if value == self.value:
+            return
+        self.value = value
+        fraction = max(0.0, min(1.0, value / self.max_value)) if self.max_value else 0.0
+        self.itemconfigure(self.bar, extent=-180 * fraction)
+
+        cx, cy = self.geometry["center"]
+        radius, ring = self.geometry["radius"], self.geometry["ring"]
+        angle = math.pi * (1 - fraction)
+        inner, outer = radius - ring / 2, radius + ring / 2
+        self.coords(self.needle,
+                    cx + inner * math.cos(angle), cy - inner * math.sin(angle),
+                    cx + outer * math.cos(angle), cy - outer * math.sin(angle))
+        self.itemconfigure(self.number, text=f"{value:g}")
@@ -0,0 +1,104 @@
+import random
+import time
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class DeviceHealth:
+    """Circuit breaker and adaptive poll interval for one device.
+
+    A failed poll makes the device degraded; ``open_after`` consecutive
+    failures open the circuit, after which the device is only probed once per
+    backoff period (doubling up to ``backoff_max``). A probe moves the circuit
+    to half-open; success closes it and failure reopens it with a longer
+    backoff. Unhealthy devices are polled without retries so a dead plug costs
+    a single timeout per probe.
+
+    While healthy, the poll interval follows the load: ``interval`` while
+    apower is changing, easing out to ``steady_interval`` while it is steady,
+    and ``off_interval`` while the outlet is off.
+    """
+
+    def __init__(self, interval=1.0, steady_interval=5.0, off_interval=10.0, open_after=3,
+                 backoff_base=5.0, backoff_max=300.0, change_threshold=0.05):
+        self.interval = interval
+        self.steady_interval = max(steady_interval, interval)
+        self.off_interval = max(off_interval, interval)
+        self.open_after = open_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.change_threshold = change_threshold
+        self.state = HEALTHY
+        self.failures = 0
+        self.backoff = 0.0
+        self.next_probe = None  # Wall-clock time of the next probe while open
+        self.current_interval = interval
+        self.last_power = None
+        self.interval_override = None  # Set by the poller's set_interval, e.g. while push notifications arrive
+        self.push_active = False
+
+    @property
+    def retries(self):
+        """Number of attempts to make per poll; None means the client's default."""
+        return None if self.state == HEALTHY else 1
+
+    def begin_attempt(self):
+        """Mark the start of a poll; a poll of an open circuit is a half-open probe."""
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+
+    def record_success(self, status):
+        """Close the circuit and adapt the poll interval to the sample."""
+        self.state = HEALTHY
+        self.failures = 0
+        self.backoff = 0.0
+        self.next_probe = None
+        self.adapt_interval(status)
+
+    def record_failure(self):
+        """Count a failed poll and open the circuit when warranted."""
+        self.failures += 1
+        self.last_power = None
+        if self.state == HALF_OPEN or self.failures >= self.open_after:
+            self.backoff = min(self.backoff * 2 if self.backoff else self.backoff_base, self.backoff_max)
+            self.state = OPEN
+        else:
+            self.state = DEGRADED
+
+    def adapt_interval(self, status):
+        """Poll faster while apower changes, slower while it is steady or the outlet is off."""
+        power = status.apower
+        if not status.output:
+            self.current_interval = self.off_interval
+        elif self.last_power is None or \
+                abs(power - self.last_power) > max(1.0, abs(self.last_power) * self.change_threshold):
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(self.current_interval * 1.5, self.steady_interval)
+        self.last_power = power
+
+    def next_delay(self):
+        """Return the seconds to wait before the next poll of this device."""
+        if self.state == OPEN:
+            delay = self.backoff * random.uniform(0.9, 1.1)
+            self.next_probe = time.time() + delay
+            return delay
+        if self.state == DEGRADED:
+            return self.backoff_base
+        return self.current_interval
+
+    def effective_interval(self):
+        """Return the seconds until the next poll while healthy, honouring an interval override."""
+        return self.interval_override or self.current_interval
+
+    def describe(self):
+        """Return a short status line for the device's status button."""
+        if self.state == OPEN and self.next_probe:
+            return f"{OPEN.upper()} - next probe {time.strftime('%H:%M:%S', time.localtime(self.next_probe))}"
+        if self.state == HEALTHY:
+            polling = f"polling every {self.effective_interval():.1f}s"
+            return f"push active, {polling}" if self.push_active else polling
+        return self.state.upper()
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from timeseries import QUERYABLE_FIELDS, bucket_seconds_for, format_ip_address, merge_buckets, parse_day
+
+EPOCH = datetime(1970, 1, 1)  # Naive, as BSON dates are stored and returned in UTC
+
+# Pre-aggregated collections kept by the compactor (see rollups.py), finest first
+ROLLUP_LEVELS = (("rollup_1m", 60), ("rollup_15m", 900), ("rollup_1h", 3600))
+ROLLUP_FIELDS = ("apower", "voltage", "current")
+
+
+def day_range(from_value, to_value=None):
+    """Return the [start, end) datetimes covering the FROM..TO day strings, TO inclusive."""
+    start = parse_day(from_value)
+    end = parse_day(to_value) if to_value and to_value.strip() else start
+    if end < start:
+        start, end = end, start
+    return start, end + timedelta(days=1)
+
+
+def as_utc(value):
+    """Return a datetime read back from MongoDB as an aware UTC datetime."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def rollup_level_for(field, bucket_seconds):
+    """Return the coarsest ``(collection, seconds)`` rollup whose buckets nest in ``bucket_seconds``, or None."""
+    if field not in ROLLUP_FIELDS:
+        return None
+    levels = [level for level in ROLLUP_LEVELS if bucket_seconds % level[1] == 0]
+    return levels[-1] if levels else None
+
+
+class HistoryQuery:
+    """Server-side range queries over the per-device day collections and rollups.
+
+    Uses one long-lived client and returns per-bucket min/max/avg rows computed
+    by MongoDB, so a month of 1 Hz data comes back as a few thousand points.
+    Buckets of a minute or more are read from the coarsest rollup that nests in
+    them up to its compaction watermark, and from raw samples after it.
+    """
+
+    def __init__(self, client, target_points=2000):
+        self.client = client
+        self.target_points = target_points
+
+    def day_collections(self, ip_address, start, end):
+        """Yield the existing day collections of a device that overlap [start, end)."""
+        db = self.client[format_ip_address(ip_address)]
+        existing = set(db.list_collection_names())
+        day, last_day = start.astimezone().date(), (end - timedelta(microseconds=1)).astimezone().date()
+        while day <= last_day:
+            name = day.strftime("%Y_%m_%d")
+            if name in existing:
+                yield db[name]
+            day += timedelta(days=1)
+
+    def query(self, ip_address, field, start, end, bucket_seconds=None):
+        """Return ``(bucket_start, min, max, avg)`` rows for ``field`` between ``start`` and ``end``."""
+        if field not in QUERYABLE_FIELDS:
+            raise ValueError(f"Unsupported history field: {field}")
+        bucket_seconds = bucket_seconds or bucket_seconds_for(start, end, self.target_points)
+        bucket_ms = bucket_seconds * 1000
+        buckets = {}
+        raw_start = start
+        level = rollup_level_for(field, bucket_seconds)
+        if level is not None:
+            db = self.client[format_ip_address(ip_address)]
+            state = db.rollup_state.find_one({"_id": level[0]})
+            if state:
+                raw_start = min(max(as_utc(state["until"]), start), end)
+                if raw_start > start:
+                    pipeline = [
+                        {"$match": {"timestamp": {"$gte": start, "$lt": raw_start}}},
+                        {"$project": {"_id": 0, "t": {"$subtract": ["$timestamp", EPOCH]}, "min": f"${field}.min",
+                                      "max": f"${field}.max", "sum": {"$multiply": [f"${field}.mean", "$count"]}, "count": 1}},
+                        {"$group": {
+                            "_id": {"$subtract": ["$t", {"$mod": ["$t", bucket_ms]}]},
+                            "min": {"$min": "$min"},
+                            "max": {"$max": "$max"},
+                            "sum": {"$sum": "$sum"},
+                            "count": {"$sum": "$count"},
+                        }},
+                    ]
+                    merge_buckets(buckets, db[level[0]].aggregate(pipeline))
+
+        if raw_start < end:
+            pipeline = [
+                {"$match": {"timestamp": {"$gte": raw_start, "$lt": end}, field: {"$exists": True}}},
+                {"$project": {"_id": 0, "t": {"$subtract": ["$timestamp", EPOCH]}, "v": f"${field}"}},
+                {"$group": {
+                    "_id": {"$subtract": ["$t", {"$mod": ["$t", bucket_ms]}]},
+                    "min": {"$min": "$v"},
+                    "max": {"$max": "$v"},
+                    "sum": {"$sum": "$v"},
+                    "count": {"$sum": 1},
+                }},
+            ]
+            for collection in self.day_collections(ip_address, raw_start, end):
+                merge_buckets(buckets, collection.aggregate(pipeline))
+
+        return [((EPOCH + timedelta(milliseconds=key)).replace(tzinfo=timezone.utc), row["min"], row["max"], row["sum"] / row["count"])
+                for key, row in sorted(buckets.items())]
+
+
+def lttb(x, y, threshold):
+    """Downsample ``(x, y)`` to ``threshold`` points with largest-triangle-three-buckets.
+
+    Cost depends on ``threshold`` (the pixel width) rather than on ``len(x)``
+    beyond a single NumPy pass per bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+class HistoryCache:
+    """Caches bucketed history in fixed tiles keyed by (device, field, bucket size, tile).
+
+    A request only queries the tiles it does not already hold, so panning fetches
+    just the newly exposed range. Tiles that end in the future are still filling
+    up and are never cached.
+    """
+    TILE_BUCKETS = 512
+
+    def __init__(self, history, max_tiles=256):
+        self.history = history
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fetch(self, ip_address, field, start, end, bucket_seconds):
+        """Return ``(times, mins, maxes, avgs)`` NumPy arrays for [start, end); times are epoch seconds."""
+        tile_span = bucket_seconds * self.TILE_BUCKETS
+        first_tile = int(start.timestamp() // tile_span)
+        last_tile = int((end.timestamp() - 1e-6) // tile_span)
+        now = time.time()
+        parts = []
+        for index in range(first_tile, last_tile + 1):
+            key = (ip_address, field, bucket_seconds, index)
+            with self.lock:
+                tile = self.tiles.get(key)
+                if tile is not None:
+                    self.tiles.move_to_end(key)
+            if tile is None:
+                tile_start = datetime.fromtimestamp(index * tile_span, timezone.utc)
+                tile_end = tile_start + timedelta(seconds=tile_span)
+                tile = self.rows_to_arrays(self.history.query(ip_address, field, tile_start, tile_end, bucket_seconds))
+                if tile_end.timestamp() <= now:
+                    with self.lock:
+                        self.tiles[key] = tile
+                        while len(self.tiles) > self.max_tiles:
+                            self.tiles.popitem(last=False)
+            parts.append(tile)
+
+        times, mins, maxes, avgs = (np.concatenate(column) for column in zip(*parts))
+        keep = (times >= start.timestamp()) & (times < end.timestamp())
+        return times[keep], mins[keep], maxes[keep], avgs[keep]
+
+    @staticmethod
+    def rows_to_arrays(rows):
+        """Convert ``HistoryQuery.query`` rows into column arrays."""
+        times = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), 3)
+        return times, values[:, 0], values[:, 1], values[:, 2]
@@ -0,0 +1,133 @@
+import tkinter as tk
+from datetime import datetime
+
+import numpy as np
+
+from history import lttb
+
+LINE_COLOR = "#1f538d"
+TEXT_COLOR = "white"
+MIN_SPAN = 10  # Seconds; zooming in further than this is pointless at 1 Hz
+
+
+class HistoryChart(tk.Canvas):
+    """A line chart of one history series with wheel zoom and drag-to-pan.
+
+    The series is decimated with LTTB to the plot's pixel width before drawing,
+    so redraw cost does not grow with the number of samples. Whenever the
+    visible range changes, ``on_view_change(start, end)`` is called (debounced)
+    with epoch seconds so the owner can load data for the new range.
+    """
+    PADDING = (55, 10, 15, 25)  # left, top, right, bottom
+
+    def __init__(self, master, on_view_change, width=700, height=220, bg="#2b2b2b", **kwargs):
+        super().__init__(master, width=width, height=height, bg=bg, highlightthickness=0, **kwargs)
+        self.on_view_change = on_view_change
+        self.view = None
+        self.times = np.empty(0)
+        self.values = np.empty(0)
+        self.drag_x = None
+        self.pending_change = None
+        self.line = self.create_line(0, 0, 0, 0, fill=LINE_COLOR, width=2)
+        self.bind("<Configure>", lambda event: self.redraw())
+        self.bind("<ButtonPress-1>", self.start_pan)
+        self.bind("<B1-Motion>", self.pan)
+        self.bind("<ButtonRelease-1>", self.end_pan)
+        self.bind("<MouseWheel>", lambda event: self.zoom(event.x, 0.8 if event.delta > 0 else 1.25))
+        self.bind("<Button-4>", lambda event: self.zoom(event.x, 0.8))
+        self.bind("<Button-5>", lambda event: self.zoom(event.x, 1.25))
+
+    def plot_size(self):
+        """Return the width and height of the plotting area in pixels."""
+        left, top, right, bottom = self.PADDING
+        width = max(self.winfo_width(), int(self.cget("width")))
+        height = max(self.winfo_height(), int(self.cget("height")))
+        return max(1, width - left - right), max(1, height - top - bottom)
+
+    def set_view(self, start, end, notify=True):
+        """Show the range [start, end] (epoch seconds) and optionally request its data."""
+        self.view = (start, end)
+        self.redraw()
+        if notify:
+            self.schedule_view_change()
+
+    def set_data(self, times, values):
+        """Replace the plotted series with sorted ``times`` (epoch seconds) and ``values``."""
+        self.times = times
+        self.values = values
+        self.redraw()
+
+    def schedule_view_change(self):
+        """Notify the owner of the new range once the user stops zooming or panning."""
+        if self.pending_change is not None:
+            self.after_cancel(self.pending_change)
+        self.pending_change = self.after(200, self.notify_view_change)
+
+    def notify_view_change(self):
+        """Call ``on_view_change`` with the current range."""
+        self.pending_change = None
+        self.on_view_change(*self.view)
+
+    def start_pan(self, event):
+        """Remember where a drag started."""
+        self.drag_x = event.x
+
+    def pan(self, event):
+        """Shift the view by the dragged distance."""
+        if self.drag_x is None or self.view is None:
+            return
+        start, end = self.view
+        shift = (self.drag_x - event.x) * (end - start) / self.plot_size()[0]
+        self.drag_x = event.x
+        self.set_view(start + shift, end + shift)
+
+    def end_pan(self, event):
+        """Finish a drag."""
+        self.drag_x = None
+
+    def zoom(self, x, factor):
+        """Zoom the view by ``factor`` around the time under pixel column ``x``."""
+        if self.view is None:
+            return
+        start, end = self.view
+        plot_width = self.plot_size()[0]
+        fraction = min(max(x - self.PADDING[0], 0), plot_width) / plot_width
+        anchor = start + fraction * (end - start)
+        new_start, new_end = anchor - (anchor - start) * factor, anchor + (end - anchor) * factor
+        if new_end - new_start >= MIN_SPAN:
+            self.set_view(new_start, new_end)
+
+    def redraw(self):
+        """Redraw the line and axis labels for the current view."""
+        self.delete("axis")
+        if self.view is None:
+            return
+        start, end = self.view
+        left, top = self.PADDING[0], self.PADDING[1]
+        plot_width, plot_height = self.plot_size()
+
+        # Keep one point past each edge so the line runs off the plot instead of stopping short
+        first, last = np.searchsorted(self.times, [start, end])
+        first, last = max(first - 1, 0), min(last + 1, len(self.times))
+        x, y = lttb(self.times[first:last], self.values[first:last], plot_width)
+        if len(x) < 2:
+            self.coords(self.line, 0, 0, 0, 0)
+            self.create_text(left + plot_width / 2, top + plot_height / 2, text="No data", fill=TEXT_COLOR, tags="axis")
+            return
+
+        low, high = float(y.min()), float(y.max())
+        if high == low:
+            low, high = low - 1, high + 1
+        px = left + (x - start) / (end - start) * plot_width
+        py = top + (high - y) / (high - low) * plot_height
+        self.coords(self.line, np.column_stack((px, py)).ravel().tolist())
+
+        self.create_text(left - 5, top, text=f"{high:.1f}", anchor="ne", fill=TEXT_COLOR, tags="axis")
+        self.create_text(left - 5, top + plot_height, text=f"{low:.1f}", anchor="se", fill=TEXT_COLOR, tags="axis")
+        span = end - start
+        time_format = "%m-%d" if span > 3 * 86400 else "%m-%d %H:%M" if span > 3600 else "%H:%M:%S"
+        for i in range(5):
+            timestamp = start + span * i / 4
+            label = datetime.fromtimestamp(timestamp).strftime(time_format)
+            anchor = "nw" if i == 0 else "ne" if i == 4 else "n"
+            self.create_text(left + plot_width * i / 4, top + plot_height + 5, text=label, anchor=anchor, fill=TEXT_COLOR, tags="axis")
@@ -0,0 +1,241 @@
+"""Embedded sample store: per-device, per-day append-only files instead of MongoDB.
+
+A device's samples live in ``<root>/<device>/<YYYY_MM_DD>.bin`` (local-time
+days, named like the MongoDB day collections). Each file is a header followed
+by fixed-width records of the history fields, so files can be memory-mapped
+and read as NumPy arrays without parsing or copying::
+
+    header  magic "SPMS", version, record size, day start (epoch ms), energy base (Wh)
+    record  time since day start (uint32 ms), apower, voltage, current,
+            aenergy.total - energy base, temperature.tF (float32 each)
+
+Times and the energy counter are delta-encoded against the header, which
+keeps every record at 24 bytes while the counter keeps its precision. Records
+are appended in time order, so the time column doubles as the index: a range
+seek is a binary search over the mapped column and touches only the pages it
+probes.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from metrics import REGISTRY, TIMING_BUCKETS
+from ring_buffer import METRIC_ATTRIBUTES
+from timeseries import QUERYABLE_FIELDS, BufferedWriter, bucket_seconds_for, collection_name_for, format_ip_address, merge_buckets, parse_day
+
+LOCAL_WRITE_SECONDS = REGISTRY.histogram("local_store_write_seconds", "Time to append one device's share of a sample batch.", buckets=TIMING_BUCKETS)
+LOCAL_SAMPLES_WRITTEN = REGISTRY.counter("local_store_samples_written_total", "Samples appended to the local store.")
+LOCAL_SAMPLES_DROPPED = REGISTRY.counter("local_store_samples_dropped_total", "Samples discarded because the write queue was full.")
+
+MAGIC, VERSION = b"SPMS", 1
+HEADER = struct.Struct("<4sHHqd8x")
+RECORD = struct.Struct("<I5f")
+RECORD_DTYPE = np.dtype([("t", "<u4"), ("apower", "<f4"), ("voltage", "<f4"), ("current", "<f4"),
+                         ("aenergy_total", "<f4"), ("temperature_f", "<f4")])
+SUFFIX = ".bin"
+
+
+class DayFile:
+    """The open day file of one device, appended to by the writer thread."""
+
+    def __init__(self, path, day):
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size
+        self.file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            magic, version, record_size, self.base_ms, self.energy_base = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                self.file.close()
+                raise ValueError(f"{path} is not a version {VERSION} sample file")
+            # Drop a record torn by a crash mid-write, then resume after the last whole one
+            count = (os.fstat(self.file.fileno()).st_size - HEADER.size) // RECORD.size
+            self.file.truncate(HEADER.size + count * RECORD.size)
+            self.last_t = 0
+            if count:
+                self.file.seek(HEADER.size + (count - 1) * RECORD.size)
+                self.last_t = RECORD.unpack(self.file.read(RECORD.size))[0]
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.base_ms = int(parse_day(day).timestamp() * 1000)
+            self.energy_base = None
+            self.last_t = 0
+
+    def append(self, samples):
+        """Append ``(epoch_ms, status)`` samples, all of which fall on this file's day."""
+        if self.energy_base is None:
+            self.energy_base = samples[0][1].aenergy_total
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.base_ms, self.energy_base))
+        records = []
+        for timestamp_ms, status in samples:
+            # Keep the file sorted if the wall clock steps back
+            self.last_t = max(self.last_t, min(timestamp_ms - self.base_ms, 2**32 - 1))
+            records.append(RECORD.pack(self.last_t, status.apower, status.voltage, status.current,
+                                       status.aenergy_total - self.energy_base, status.temperature_f))
+        self.file.write(b"".join(records))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LocalStore:
+    """The directory of per-device day files, with memory-mapped reads."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def device_dir(self, ip_address):
+        return os.path.join(self.root, format_ip_address(ip_address))
+
+    def path(self, ip_address, day):
+        """Return the file of a device's samples on a YYYY_MM_DD day."""
+        return os.path.join(self.device_dir(ip_address), day + SUFFIX)
+
+    def days(self, ip_address):
+        """Return the YYYY_MM_DD days a device has samples for, oldest first."""
+        try:
+            names = os.listdir(self.device_dir(ip_address))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX))
+
+    def open_day(self, ip_address, day):
+        """Open a device's day file for appending, creating it (and the device directory) if needed."""
+        os.makedirs(self.device_dir(ip_address), exist_ok=True)
+        return DayFile(self.path(ip_address, day), day)
+
+    def read_day(self, ip_address, day):
+        """Return ``(base_ms, energy_base, records)`` for a day file, the records a read-only mapped array.
+
+        Returns None if the file does not exist or holds no samples yet.
+        """
+        try:
+            with open(self.path(ip_address, day), "rb") as file:
+                count = (os.fstat(file.fileno()).st_size - HEADER.size) // RECORD.size
+                if count <= 0:
+                    return None
+                magic, version, record_size, base_ms, energy_base = HEADER.unpack(file.read(HEADER.size))
+                if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                    return None
+                # The mapping stays valid after the file is closed; the array keeps it alive
+                mapped = mmap.mmap(file.fileno(), HEADER.size + count * RECORD.size, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        return base_ms, energy_base, np.frombuffer(mapped, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+
+    def prune(self, ip_address, before_day):
+        """Delete a device's day files older than the YYYY_MM_DD ``before_day``."""
+        for day in self.days(ip_address):
+            if day < before_day:
+                try:
+                    os.remove(self.path(ip_address, day))
+                except OSError as e:
+                    logging.error(f"Failed to delete old samples of {ip_address} for {day}: {e}")
+
+
+class LocalSampleWriter(BufferedWriter):
+    """Buffers device samples and appends them to the local store in batches.
+
+    Shares the non-blocking queue of ``SampleWriter``: the background thread
+    appends samples every ``flush_interval`` seconds or ``batch_size``
+    samples. With ``retention_days``, a device's day files older than that
+    are deleted when it starts a new day.
+    """
+    dropped_metric = LOCAL_SAMPLES_DROPPED
+
+    def __init__(self, store, batch_size=500, flush_interval=1.0, max_pending=50000, retention_days=None):
+        super().__init__(batch_size, flush_interval, max_pending, "local-sample-writer")
+        self.store = store
+        self.retention_days = retention_days
+        self.files = {}  # ip_address -> (day, DayFile) of the day being appended to
+
+    def stop(self, timeout=10):
+        """Flush pending samples, stop the writer thread and close the day files."""
+        super().stop(timeout)
+        for _, day_file in self.files.values():
+            day_file.close()
+        self.files.clear()
+
+    def flush(self, batch):
+        """Append a batch grouped by device and day; a failing device's share is logged and discarded."""
+        groups = {}
+        for ip_address, status, timestamp in batch:
+            key = (ip_address, collection_name_for(timestamp))
+            groups.setdefault(key, []).append((int(timestamp.timestamp() * 1000), status))
+        for (ip_address, day), samples in groups.items():
+            started = time.perf_counter()
+            try:
+                self.day_file(ip_address, day).append(samples)
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to write {len(samples)} samples of {ip_address}: {e}")
+                continue
+            LOCAL_WRITE_SECONDS.labels().observe(time.perf_counter() - started)
+            self.written += len(samples)
+            LOCAL_SAMPLES_WRITTEN.labels().inc(len(samples))
+
+    def day_file(self, ip_address, day):
+        """Return the open file of a device's day, closing its previous day's file."""
+        current = self.files.get(ip_address)
+        if current is not None and current[0] == day:
+            return current[1]
+        day_file = self.store.open_day(ip_address, day)
+        if current is not None:
+            current[1].close()
+        self.files[ip_address] = (day, day_file)
+        if self.retention_days:
+            self.store.prune(ip_address, (parse_day(day) - timedelta(days=self.retention_days)).strftime("%Y_%m_%d"))
+        return day_file
+
+
+class LocalHistoryQuery:
+    """``HistoryQuery`` over the local store: bucketed min/max/avg rows computed with NumPy.
+
+    Each overlapping day file is mapped, the range is found by binary search
+    on its time column and only the records in range are reduced, so a query
+    costs O(log n) to seek plus the samples it covers.
+    """
+
+    def __init__(self, store, target_points=2000):
+        self.store = store
+        self.target_points = target_points
+
+    def query(self, ip_address, field, start, end, bucket_seconds=None):
+        """Return ``(bucket_start, min, max, avg)`` rows for ``field`` between ``start`` and ``end``."""
+        if field not in QUERYABLE_FIELDS:
+            raise ValueError(f"Unsupported history field: {field}")
+        bucket_seconds = bucket_seconds or bucket_seconds_for(start, end, self.target_points)
+        bucket_ms = bucket_seconds * 1000
+        start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        attribute = METRIC_ATTRIBUTES[field]
+        buckets = {}
+        first_day = start.astimezone().strftime("%Y_%m_%d")
+        last_day = (end - timedelta(microseconds=1)).astimezone().strftime("%Y_%m_%d")
+        for day in self.store.days(ip_address):
+            if not first_day <= day <= last_day:
+                continue
+            day_data = self.store.read_day(ip_address, day)
+            if day_data is None:
+                continue
+            base_ms, energy_base, records = day_data
+            times = records["t"]
+            lo, hi = np.searchsorted(times, [max(start_ms - base_ms, 0), max(end_ms - base_ms, 0)])
+            if lo >= hi:
+                continue
+            keys = (times[lo:hi].astype(np.int64) + base_ms) // bucket_ms * bucket_ms
+            values = records[attribute][lo:hi].astype(np.float64)
+            if attribute == "aenergy_total":
+                values += energy_base
+            starts = np.flatnonzero(np.diff(keys, prepend=-1))
+            counts = np.diff(starts, append=len(keys))
+            merge_buckets(buckets, (
+                {"_id": key, "min": low, "max": high, "sum": total, "count": count}
+                for key, low, high, total, count in zip(keys[starts].tolist(), np.minimum.reduceat(values, starts).tolist(),
+                                                        np.maximum.reduceat(values, starts).tolist(),
+                                                        np.add.reduceat(values, starts).tolist(), counts.tolist())))
+
+        return [(datetime.fromtimestamp(key / 1000, timezone.utc), row["min"], row["max"], row["sum"] / row["count"])
+                for key, row in sorted(buckets.items())]
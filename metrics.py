@@ -0,0 +1,224 @@
+import bisect
+import logging
+import threading
+
+# Bucket upper bounds in seconds: network calls and sample ages, and work done on the GUI or writer threads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TIMING_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Counter:
+    """A count that only goes up."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    """A value that is set to the latest reading."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Counts observations in fixed buckets, plus their sum and count."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Return a copy of the bucket counts, to compute quantiles over a window with ``quantile(q, since=...)``."""
+        return list(self.counts)
+
+    def quantile(self, q, since=None):
+        """Estimate a quantile by interpolating within its bucket, like Prometheus' ``histogram_quantile``.
+
+        With ``since``, an earlier ``snapshot``, only observations made after it
+        are considered. Returns None when there are none.
+        """
+        counts = self.snapshot()
+        if since is not None:
+            counts = [now - before for now, before in zip(counts, since)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]  # Beyond the largest bound, which is all that is known
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+
+class Metric:
+    """A named family of series of one kind, one series per combination of label values."""
+
+    def __init__(self, kind, name, documentation, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.series = {}
+
+    def labels(self, *values):
+        """Return the series for the given label values, creating it on first use."""
+        series = self.series.get(values)
+        if series is None:
+            series = self.series.setdefault(values, self.factory())
+        return series
+
+    def render(self):
+        """Return the family in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(list(self.series.items())):
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)]
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{format_labels(labels)} {series.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(series.bounds) + ["+Inf"], series.snapshot()):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(labels + [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {series.sum}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {series.count}")
+        return "\n".join(lines)
+
+
+def escape(value):
+    """Escape a label value for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Registry:
+    """The metrics of a process, rendered together for scraping.
+
+    Updates take no lock: every series is written from a single thread (RPC and
+    sample metrics from the poller loop, GUI timings from the Tk thread, MongoDB
+    timings from the sample writer), so a read may at worst be one update behind.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, kind, name, documentation, labelnames=(), factory=None):
+        """Return the family ``name``, registering it with a series factory on first use."""
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics.setdefault(name, Metric(kind, name, documentation, labelnames, factory))
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Return the counter family ``name``, registering it on first use."""
+        return self.register("counter", name, documentation, labelnames, Counter)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Return the gauge family ``name``, registering it on first use."""
+        return self.register("gauge", name, documentation, labelnames, Gauge)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Return the histogram family ``name``, registering it on first use."""
+        return self.register("histogram", name, documentation, labelnames, lambda: Histogram(buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for _, metric in sorted(list(self.metrics.items()))) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class LocalHttpServer:
+    """Answers GET requests on a local port from background threads.
+
+    Subclasses implement ``handle_get(request)``, given the
+    ``BaseHTTPRequestHandler`` of each request, and name the server for its
+    thread and log messages.
+    """
+    name = "http"
+    description = "HTTP"
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self):
+        """Start serving; a port that cannot be bound is logged rather than raised."""
+        # http.server is only imported when an endpoint is enabled, keeping it off the startup path
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                owner.handle_get(self)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logging.error(f"Cannot serve {self.description} on {self.host}:{self.port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name=self.name, daemon=True).start()
+
+    def stop(self):
+        """Stop serving and release the port."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle_get(self, request):
+        raise NotImplementedError
+
+
+class MetricsServer(LocalHttpServer):
+    """Serves a registry for Prometheus to scrape on a local port, from a background thread."""
+    name = "metrics"
+    description = "metrics"
+
+    def __init__(self, port, host="127.0.0.1", registry=REGISTRY):
+        super().__init__(port, host)
+        self.registry = registry
+
+    def handle_get(self, request):
+        """Answer ``GET /metrics`` with the registry's current values."""
+        if request.path.split("?")[0] not in ("/", "/metrics"):
+            request.send_error(404)
+            return
+        body = self.registry.render().encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
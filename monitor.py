@@ -1,24 +1,38 @@
 import logging
-import os
-import io
+import queue
 import time
-import pprint
 from dotenv import load_dotenv
 import requests
-import threading
-from PIL import Image, ImageTk
 import customtkinter as ctk
 from CTkMessagebox import CTkMessagebox
-import plotly.graph_objects as go
-from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timezone
+from discovery import Inventory, read_ip_addresses
+from fleet import read_device_groups, schedule_create_params
+from collections import deque
+from gauge import GaugeWidget
+from metrics import REGISTRY, TIMING_BUCKETS
+from rpc_client import RpcError
+# The collector, history and chart modules (with numpy and pymongo) are imported on first use
+# so the window can appear before they load
+
+PROCESS_SECONDS = REGISTRY.histogram("monitor_process_device_data_seconds", "Time to turn a sample into display metrics on the Tk thread.", buckets=TIMING_BUCKETS)
+RENDER_SECONDS = REGISTRY.histogram("monitor_render_seconds", "Time to redraw the selected device's tab.", buckets=TIMING_BUCKETS)
+GAUGE_SECONDS = REGISTRY.histogram("monitor_gauge_render_seconds", "Time to update a tab's three gauges.", buckets=TIMING_BUCKETS)
+LOOP_LAG = REGISTRY.histogram("monitor_loop_lag_seconds", "How late the Tk main loop runs a timer.", buckets=TIMING_BUCKETS)
+
+def call_on_tk_thread(collector, future, on_done):
+    """Arrange for ``on_done(future)`` to run on the Tk thread once ``future`` completes."""
+    future.add_done_callback(lambda f: collector.results.put(("callback", None, lambda: on_done(f))))
+    return future
+
 
 class ScheduleSettingWindow(ctk.CTkToplevel):
     """A window for setting schedules for a specific device."""
     
-    def __init__(self, ip_address):
+    def __init__(self, ip_address, collector):
         super().__init__()
         self.ip_address = ip_address
+        self.collector = collector
         self.initialize_window()
         self.setup_ui()
 
@@ -83,12 +97,22 @@ class ScheduleSettingWindow(ctk.CTkToplevel):
         self.schedule_text = ctk.CTkTextbox(self.main_frame, width=500, height=100)
         self.schedule_text.grid(row=5, column=0, columnspan=4, padx=5, pady=5)
 
+    def send_command(self, method, params, on_done):
+        """Send an RPC call in the background and handle its future on the Tk thread."""
+        call_on_tk_thread(self.collector, self.collector.call(self.ip_address, method, params),
+                          lambda future: on_done(future) if self.winfo_exists() else None)
+
     def list_schedules(self):
-        """Fetches and displays a list of all schedules from the device."""
+        """Requests the list of all schedules from the device."""
         self.schedule_text.delete("1.0", "end")  # Clear existing text
+        self.schedule_text.insert("end", "Loading schedules...\n")
+        self.send_command("Schedule.List", None, self.show_schedules)
+
+    def show_schedules(self, future):
+        """Displays the schedules returned by the device."""
+        self.schedule_text.delete("1.0", "end")
         try:
-            response = requests.get(f"http://{self.ip_address}/rpc/Schedule.List", timeout=10)
-            data = response.json()
+            data = future.result()
             self.schedule_text.insert("end", "List of schedules:\n")
             for job in data.get('jobs', []):  # Safely handle missing jobs
                 job_details = f"Job ID: {job.get('id', 'N/A')}, Enable: {job.get('enable', 'N/A')}, "
@@ -100,42 +124,289 @@ class ScheduleSettingWindow(ctk.CTkToplevel):
     def create_schedule(self):
         """Creates a schedule based on user input for day, hour, and minute."""
         try:
-            day, minute, hour = self.day_entry.get(), int(self.minute_entry.get()), int(self.hour_entry.get())
-            timespec = f"0 {minute} {hour} * * {day}"
-            params = '{"method":"switch.toggle","params":{"id":0}}'
-            url = f"http://{self.ip_address}/rpc/Schedule.Create?timespec={timespec}&calls=[{params}]"
-            print(url)
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            if 'code' in data and data['code'] == -103:
-                CTkMessagebox(title="Error", message=f"Failed to create schedule: {data.get('message', 'Unknown error')}")
-                logging.error(f"Failed to create schedule. {data.get('message', 'Unknown error')}")
-            else:
-                CTkMessagebox(title="Success", message="The schedule has been created successfully!")
+            params = schedule_create_params(self.day_entry.get(), self.hour_entry.get(), self.minute_entry.get())
         except ValueError:
             CTkMessagebox(title="Error", message="Failed to create a schedule: Please ensure all inputs are numbers.")
             logging.error("Failed to create schedule due to invalid input.")
+            return
+        self.send_command("Schedule.Create", params, self.schedule_created)
+
+    def schedule_created(self, future):
+        """Reports the outcome of a schedule creation."""
+        try:
+            future.result()
+            CTkMessagebox(title="Success", message="The schedule has been created successfully!")
+        except RpcError as e:
+            CTkMessagebox(title="Error", message=f"Failed to create schedule: {e.message}")
+            logging.error(f"Failed to create schedule. {e.message}")
+        except requests.ReadTimeout:
+            # Creating is not retried once sent, so the device may well have created it
+            CTkMessagebox(title="Warning", message="The device did not answer in time. List its schedules to check whether it was created.")
+        except requests.RequestException as e:
+            CTkMessagebox(title="Error", message=f"Failed to create schedule: {e}")
+            logging.error(f"Failed to create schedule. {e}")
 
     def delete_schedule(self):
         """Deletes a schedule based on the provided schedule ID."""
         try:
             schedule_id = int(self.schedule_id_entry.get())
-            response = requests.get(f"http://{self.ip_address}/rpc/Schedule.Delete?id={schedule_id}", timeout=10)
-            data = response.json()
-            if 'code' in data and data['code'] == -103:
+        except ValueError:
+            CTkMessagebox(title="Error", message="Please enter a valid schedule ID number.")
+            return
+        self.send_command("Schedule.Delete", {"id": schedule_id}, self.schedule_deleted)
+
+    def schedule_deleted(self, future):
+        """Reports the outcome of a schedule deletion."""
+        try:
+            future.result()
+            CTkMessagebox(title="Success", message="Schedule deleted successfully!")
+        except RpcError as e:
+            if e.code == -103:
                 CTkMessagebox(title="Warning", message="No schedule found with that ID.")
             else:
-                CTkMessagebox(title="Success", message="Schedule deleted successfully!")
+                CTkMessagebox(title="Error", message=f"Failed to delete schedule: {e.message}")
+        except requests.ReadTimeout:
+            CTkMessagebox(title="Warning", message="The device did not answer in time. List its schedules to check whether it was deleted.")
+        except requests.RequestException as e:
+            CTkMessagebox(title="Error", message=f"Failed to delete schedule: {e}")
+
+class FleetWindow(ctk.CTkToplevel):
+    """A window for running toggle and schedule operations on many devices at once."""
+
+    def __init__(self, collector):
+        super().__init__()
+        self.collector = collector
+        self.groups = read_device_groups(collector.ip_addresses)
+        self.device_vars = {}
+        self.result_labels = {}
+        self.outcomes = {}
+        self.title("Fleet Operations")
+        self.attributes("-topmost", True)
+        self.setup_ui()
+
+    def setup_ui(self):
+        """Set up device selection, operation controls and the results view."""
+        self.main_frame = ctk.CTkFrame(self, border_color='#1f538d', border_width=1)
+        self.main_frame.grid(sticky="nsew")
+        self.grid_columnconfigure(0, weight=1)
+        self.setup_device_selection()
+        self.setup_operation_controls()
+        self.setup_results_view()
+
+    def setup_device_selection(self):
+        """Set up the group selector and one checkbox per device."""
+        select_frame = ctk.CTkFrame(self.main_frame, border_width=1)
+        select_frame.grid(row=0, column=0, rowspan=2, padx=5, pady=5, sticky="nsew")
+        ctk.CTkLabel(select_frame, text="Devices").grid(row=0, column=0, padx=5, pady=5)
+        group_box = ctk.CTkComboBox(select_frame, values=list(self.groups), command=self.select_group, dropdown_fg_color="#1a1a1a")
+        group_box.grid(row=1, column=0, padx=5, pady=5)
+        device_list = ctk.CTkScrollableFrame(select_frame, width=180, height=300)
+        device_list.grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
+        for i, ip_address in enumerate(self.collector.ip_addresses):
+            var = ctk.BooleanVar(value=True)
+            ctk.CTkCheckBox(device_list, text=ip_address, variable=var).grid(row=i, column=0, padx=5, pady=2, sticky="w")
+            self.device_vars[ip_address] = var
+
+    def setup_operation_controls(self):
+        """Set up the buttons and inputs for each fleet operation."""
+        controls = ctk.CTkFrame(self.main_frame, border_width=1)
+        controls.grid(row=0, column=1, padx=5, pady=5, sticky="nsew")
+        ctk.CTkButton(controls, text="Toggle", command=lambda: self.run_operation("Switch.Toggle", {"id": 0})).grid(row=0, column=0, padx=5, pady=5)
+        ctk.CTkButton(controls, text="List Schedules", command=lambda: self.run_operation("Schedule.List")).grid(row=0, column=1, padx=5, pady=5)
+        self.day_entry = ctk.CTkEntry(controls, placeholder_text="Day 1-7")
+        self.day_entry.grid(row=1, column=0, padx=5, pady=5)
+        self.hour_entry = ctk.CTkEntry(controls, placeholder_text="Hour 0-23")
+        self.hour_entry.grid(row=1, column=1, padx=5, pady=5)
+        self.minute_entry = ctk.CTkEntry(controls, placeholder_text="Minute 0-59")
+        self.minute_entry.grid(row=1, column=2, padx=5, pady=5)
+        ctk.CTkButton(controls, text="Create Schedule", command=self.create_schedule).grid(row=1, column=3, padx=5, pady=5)
+        self.schedule_id_entry = ctk.CTkEntry(controls, placeholder_text="JOB ID# of Schedule")
+        self.schedule_id_entry.grid(row=2, column=0, padx=5, pady=5)
+        ctk.CTkButton(controls, text="Delete Schedule", command=self.delete_schedule).grid(row=2, column=1, padx=5, pady=5)
+
+    def setup_results_view(self):
+        """Set up the summary line and per-device result rows."""
+        self.summary_label = ctk.CTkLabel(self.main_frame, text="No operation running")
+        self.summary_label.grid(row=1, column=1, padx=5, pady=(5, 0), sticky="nw")
+        self.results_frame = ctk.CTkScrollableFrame(self.main_frame, width=560, height=260)
+        self.results_frame.grid(row=1, column=1, padx=5, pady=(35, 5), sticky="nsew")
+
+    def select_group(self, group_name):
+        """Check exactly the devices in the chosen group."""
+        members = set(self.groups.get(group_name, []))
+        for ip_address, var in self.device_vars.items():
+            var.set(ip_address in members)
+
+    def create_schedule(self):
+        """Create the same toggle schedule on every selected device."""
+        try:
+            params = schedule_create_params(self.day_entry.get(), self.hour_entry.get(), self.minute_entry.get())
+        except ValueError:
+            CTkMessagebox(title="Error", message="Failed to create a schedule: Please ensure all inputs are numbers.")
+            return
+        self.run_operation("Schedule.Create", params)
+
+    def delete_schedule(self):
+        """Delete a schedule ID on every selected device."""
+        try:
+            schedule_id = int(self.schedule_id_entry.get())
         except ValueError:
             CTkMessagebox(title="Error", message="Please enter a valid schedule ID number.")
+            return
+        self.run_operation("Schedule.Delete", {"id": schedule_id})
+
+    def run_operation(self, method, params=None):
+        """Start a fleet operation on the selected devices and reset the results view."""
+        selected = [ip_address for ip_address, var in self.device_vars.items() if var.get()]
+        if not selected:
+            CTkMessagebox(title="Error", message="Please select at least one device.")
+            return
+        for label in self.result_labels.values():
+            label.destroy()
+        self.result_labels = {}
+        self.outcomes = {}
+        self.method = method
+        for i, ip_address in enumerate(selected):
+            label = ctk.CTkLabel(self.results_frame, text=f"{ip_address}: queued", anchor="w")
+            label.grid(row=i, column=0, padx=5, pady=1, sticky="w")
+            self.result_labels[ip_address] = label
+        self.update_summary()
+        results = self.collector.results  # on_progress runs on the poller loop, so hand updates to the Tk thread
+        self.collector.run_fleet_operation(
+            selected, method, params,
+            on_progress=lambda *outcome: results.put(("callback", None, lambda: self.show_progress(*outcome))))
+
+    def show_progress(self, ip_address, state, detail, latency):
+        """Update one device's row and the summary; runs on the Tk thread."""
+        if not self.winfo_exists() or ip_address not in self.result_labels:
+            return
+        self.outcomes[ip_address] = state
+        text = f"{ip_address}: {state}"
+        if latency is not None:
+            text += f" in {latency * 1000:.0f} ms"
+        if detail:
+            text += f" - {detail}"
+        color = {"ok": "green", "failed": "red", "unknown": "orange"}.get(state, "white")
+        self.result_labels[ip_address].configure(text=text, text_color=color)
+        self.update_summary()
+
+    def update_summary(self):
+        """Show how many devices have finished, succeeded, failed and timed out with an unknown outcome."""
+        states = list(self.outcomes.values())
+        done = states.count("ok") + states.count("failed") + states.count("unknown")
+        summary = f"{self.method}: {done}/{len(self.result_labels)} done, {states.count('ok')} ok, {states.count('failed')} failed"
+        if states.count("unknown"):
+            summary += f", {states.count('unknown')} unknown"
+        self.summary_label.configure(text=summary)
+
+class DiagnosticsWindow(ctk.CTkToplevel):
+    """A window showing where time goes: GUI timings, Tk loop lag, MongoDB writes and per-device RPC health.
+
+    Quantiles cover the last ``WINDOW`` refreshes; counts are totals since start.
+    """
+    REFRESH_MS = 1000
+    WINDOW = 10
+    TIMINGS = {
+        "Process device data": "monitor_process_device_data_seconds",
+        "Render selected tab": "monitor_render_seconds",
+        "Update gauges": "monitor_gauge_render_seconds",
+        "Tk loop lag": "monitor_loop_lag_seconds",
+        "MongoDB batch write": "mongo_write_seconds",
+        "Local store write": "local_store_write_seconds",
+    }
+
+    def __init__(self, collector):
+        super().__init__()
+        self.collector = collector
+        self.snapshots = deque(maxlen=self.WINDOW)
+        self.title("Diagnostics")
+        self.attributes("-topmost", True)
+        self.text = ctk.CTkTextbox(self, width=760, height=420, font=("Courier", 12), wrap="none")
+        self.text.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.refresh()
+
+    def refresh(self):
+        """Redraw the report and schedule the next refresh while the window is open."""
+        if not self.winfo_exists():
+            return
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("end", self.report())
+        self.text.configure(state="disabled")
+        self.snapshots.append(self.snapshot())
+        self.after(self.REFRESH_MS, self.refresh)
+
+    @staticmethod
+    def snapshot():
+        """Return the bucket counts of every histogram series, keyed by metric name and label values."""
+        return {(metric.name, values): series.snapshot()
+                for metric in list(REGISTRY.metrics.values()) if metric.kind == "histogram"
+                for values, series in list(metric.series.items())}
+
+    def quantile(self, name, values, q):
+        """Return a histogram series' quantile over the window in milliseconds, or None."""
+        metric = REGISTRY.metrics.get(name)
+        series = metric.series.get(values) if metric else None
+        if series is None:
+            return None
+        since = self.snapshots[0].get((name, values)) if self.snapshots else None
+        value = series.quantile(q, since)
+        return None if value is None else value * 1000
+
+    @staticmethod
+    def count(name, values):
+        """Return a counter series' total, or 0."""
+        metric = REGISTRY.metrics.get(name)
+        series = metric.series.get(values) if metric else None
+        return series.value if series else 0
+
+    def report(self):
+        """Return the diagnostics as fixed-width text."""
+        def ms(value):
+            return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+        seconds = self.WINDOW * self.REFRESH_MS // 1000
+        lines = [f"{f'Last {seconds} s (ms)':<24}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for label, name in self.TIMINGS.items():
+            lines.append(f"{label:<24}" + "".join(ms(self.quantile(name, (), q)) for q in (0.5, 0.95, 0.99)))
+        method = self.collector.poller.method
+        lines += ["", f"{'Device':<24}{'RPC p50':>9}{'RPC p95':>9}{'Age p50':>9}{'Age p95':>9}{'Retries':>9}{'Timeouts':>9}{'Failed':>9}"]
+        for ip_address in self.collector.ip_addresses:
+            device = (ip_address,)
+            lines.append(f"{ip_address:<24}"
+                         f"{ms(self.quantile('shelly_rpc_latency_seconds', (ip_address, method), 0.5))}"
+                         f"{ms(self.quantile('shelly_rpc_latency_seconds', (ip_address, method), 0.95))}"
+                         f"{ms(self.quantile('shelly_sample_age_seconds', device, 0.5))}"
+                         f"{ms(self.quantile('shelly_sample_age_seconds', device, 0.95))}"
+                         f"{self.count('shelly_rpc_retries_total', device):>9}"
+                         f"{self.count('shelly_rpc_timeouts_total', device):>9}"
+                         f"{self.count('shelly_rpc_failures_total', device):>9}")
+        if self.collector.sample_writer:
+            writer = self.collector.sample_writer
+            storage = "Local store" if self.collector.local_store is not None else "MongoDB"
+            lines += ["", f"{storage}: {writer.written} samples written, {writer.pending.qsize()} pending, {writer.dropped} dropped"]
+        return "\n".join(lines) + "\n"
 
 class MonitoringApp(ctk.CTk):
     """A monitoring application for controlling and monitoring devices."""
+    GAUGE_RANGES = {"Power (W)": 2000, "Current (A)": 20, "Voltage (V)": 240}
+    LOOP_LAG_INTERVAL_MS = 100
+    DISPLAY_METRICS = {
+        "Watts": "apower",
+        "Volts": "voltage",
+        "Amps": "current",
+        "WattHours (Total Wh)": "aenergy.total",
+        "Temp (F)": "temperature.tF"
+    }
+
     def __init__(self):
         super().__init__()
         self.setup_ui()
         self.setup_logging()
         self.read_credentials()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         """Set up the user interface of the application."""
@@ -154,16 +425,33 @@ class MonitoringApp(ctk.CTk):
 
     def setup_tab_view(self):
         """Create and configure the tab view in the main frame."""
-        self.tab_view = ctk.CTkTabview(self.main_frame, fg_color="black", border_width=1, border_color='#1f538d')
+        self.tab_view = ctk.CTkTabview(self.main_frame, fg_color="black", border_width=1, border_color='#1f538d', command=self.on_tab_changed)
         self.tab_view.grid(row=0, column=0, sticky='nsew')
         self.main_frame.grid_rowconfigure(0, weight=1)
         self.main_frame.grid_columnconfigure(0, weight=1)
+        fleet_button = ctk.CTkButton(self.main_frame, text="Fleet Operations", command=self.open_fleet_window)
+        fleet_button.grid(row=1, column=0, pady=5, padx=5, sticky='e')
+        diagnostics_button = ctk.CTkButton(self.main_frame, text="Diagnostics", command=self.open_diagnostics_window)
+        diagnostics_button.grid(row=1, column=0, pady=5, padx=5, sticky='w')
+        self.alert_label = ctk.CTkLabel(self.main_frame, text="", text_color="#ff5555")
+        self.alert_label.grid(row=1, column=0, pady=5, padx=5)
 
     def initialize_data_containers(self):
-        """Initialize containers for status labels, text areas, and gauge labels."""
+        """Initialize containers for status labels, text areas, gauge labels and the latest device samples."""
         self.status_labels = {}
         self.text_areas = {}
         self.gauge_labels = {}
+        self.latest_samples = {}
+        self.pending_toggles = set()
+        self.active_alerts = {}
+        self.tab_frames = {}
+        self.history_charts = {}
+        self.history_fields = {}
+        self.history_requests = {}
+        self.collector = None
+        self.first_frame_seen = False
+        self.history = None
+        self.history_cache = None
 
     def configure_dark_mode(self):
         """Configure the application's appearance mode and color theme."""
@@ -175,30 +463,55 @@ class MonitoringApp(ctk.CTk):
         logging.basicConfig(filename='monitoring.log', level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 
     def read_credentials(self):
-        """Read device IP addresses from the .env file and create tabs for each."""
+        """Read device IP addresses from the .env file and device inventory and create tabs for each."""
         load_dotenv()
-        ip_addresses = [os.getenv(f'IP_ADDRESS_{i}') for i in range(1, 100) if os.getenv(f'IP_ADDRESS_{i}')]
+        inventory = Inventory.from_env()
+        ip_addresses = read_ip_addresses(inventory)
 
         if not ip_addresses:
             self.display_no_ip_warning()
         else:
             for ip_address in ip_addresses:
                 self.create_tab(ip_address)
+            self.build_tab(self.tab_view.get())
+            # Start collecting once the first frame is on screen, so startup never waits on it
+            self.bind("<Expose>", lambda event: self.on_first_frame(ip_addresses, inventory), add="+")
+
+    def on_first_frame(self, ip_addresses, inventory):
+        """Start the collector after the window has been drawn for the first time."""
+        # A flag rather than unbind: before Python 3.13, unbind drops every <Expose> binding of the window
+        if self.first_frame_seen:
+            return
+        self.first_frame_seen = True
+        self.after_idle(self.start_collector, ip_addresses, inventory)
+        self.measure_loop_lag()
+
+    def measure_loop_lag(self, due=None):
+        """Record how late the Tk main loop ran this timer, then set the next one."""
+        now = time.perf_counter()
+        if due is not None:
+            LOOP_LAG.labels().observe(max(0.0, now - due))
+        self.after(self.LOOP_LAG_INTERVAL_MS, self.measure_loop_lag, now + self.LOOP_LAG_INTERVAL_MS / 1000)
 
     def display_no_ip_warning(self):
         """Display a warning message and log if no IP addresses are found."""
-        logging.error("No IP address found in .env file.")
-        CTkMessagebox(title="Error", message="No IP addresses found in the .env file.")
+        logging.error("No IP address found in .env file or device inventory.")
+        CTkMessagebox(title="Error", message="No IP addresses found in the .env file. Use Discover Devices to find them.")
 
     def create_tab(self, ip_address):
-        """Create a new tab for the given IP address and initialize its content."""
-        tab = self.tab_view.add(ip_address)
-        main_frame = self.setup_tab_main_frame(tab)
+        """Create an empty tab for the given IP address; its content is built when it is first selected."""
+        self.tab_view.add(ip_address)
+
+    def build_tab(self, ip_address):
+        """Create the widgets of a device's tab unless they already exist."""
+        if ip_address in self.tab_frames:
+            return
+        main_frame = self.setup_tab_main_frame(self.tab_view.tab(ip_address))
+        self.tab_frames[ip_address] = main_frame
         self.setup_status_label(ip_address, main_frame)
         self.setup_text_areas(ip_address, main_frame)
         self.setup_gauge_labels(ip_address, main_frame)
         self.setup_control_buttons(ip_address, main_frame)
-        self.update_data(ip_address)
 
     def setup_tab_main_frame(self, tab):
         """Create and configure the main frame within a tab."""
@@ -224,7 +537,7 @@ class MonitoringApp(ctk.CTk):
 
     def populate_text_areas(self, ip_address, frame):
         """Create and grid text areas and labels for different types of device data."""
-        labels = ["Watts", "Volts", "Amps", "WattHours (Total Wh)", "Temp (F)"]
+        labels = ["Watts", "Volts", "Amps", "WattHours (Total Wh)", "Temp (F)", "kWh Today", "Cost Today"]
         for i, label in enumerate(labels):
             label_widget = ctk.CTkLabel(frame, text=f"{label}:", fg_color="#333", corner_radius=6)
             label_widget.grid(row=0, column=i, sticky='nsew', padx=5, pady=5)
@@ -233,7 +546,7 @@ class MonitoringApp(ctk.CTk):
             self.text_areas[ip_address][label] = text_area
 
     def setup_gauge_labels(self, ip_address, main_frame):
-        """Initialize and place gauge labels for the given IP address."""
+        """Initialize and place gauge widgets for the given IP address."""
         if ip_address not in self.gauge_labels:
             self.gauge_labels[ip_address] = {}
         gauge_frame = ctk.CTkFrame(main_frame, border_width=1)
@@ -243,10 +556,10 @@ class MonitoringApp(ctk.CTk):
         self.populate_gauge_labels(ip_address, gauge_frame)
 
     def populate_gauge_labels(self, ip_address, frame):
-        """Create and grid labels for different types of gauges."""
-        gauge_types = ["Power (W)", "Current (A)", "Voltage (V)"]
-        for i, gauge_type in enumerate(gauge_types):
-            gauge_label = ctk.CTkLabel(frame, text=gauge_type)
+        """Create and grid a gauge widget for each type of gauge."""
+        bg_color = frame._apply_appearance_mode(frame.cget("fg_color"))
+        for i, (gauge_type, max_value) in enumerate(self.GAUGE_RANGES.items()):
+            gauge_label = GaugeWidget(frame, gauge_type, max_value, bg=bg_color)
             gauge_label.grid(row=0, column=i, sticky='nsew', padx=5, pady=5)
             self.gauge_labels[ip_address][gauge_type] = gauge_label
 
@@ -286,130 +599,257 @@ class MonitoringApp(ctk.CTk):
         combobox.grid(row=3, column=1, pady=5, padx=5)
 
         # Button for additional action 1
-        button2 = ctk.CTkButton(history_frame, text="Select Data Type", command=lambda: self.button_action(ip_address, fd_entry.get(), combobox.get()))
+        button2 = ctk.CTkButton(history_frame, text="Select Data Type", command=lambda: self.button_action(ip_address, fd_entry.get(), td_entry.get(), combobox.get()))
         button2.grid(row=4, column=0, pady=5, padx=5, sticky='nsew', columnspan=2)
 
     def format_ip_address(self, ip_address):
-        return ip_address.replace('.', '_')
+        from timeseries import format_ip_address
+        return format_ip_address(ip_address)
 
 
-    def button_action(self, ip_address, fd_value, combo_value):
-        # Convert the IP address format and other initial setup
-        formatted_ip = self.format_ip_address(ip_address)
-
+    def button_action(self, ip_address, fd_value, td_value, combo_value):
+        """Show the history of a field for the FROM..TO days in the tab's history chart."""
+        import numpy as np
+        from history import day_range
         try:
-            # Attempt to connect to the MongoDB database
-            client = MongoClient('localhost', 27017)
-            db = client[formatted_ip]
-            collection_name = str(fd_value)
-            collection = db[collection_name]
-
-            # Execute the query to retrieve all documents in the collection
-            query_result = collection.find({})
-            results_found = False
-
-            for doc in query_result:
-                if combo_value in doc:
-                    # Print the document's relevant field value
-                    pprint.pprint({combo_value: doc[combo_value]})
-                    results_found = False
-                else:
-                    pprint.pprint({"Message": f"Document does not contain the field '{combo_value}'"})
-
-            if not results_found:
-                print("No documents found in the collection")
-
+            start, end = day_range(fd_value, td_value)
+        except ValueError:
+            CTkMessagebox(title="Error", message="Please enter dates as YYYY_MM_DD.")
+            return
+        chart = self.get_history_chart(ip_address)
+        if self.history_fields.get(ip_address) != combo_value:
+            chart.set_data(np.empty(0), np.empty(0))
+        self.history_fields[ip_address] = combo_value
+        chart.set_view(start.timestamp(), end.timestamp())
+
+    def get_history_chart(self, ip_address):
+        """Return the history chart of a device's tab, creating it on first use."""
+        if ip_address not in self.history_charts:
+            from history_chart import HistoryChart
+            frame = self.tab_frames[ip_address]
+            chart = HistoryChart(frame, lambda start, end: self.load_history(ip_address, start, end),
+                                 bg=frame._apply_appearance_mode(frame.cget("fg_color")))
+            chart.grid(row=4, column=0, columnspan=3, pady=5, padx=5, sticky='nsew')
+            self.history_charts[ip_address] = chart
+        return self.history_charts[ip_address]
+
+    def load_history(self, ip_address, start, end):
+        """Fetch the bucketed history for a chart's visible range (epoch seconds) in the background."""
+        if not self.collector:
+            return
+        field = self.history_fields[ip_address]
+        chart = self.history_charts[ip_address]
+        ring_buffer = self.collector.ring_buffers[ip_address]
+        if ring_buffer.covers(start * 1000):
+            # Recent history is served from memory without a database round-trip
+            times, values = ring_buffer.window(field, start * 1000, end * 1000)
+            self.history_requests[ip_address] = self.history_requests.get(ip_address, 0) + 1
+            chart.set_data(times / 1000, values)
+            return
+        from history import HistoryCache
+        from timeseries import bucket_seconds_for
+        if self.history_cache is None:
+            self.history = self.collector.history_query()
+            if self.history is None:
+                CTkMessagebox(title="Error", message="History storage is disabled (MONGO_URI is empty).")
+                return
+            self.history_cache = HistoryCache(self.history)
+        start, end = datetime.fromtimestamp(start, timezone.utc), datetime.fromtimestamp(end, timezone.utc)
+        bucket_seconds = bucket_seconds_for(start, end, chart.plot_size()[0] * 2)
+        request_id = self.history_requests.get(ip_address, 0) + 1
+        self.history_requests[ip_address] = request_id
+        self.run_in_background(lambda: self.history_cache.fetch(ip_address, field, start, end, bucket_seconds),
+                               lambda future: self.show_history_result(ip_address, request_id, future))
+
+    def show_history_result(self, ip_address, request_id, future):
+        """Plot the averages returned by a history fetch unless a newer fetch has started."""
+        if request_id != self.history_requests.get(ip_address):
+            return
+        try:
+            times, _, _, averages = future.result()
         except Exception as e:
-            print(f"An error occurred: {e}")
+            logging.error(f"History query failed for {ip_address}: {e}")
+            CTkMessagebox(title="Error", message=f"Failed to load history: {e}")
+            return
+        self.history_charts[ip_address].set_data(times, averages)
+
+    def run_in_background(self, func, on_done):
+        """Run ``func`` on the collector's background pool and call ``on_done(future)`` on the Tk thread."""
+        if not self.collector:
+            return None
+        return call_on_tk_thread(self.collector, self.collector.run_in_background(func), on_done)
 
     def toggle_switch(self, ip_address):
-        """Toggle the switch of a device and update the status label."""
+        """Toggle the switch of a device in the background, showing a pending state until it answers."""
+        if not self.collector or ip_address in self.pending_toggles:
+            return
+        self.pending_toggles.add(ip_address)
+        self.status_labels[ip_address].configure(text="SWITCHING...", fg_color="#1f538d")
+        self.send_device_command(ip_address, "Switch.Toggle", lambda future: self.finish_toggle(ip_address, future))
+
+    def finish_toggle(self, ip_address, future):
+        """Update the status label once a toggle command has completed."""
+        self.pending_toggles.discard(ip_address)
         try:
-            response = self.send_device_command(ip_address, "Switch.Toggle")
-            self.update_status_label_after_toggle(ip_address, response)
+            self.update_status_label_after_toggle(ip_address, future.result())
         except requests.RequestException as e:
-            self.handle_request_exception(ip_address, e)
-
-    def send_device_command(self, ip_address, command, retries=3):
-        """Send a command to the device and return the response, with retries."""
-        url = f"http://{ip_address}/rpc/{command}?id=0"
-        for attempt in range(retries):
-            try:
-                return requests.get(url, timeout=10)
-            except requests.RequestException as e:
-                if attempt < retries - 1:  # If not the last attempt, wait and then try again
-                    time.sleep(1)  # Wait for 1 seconds before retrying
-                    continue
-                else:  # If the last attempt also fails, log the error and raise the exception
-                    logging.error(f"Error fetching data for {ip_address}: {e}")
-                    raise
+            self.show_command_failure(ip_address, "toggle", e)
+
+    def send_device_command(self, ip_address, command, on_done):
+        """Send a command to the device without blocking and call ``on_done(future)`` on the Tk thread.
 
-    def update_status_label_after_toggle(self, ip_address, response):
-        """Update the status label based on the toggle switch response."""
-        if '{"was_on":false}' in response.text:
+        Retries with backoff happen on the poller's event loop rather than by sleeping in a thread.
+        """
+        if not self.collector:
+            return None
+        return call_on_tk_thread(self.collector, self.collector.call(ip_address, command, {"id": 0}), on_done)
+
+    def update_status_label_after_toggle(self, ip_address, result):
+        """Update the status label based on the toggle switch result."""
+        if result.get("was_on") is False:
             self.status_labels[ip_address].configure(text="OUTLET POWER IS ON", fg_color="green")
-        elif '{"was_on":true}' in response.text:
+        elif result.get("was_on") is True:
             self.status_labels[ip_address].configure(text="OUTLET POWER IS OFF", fg_color="red")
 
     def update_switch_status(self, ip_address):
-        """Update the switch status label based on the device's current state."""
+        """Refresh the switch status label from the device's current state in the background."""
+        self.send_device_command(ip_address, "Switch.GetStatus", lambda future: self.show_switch_status(ip_address, future))
+
+    def show_switch_status(self, ip_address, future):
+        """Update the switch status label from a completed status request."""
         try:
-            response = self.send_device_command(ip_address, "Switch.GetStatus")
-            is_on = response.json().get("output", False)  # Get the 'output' value, default to False if not found
-            self.status_labels[ip_address].configure(text="OUTLET POWER IS ON" if is_on else "OUTLET POWER IS OFF")
-            color = "green" if is_on else "red"
-            self.status_labels[ip_address].configure(text=text, fg_color=color)
+            is_on = future.result().get("output", False)  # Get the 'output' value, default to False if not found
+            self.update_status_label_from_data(ip_address, is_on)
         except requests.RequestException as e:
-            self.handle_request_exception(ip_address, e)
+            self.show_command_failure(ip_address, "read switch", e)
 
-    def open_schedule_window(self, ip_address):
-        """Open the schedule setting window for the given IP address."""
-        ScheduleSettingWindow(ip_address)
-        pass
-
-    def update_data(self, ip_address):
-        """Fetch and display new data for the given IP address."""
-        def fetch_data():
-            try:
-                response = self.send_device_command(ip_address, "Switch.GetStatus")
-                if response.status_code == 200:
-                    self.process_device_data(ip_address, response.json())
-            except requests.RequestException as e:
-                self.handle_request_exception(ip_address, e)
-                # Re-schedule the update after a delay if there's an error
-                self.after(5000, lambda: self.update_data(ip_address))
-
-        # Start fetching data in a new thread
-        thread = threading.Thread(target=fetch_data)
-        thread.daemon = True  # Daemonize thread
-        thread.start()
-
-    def process_device_data(self, ip_address, data):
-        """Process and display device data."""
-        # Define default metrics to be used if data fetch fails or is incomplete
-        default_metrics = {
-            "Watts": 0,
-            "Volts": 0,
-            "Amps": 0,
-            "WattHours (Total Wh)": 0,
-            "Temp (F)": 0
-        }
+    def show_command_failure(self, ip_address, action, e):
+        """Log a failed user command and show it on the status label until the next sample.
 
-        if data:  # If there's valid data, update accordingly
-            device_metrics = {
-                "Watts": data.get("apower", 0),
-                "Volts": data.get("voltage", 0),
-                "Amps": data.get("current", 0),
-                "WattHours (Total Wh)": data.get("aenergy", {}).get('total', 0),
-                "Temp (F)": data.get("temperature", {}).get('tF', 0)
-            }
-        else:  # If data is missing or fetch failed, use default metrics
-            device_metrics = default_metrics
+        The cached poll sample is kept: a command timing out says nothing about whether polling still works.
+        """
+        logging.error(f"Failed to {action} {ip_address}: {e}")
+        self.status_labels[ip_address].configure(text=f"COULD NOT {action.upper()}", fg_color="orange")
 
+    def open_schedule_window(self, ip_address):
+        """Open the schedule setting window for the given IP address."""
+        if self.collector:
+            ScheduleSettingWindow(ip_address, self.collector)
+
+    def open_fleet_window(self):
+        """Open the window for running operations across many devices."""
+        if self.collector:
+            FleetWindow(self.collector)
+
+    def open_diagnostics_window(self):
+        """Open the window showing timings, loop lag and per-device RPC health."""
+        if self.collector:
+            DiagnosticsWindow(self.collector)
+
+    def start_collector(self, ip_addresses, inventory=None):
+        """Start the in-process collector for all devices and begin draining its results."""
+        from collector import Collector
+        self.collector = Collector.from_env(ip_addresses, inventory=inventory)
+        self.collector.start()
+        self.drain_poll_results()
+
+    def on_close(self):
+        """Stop collecting and flush buffered samples before closing the window."""
+        if self.collector:
+            self.collector.stop()
+        self.destroy()
+
+    def drain_poll_results(self, budget=0.008):
+        """Apply queued poll results on the Tk thread in batches.
+
+        Every result is cached, but only the selected tab's widgets are redrawn.
+        Each batch stops after ``budget`` seconds so a backlog never stalls a frame;
+        the rest is picked up on the next, immediate, pass.
+        """
+        updated = set()
+        deadline = time.perf_counter() + budget
+        delay = 100
+        try:
+            while True:
+                if time.perf_counter() > deadline:
+                    delay = 1
+                    break
+                kind, ip_address, payload = self.collector.results.get_nowait()
+                if kind == "callback":
+                    try:
+                        payload()
+                    except Exception:  # One failing callback, e.g. on a destroyed widget, must not end the pass
+                        logging.exception("Background task callback failed")
+                    continue
+                if kind == "alert":
+                    self.show_alert(payload)
+                    continue
+                if kind == "data":
+                    self.process_device_data(ip_address, payload)
+                else:
+                    self.handle_request_exception(ip_address, payload)
+                updated.add(ip_address)
+        except queue.Empty:
+            pass
+        finally:
+            visible_ip = self.tab_view.get()
+            if visible_ip in updated:
+                self.render_device(visible_ip)
+            self.after(delay, self.drain_poll_results)
+
+    def on_tab_changed(self):
+        """Build the newly selected tab on its first selection and bring it up to date from its latest cached sample."""
+        ip_address = self.tab_view.get()
+        self.build_tab(ip_address)
+        self.render_device(ip_address)
+
+    def process_device_data(self, ip_address, status):
+        """Extract the display metrics from a DeviceStatus sample and cache it as the device's latest state."""
+        from collector import extract_metrics
+        started = time.perf_counter()
+        metrics = extract_metrics(status)
+        device_metrics = {label: metrics[name] for label, name in self.DISPLAY_METRICS.items()}
+        kwh, cost = self.collector.energy.totals(ip_address, "day")
+        device_metrics["kWh Today"] = f"{kwh:.3f}"
+        device_metrics["Cost Today"] = f"{cost:.2f}"
+        self.latest_samples[ip_address] = {"metrics": device_metrics, "status": status, "error": None}
+        PROCESS_SECONDS.labels().observe(time.perf_counter() - started)
+
+    def show_alert(self, alert):
+        """Show a firing alert below the tabs, and clear it when that alert resolves."""
+        self.active_alerts[(alert.device, alert.rule)] = alert
+        if alert.state == "resolved":
+            del self.active_alerts[(alert.device, alert.rule)]
+        latest = max(self.active_alerts.values(), key=lambda active: active.timestamp, default=None)
+        text = f"{latest.rule} on {latest.device}: {latest.message}" if latest else ""
+        if len(self.active_alerts) > 1:
+            text += f" (+{len(self.active_alerts) - 1} more)"
+        self.alert_label.configure(text=text)
+
+    def render_device(self, ip_address):
+        """Update a device's widgets from its latest cached sample."""
+        sample = self.latest_samples.get(ip_address)
+        if sample is None or ip_address not in self.tab_frames:
+            return
+        started = time.perf_counter()
+        try:
+            self.redraw_device(ip_address, sample)
+        finally:
+            RENDER_SECONDS.labels().observe(time.perf_counter() - started)
+
+    def redraw_device(self, ip_address, sample):
+        """Apply a cached sample to a built tab's status label, text areas and gauges."""
+        health = self.collector.poller.health[ip_address].describe()
+        if sample["error"] is not None:
+            # Set UI elements to show '0' and 'Disconnected' along with the circuit state
+            self.set_device_data_to_zero(ip_address)
+            self.status_labels[ip_address].configure(text=f"Disconnected\n{health}", fg_color="grey")
+            return
+        device_metrics = sample["metrics"]
         self.update_text_areas_with_data(ip_address, device_metrics)
-        self.update_status_label_from_data(ip_address, data if data else {})
+        if ip_address not in self.pending_toggles:
+            self.update_status_label_from_data(ip_address, sample["status"].output, health)
         self.update_gauge_charts(ip_address, device_metrics["Watts"], device_metrics["Amps"], device_metrics["Volts"])
-        self.schedule_data_update(ip_address)
 
     def update_text_areas_with_data(self, ip_address, metrics):
         """Update the text areas with new device metrics."""
@@ -417,71 +857,38 @@ class MonitoringApp(ctk.CTk):
             value_label = self.text_areas[ip_address][metric]
             value_label.configure(text=str(value))
 
-    def update_status_label_from_data(self, ip_address, data):
-        """Update the status label based on the device's power status."""
-        is_on = data.get("output", False)
+    def update_status_label_from_data(self, ip_address, is_on, health=None):
+        """Update the status label based on the device's power status and, if given, its health line."""
         color = "green" if is_on else "red"
-        self.status_labels[ip_address].configure(text="OUTLET POWER IS ON" if is_on else "OUTLET POWER IS OFF", fg_color=color)
+        text = "OUTLET POWER IS ON" if is_on else "OUTLET POWER IS OFF"
+        if health:
+            text += f"\n{health}"
+        self.status_labels[ip_address].configure(text=text, fg_color=color)
 
     def update_gauge_charts(self, ip_address, power, current, voltage):
-        """Update gauge charts with the latest data."""
+        """Update gauge widgets with the latest data."""
+        started = time.perf_counter()
         gauges = {
-            "Power (W)": (power, 2000),
-            "Current (A)": (current, 20),
-            "Voltage (V)": (voltage, 240)
+            "Power (W)": power,
+            "Current (A)": current,
+            "Voltage (V)": voltage
         }
-        for gauge_type, (value, max_value) in gauges.items():
-            self.update_gauge_chart(value, self.gauge_labels[ip_address][gauge_type], gauge_type, max_value)
-
-    def update_gauge_chart(self, value, label, title, max_value):
-        """Update a single gauge chart."""
-        fig = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=value,
-            title={'text': title, 'font': {'color': 'white', 'size': 36}, 'align': 'left'},
-            gauge={
-                'axis': {'range': [None, max_value], 'showticklabels': True, 'tickcolor': "white", 'tickfont': {'color': 'white', 'size': 16}},
-                'bar': {'color': "#1f538d"},
-                'bgcolor': "#333333",
-                'steps': [{'range': [0, max_value * 0.5], 'color': "lightgray"}, {'range': [max_value * 0.5, max_value], 'color': "gray"}],
-                'threshold': {'line': {'color': "black", 'width': 2}, 'thickness': 1, 'value': value}
-            },
-            number={'font': {'color': 'white', 'size': 75}}
-        ))
-        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', margin={'t': 20, 'b': 20, 'l': 50, 'r': 50})
-        self.display_gauge_chart(fig, label)
-
-    def display_gauge_chart(self, fig, label):
-        """Display the gauge chart on the specified label."""
-        label.configure(text="")  # Clear previous text
-        img_bytes = fig.to_image(format="png")
-        img = Image.open(io.BytesIO(img_bytes))
-        img_tk = ctk.CTkImage(dark_image=img, size=(230,147))
-        label.configure(image=img_tk)
-        label.image = img_tk  # Keep a reference to avoid garbage collection
-
-    def schedule_data_update(self, ip_address):
-        """Schedule the next data update for the given IP address."""
-        self.after(1000, lambda: self.update_data(ip_address))
+        for gauge_type, value in gauges.items():
+            self.gauge_labels[ip_address][gauge_type].set_value(value)
+        GAUGE_SECONDS.labels().observe(time.perf_counter() - started)
 
     def set_device_data_to_zero(self, ip_address):
         # Set text areas to zero
         for metric in self.text_areas[ip_address]:
-            text_area = self.text_areas[ip_address][metric]
-            text_area.delete("1.0", "end")
-            text_area.insert("1.0", "0")
-        # Set gauge labels or charts to zero or clear them
-        for gauge_type in self.gauge_labels[ip_address]:
-            # This part depends on how you want to represent a disconnected state in your gauges.
-            # For simplicity, you might just update the label, but you could also update the gauge charts themselves.
-            self.gauge_labels[ip_address][gauge_type].configure(text=f"{gauge_type}: 0")
+            self.text_areas[ip_address][metric].configure(text="0")
+        # Set gauges back to zero
+        for gauge in self.gauge_labels[ip_address].values():
+            gauge.set_value(0)
 
     def handle_request_exception(self, ip_address, e):
-        """Log and display errors encountered when fetching data for a device."""
+        """Log errors encountered when fetching data for a device and cache the disconnected state."""
         logging.error(f"Error fetching data for {ip_address}: {e}")
-        # Set UI elements to show '0' or 'Disconnected' or similar
-        self.set_device_data_to_zero(ip_address)
-        self.status_labels[ip_address].configure(text="Disconnected", fg_color="grey")
+        self.latest_samples[ip_address] = {"metrics": None, "status": None, "error": e}
 
 
 if __name__ == "__main__":
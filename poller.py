@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from health import DeviceHealth
+from metrics import REGISTRY
+from status import DeviceStatus
+
+SAMPLE_AGE = REGISTRY.histogram("shelly_sample_age_seconds", "Time from a device stamping a sample (sys.unixtime, or a notification's ts) to its publication.", ("device",))
+
+# How each status method is requested and parsed into a DeviceStatus
+STATUS_METHODS = {
+    "Switch.GetStatus": ({"id": 0}, DeviceStatus.from_switch_status),
+    "Shelly.GetStatus": (None, DeviceStatus.from_shelly_status),
+}
+
+
+class DevicePoller:
+    """Polls every configured device from one background asyncio event loop.
+
+    Each device runs as a coroutine on a fixed-rate schedule with its own phase
+    offset, so request latency does not push the period out. Requests go through
+    the shared RPC client on a bounded worker pool, which keeps the thread count
+    flat regardless of how many devices are configured. Results are put on
+    ``self.results`` as ``(kind, ip_address, payload)`` tuples for the GUI
+    thread to drain, unless ``keep_results`` is off. Each successful sample is
+    parsed once into a ``DeviceStatus`` and also handed to every callable in
+    ``sample_sinks`` as ``sink(ip_address, status)``. Sinks run on the event
+    loop and must not block.
+
+    ``method`` is ``Switch.GetStatus`` (switch fields only) or
+    ``Shelly.GetStatus``, which also returns sys, wifi and cloud state in the
+    same request.
+
+    Each device has a ``DeviceHealth`` circuit breaker that sets its poll
+    interval: adaptive while healthy, backing off exponentially while the
+    device is unreachable.
+
+    Other sources on the loop (such as push notifications) can feed samples
+    through ``publish`` and slow a device's polling down with ``set_interval``.
+    With ``poll`` off, no device is polled: the loop only serves calls and
+    samples published from elsewhere, such as sharded worker processes.
+    """
+
+    def __init__(self, ip_addresses, client, method="Switch.GetStatus", interval=1.0, error_interval=5.0, jitter=0.05, max_workers=16, keep_results=True,
+                 steady_interval=5.0, off_interval=10.0, poll=True):
+        self.ip_addresses = list(ip_addresses)
+        self.client = client
+        self.method = method
+        self.params, self.parse = STATUS_METHODS[method]
+        self.interval = interval
+        self.health = {ip_address: DeviceHealth(interval=interval, steady_interval=steady_interval, off_interval=off_interval, backoff_base=error_interval)
+                       for ip_address in self.ip_addresses}
+        self.poll = poll
+        self.jitter = jitter
+        self.results = queue.Queue() if keep_results else None
+        self.sample_sinks = []
+        self.latest = {}
+        self.wakeups = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="poller")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_loop, name="poller-loop", daemon=True)
+
+    def start(self):
+        """Start the event loop thread and begin polling all devices."""
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        """Cancel all tasks on the loop, stop it and release the worker pool."""
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+            self.thread.join(timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def shutdown(self):
+        """Cancel every other task on the loop, wait for them to finish and stop the loop."""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the poller's loop from any thread and return its future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, ip_address, method, params=None, retries=None):
+        """Return a coroutine performing an RPC call on the poller's worker pool."""
+        return self.client.call_async(ip_address, method, params, executor=self.executor, retries=retries)
+
+    def publish(self, ip_address, status):
+        """Record a device's latest DeviceStatus and hand it to the GUI queue and sample sinks."""
+        if status.unixtime is not None:
+            SAMPLE_AGE.labels(ip_address).observe(max(0.0, time.time() - status.unixtime))
+        self.latest[ip_address] = status
+        self.post(("data", ip_address, status))
+        for sink in self.sample_sinks:
+            sink(ip_address, status)
+
+    def post(self, item):
+        """Queue a result for the GUI thread, if anyone is draining results."""
+        if self.results is not None:
+            self.results.put(item)
+
+    def set_interval(self, ip_address, seconds=None):
+        """Override a device's poll interval, or restore the default with None; must run on the loop."""
+        self.health[ip_address].interval_override = seconds
+        self.wake(ip_address)
+
+    def wake(self, ip_address):
+        """Make a device's polling task poll immediately; must run on the loop."""
+        if ip_address in self.wakeups:
+            self.wakeups[ip_address].set()
+
+    def run_loop(self):
+        """Run the event loop with one polling task per device (none with ``poll`` off)."""
+        asyncio.set_event_loop(self.loop)
+        if self.poll:
+            for ip_address in self.ip_addresses:
+                self.loop.create_task(self.poll_device(ip_address))
+        self.loop.run_forever()
+
+    async def poll_device(self, ip_address):
+        """Poll a single device forever at the rate its health state allows."""
+        # Spread devices across the period so requests do not all fire at once
+        await asyncio.sleep(random.uniform(0, self.interval))
+        wakeup = self.wakeups[ip_address] = asyncio.Event()
+        next_tick = self.loop.time()
+        health = self.health[ip_address]
+        while True:
+            health.begin_attempt()
+            try:
+                result = await self.call(ip_address, self.method, self.params, retries=health.retries)
+                status = self.parse(result)
+                health.record_success(status)
+                self.publish(ip_address, status)
+            except requests.RequestException as e:
+                health.record_failure()
+                self.post(("error", ip_address, e))
+            except Exception as e:  # Keep the device's task alive on unexpected errors
+                logging.error(f"Unexpected error polling {ip_address}: {e}")
+                health.record_failure()
+                self.post(("error", ip_address, e))
+
+            period = health.interval_override or health.next_delay()
+            next_tick += period
+            now = self.loop.time()
+            if next_tick < now:  # Overran one or more periods, skip to the next slot
+                next_tick += ((now - next_tick) // period + 1) * period
+            try:
+                await asyncio.wait_for(wakeup.wait(), next_tick - now + random.uniform(0, self.jitter))
+                wakeup.clear()
+                next_tick = self.loop.time()
+            except asyncio.TimeoutError:
+                pass
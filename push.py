@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+import random
+import uuid
+
+import websockets
+
+from status import DeviceStatus
+
+
+class PushListener:
+    """Receives status changes from devices over the Gen2 WebSocket RPC channel.
+
+    One connection per device is kept open on the poller's event loop. The
+    initial ``Shelly.GetStatus`` reply seeds the cached state and each
+    ``NotifyStatus`` delta is applied to a copy of it and published as a new
+    sample. While a device's channel is up, its HTTP polling slows down to
+    ``reconcile_interval`` as a fallback; when the channel drops, normal
+    polling resumes until it reconnects.
+    """
+
+    def __init__(self, poller, component="switch:0", reconcile_interval=60.0, reconnect_max=60.0):
+        self.poller = poller
+        self.component = component
+        self.reconcile_interval = reconcile_interval
+        self.reconnect_max = reconnect_max
+        self.src = f"shelly-monitor-{uuid.uuid4().hex[:8]}"
+        self.connected = set()
+
+    def start(self):
+        """Open a notification channel to every device on the poller's loop."""
+        for ip_address in self.poller.ip_addresses:
+            self.poller.submit(self.listen(ip_address))
+
+    async def listen(self, ip_address):
+        """Keep a device's channel open, reconnecting with backoff when it drops."""
+        delay = 1.0
+        while True:
+            try:
+                async with websockets.connect(f"ws://{self.poller.client.resolve(ip_address)}/rpc", open_timeout=10, ping_interval=30) as channel:
+                    # Devices only send notifications to peers that have identified themselves with a request
+                    request = {"id": 1, "src": self.src, "method": "Shelly.GetStatus"}
+                    await channel.send(json.dumps(request))
+                    self.connected.add(ip_address)
+                    self.poller.health[ip_address].push_active = True
+                    self.poller.set_interval(ip_address, self.reconcile_interval)
+                    delay = 1.0
+                    async for message in channel:
+                        self.handle_frame(ip_address, json.loads(message))
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException, ValueError) as e:
+                logging.error(f"Notification channel to {ip_address} failed: {e}")
+            finally:
+                if ip_address in self.connected:
+                    self.connected.discard(ip_address)
+                    self.poller.health[ip_address].push_active = False
+                    self.poller.set_interval(ip_address, None)
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, self.reconnect_max)
+
+    def handle_frame(self, ip_address, frame):
+        """Apply an RPC reply or notification frame to the device's cached state."""
+        if frame.get("id") == 1 and isinstance(frame.get("result"), dict):
+            self.poller.publish(ip_address, DeviceStatus.from_shelly_status(frame["result"], self.component))
+        elif frame.get("method") in ("NotifyStatus", "NotifyFullStatus"):
+            params = frame.get("params", {})
+            if params.get(self.component):
+                state = self.poller.latest.get(ip_address) or DeviceStatus()
+                self.poller.publish(ip_address, state.with_notification(params, self.component))
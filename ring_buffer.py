@@ -0,0 +1,109 @@
+import threading
+import time
+
+import numpy as np
+
+# Metrics kept per device, named like the history fields so either source can serve a query,
+# mapped to the DeviceStatus attribute holding each one
+METRIC_ATTRIBUTES = {
+    "apower": "apower",
+    "voltage": "voltage",
+    "current": "current",
+    "aenergy.total": "aenergy_total",
+    "temperature.tF": "temperature_f",
+}
+METRICS = tuple(METRIC_ATTRIBUTES)
+# Cumulative counters grow past float32's ~7 significant digits and would lose whole watt-hours
+COUNTERS = ("aenergy.total",)
+
+
+def extract_metric(status, name):
+    """Read a metric by its history field name (e.g. ``aenergy.total``) from a DeviceStatus."""
+    return getattr(status, METRIC_ATTRIBUTES[name])
+
+
+class RingBuffer:
+    """Fixed-memory time series of recent samples for one device.
+
+    Timestamps (epoch milliseconds) live in an int64 array and each metric in a
+    float32 array (float64 for counters), all preallocated to ``capacity``
+    entries (24 h at 1 Hz by default). New samples overwrite the oldest once
+    full.
+    """
+
+    def __init__(self, capacity=86400, metrics=METRICS):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = {name: np.full(capacity, np.nan, dtype=np.float64 if name in COUNTERS else np.float32) for name in metrics}
+        self.head = 0  # Next slot to write
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, status, timestamp_ms=None):
+        """Store the metrics of a DeviceStatus sample; out-of-order samples are ignored."""
+        timestamp_ms = int(time.time() * 1000) if timestamp_ms is None else timestamp_ms
+        with self.lock:
+            if self.count and timestamp_ms <= self.times[self.head - 1]:
+                return False
+            for name, column in self.values.items():
+                column[self.head] = extract_metric(status, name)
+            self.times[self.head] = timestamp_ms
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def segments(self):
+        """Return the (start, stop) slices holding samples in chronological order."""
+        if self.count < self.capacity:
+            return [(0, self.count)]
+        return [(self.head, self.capacity), (0, self.head)]
+
+    def oldest_time(self):
+        """Return the timestamp (ms) of the oldest stored sample, or None when empty."""
+        with self.lock:
+            if not self.count:
+                return None
+            return int(self.times[self.segments()[0][0]])
+
+    def latest(self):
+        """Return ``(timestamp_ms, {metric: value})`` for the newest sample, or None when empty."""
+        with self.lock:
+            if not self.count:
+                return None
+            index = self.head - 1
+            return int(self.times[index]), {name: float(column[index]) for name, column in self.values.items()}
+
+    def window(self, name, start_ms, end_ms):
+        """Return copies of ``(times_ms, values)`` for one metric in [start_ms, end_ms)."""
+        with self.lock:
+            times, values = [], []
+            for lo, hi in self.segments():
+                segment = self.times[lo:hi]
+                first, last = np.searchsorted(segment, [start_ms, end_ms])
+                times.append(segment[first:last])
+                values.append(self.values[name][lo:hi][first:last])
+            return np.concatenate(times), np.concatenate(values)
+
+    def covers(self, start_ms):
+        """Return True if the buffer holds every sample from ``start_ms`` onwards."""
+        oldest = self.oldest_time()
+        return oldest is not None and oldest <= start_ms
+
+    def stats(self, name, start_ms, end_ms):
+        """Return min, max and mean of a metric over [start_ms, end_ms), or None without samples."""
+        _, values = self.window(name, start_ms, end_ms)
+        if not len(values) or np.isnan(values).all():
+            return None
+        return float(np.nanmin(values)), float(np.nanmax(values)), float(np.nanmean(values))
+
+    def rate(self, name, seconds):
+        """Return the average change per second of a metric over the last ``seconds``."""
+        latest = self.latest()
+        if latest is None:
+            return None
+        times, values = self.window(name, latest[0] - seconds * 1000, latest[0] + 1)
+        valid = ~np.isnan(values)
+        if valid.sum() < 2:
+            return None
+        times, values = times[valid], values[valid]
+        return float(values[-1] - values[0]) / ((times[-1] - times[0]) / 1000)
@@ -0,0 +1,234 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from history import EPOCH, ROLLUP_FIELDS, ROLLUP_LEVELS, HistoryQuery, as_utc
+from timeseries import format_ip_address, parse_day
+
+
+def floor_time(value, seconds):
+    """Round an aware datetime down to a multiple of ``seconds`` since the epoch."""
+    return datetime.fromtimestamp(value.timestamp() // seconds * seconds, timezone.utc)
+
+
+class Compactor:
+    """Keeps the 1-minute, 15-minute and 1-hour rollups of every device up to date.
+
+    Each pass aggregates the completed buckets since a level's watermark (kept
+    in the device database's ``rollup_state`` collection) from the level below:
+    raw day collections feed ``rollup_1m``, which feeds ``rollup_15m``, which
+    feeds ``rollup_1h``. A rollup document holds the sample count, the
+    min/max/mean/last of apower, voltage and current, the energy used in Wh
+    and the aenergy counter reading at its end. Buckets are upserted by
+    timestamp, so rerunning a range is harmless.
+
+    Buckets are only closed ``settle`` seconds after they end, giving the
+    buffered sample writer time to flush. With a ``writer``, watermarks are
+    also held back to its oldest unwritten sample, so a backlog built up while
+    MongoDB was unavailable still lands ahead of the watermark. With ``raw_retention_days``, day
+    collections older than that are dropped once compacted; with
+    ``rollup_retention_days`` (per level), rollups expire through a TTL index.
+    """
+
+    def __init__(self, client, ip_addresses, interval=60.0, settle=30.0, raw_retention_days=None,
+                 rollup_retention_days=None, max_pass_seconds=86400, writer=None):
+        self.client = client
+        self.ip_addresses = list(ip_addresses)
+        self.interval = interval
+        self.settle = settle
+        self.raw_retention_days = raw_retention_days
+        self.rollup_retention_days = rollup_retention_days or {}
+        self.max_pass_seconds = max_pass_seconds
+        self.writer = writer
+        self.history = HistoryQuery(client)
+        self.prepared = set()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="compactor", daemon=True)
+
+    def start(self):
+        """Start the background compaction thread."""
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the compaction thread after its current pass."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def run(self):
+        """Compact every device once per ``interval`` until stopped."""
+        while not self.stopping.is_set():
+            for ip_address in self.ip_addresses:
+                try:
+                    self.compact(ip_address)
+                except PyMongoError as e:
+                    logging.error(f"Failed to compact samples of {ip_address}: {e}")
+                if self.stopping.is_set():
+                    return
+            self.stopping.wait(self.interval)
+
+    def compact(self, ip_address, now=None):
+        """Bring every rollup level of a device up to date and apply raw retention."""
+        now = now or datetime.now(timezone.utc)
+        db = self.client[format_ip_address(ip_address)]
+        source_until = now - timedelta(seconds=self.settle)
+        oldest_unwritten = self.writer.oldest_unwritten() if self.writer is not None else None
+        if oldest_unwritten is not None:
+            source_until = min(source_until, oldest_unwritten)
+        source = None
+        for name, seconds in ROLLUP_LEVELS:
+            self.prepare(db, name)
+            until = floor_time(source_until, seconds)
+            if source is None:
+                self.compact_level(db, name, seconds, until, lambda start, end: self.aggregate_raw(ip_address, db[name], start, end, seconds))
+            else:
+                source_name = source
+                self.compact_level(db, name, seconds, until, lambda start, end: self.aggregate_rollups(db[source_name], start, end, seconds))
+            state = db.rollup_state.find_one({"_id": name})
+            if state is None:
+                return  # Nothing compacted yet, so the next level has no source
+            source, source_until = name, as_utc(state["until"])
+        self.expire_raw(ip_address, now)
+
+    def prepare(self, db, name):
+        """Index a rollup collection by timestamp, with a TTL when its retention is configured."""
+        if (db.name, name) in self.prepared:
+            return
+        retention = self.rollup_retention_days.get(name)
+        if retention:
+            db[name].create_index([("timestamp", ASCENDING)], unique=True, expireAfterSeconds=int(retention * 86400))
+        else:
+            db[name].create_index([("timestamp", ASCENDING)], unique=True)
+        self.prepared.add((db.name, name))
+
+    def compact_level(self, db, name, seconds, until, aggregate):
+        """Write the buckets of one level between its watermark and ``until``, a day at a time."""
+        state = db.rollup_state.find_one({"_id": name})
+        start = as_utc(state["until"]) if state else self.first_source_time(db, name)
+        if start is None:
+            return
+        start = floor_time(start, seconds)
+        while start < until and not self.stopping.is_set():
+            end = min(until, start + timedelta(seconds=self.max_pass_seconds))
+            for document in aggregate(start, end):
+                db[name].replace_one({"timestamp": document["timestamp"]}, document, upsert=True)
+            db.rollup_state.replace_one({"_id": name}, {"_id": name, "until": end}, upsert=True)
+            start = end
+
+    def first_source_time(self, db, name):
+        """Return when a level's source data begins, or None if there is none yet."""
+        level_names = [level[0] for level in ROLLUP_LEVELS]
+        index = level_names.index(name)
+        if index:
+            first = db[level_names[index - 1]].find_one(sort=[("timestamp", ASCENDING)])
+            return as_utc(first["timestamp"]) if first else None
+        days = sorted(collection for collection in db.list_collection_names() if self.is_day_collection(collection))
+        return parse_day(days[0]).astimezone(timezone.utc) if days else None
+
+    @staticmethod
+    def is_day_collection(name):
+        """Return whether a collection name is a raw YYYY_MM_DD day collection."""
+        try:
+            parse_day(name)
+            return True
+        except ValueError:
+            return False
+
+    def aggregate_raw(self, ip_address, rollup, start, end, seconds):
+        """Return rollup documents for [start, end) computed from raw day collections.
+
+        ``rollup`` is the collection being filled, whose last bucket before
+        ``start`` gives the counter reading the first new bucket's energy starts from.
+        """
+        bucket_ms = seconds * 1000
+        group = {"_id": {"$subtract": ["$t", {"$mod": ["$t", bucket_ms]}]}, "count": {"$sum": 1},
+                 "first_total": {"$first": "$aenergy.total"}, "last_total": {"$last": "$aenergy.total"}}
+        for field in ROLLUP_FIELDS:
+            group.update({f"{field}_min": {"$min": f"${field}"}, f"{field}_max": {"$max": f"${field}"},
+                          f"{field}_mean": {"$avg": f"${field}"}, f"{field}_last": {"$last": f"${field}"}})
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            {"$sort": {"timestamp": 1}},
+            {"$addFields": {"t": {"$subtract": ["$timestamp", EPOCH]}}},
+            {"$group": group},
+        ]
+        buckets = {}
+        for collection in self.history.day_collections(ip_address, start, end):
+            for row in collection.aggregate(pipeline):
+                # A bucket straddling two day collections keeps the later part's last values
+                key = int(row["_id"])
+                if key in buckets:
+                    row = self.merge_partial(buckets[key], row)
+                buckets[key] = row
+
+        documents = []
+        previous = rollup.find_one({"timestamp": {"$lt": start}}, sort=[("timestamp", DESCENDING)])
+        previous_total = previous.get("total") if previous else None
+        for key, row in sorted(buckets.items()):
+            first_total, last_total = row["first_total"] or 0.0, row["last_total"] or 0.0
+            # Energy since the previous bucket's last reading; a drop means the counter restarted
+            baseline = first_total if previous_total is None or previous_total > last_total else previous_total
+            energy = last_total - baseline if last_total >= baseline else last_total
+            previous_total = last_total
+            document = {"timestamp": datetime.fromtimestamp(key / 1000, timezone.utc), "count": row["count"],
+                        "energy": energy, "total": last_total}
+            for field in ROLLUP_FIELDS:
+                document[field] = {"min": row[f"{field}_min"], "max": row[f"{field}_max"],
+                                   "mean": row[f"{field}_mean"], "last": row[f"{field}_last"]}
+            documents.append(document)
+        return documents
+
+    @staticmethod
+    def merge_partial(earlier, later):
+        """Combine the two parts of a raw bucket split across day collections."""
+        merged = dict(later)
+        merged["count"] = earlier["count"] + later["count"]
+        merged["first_total"] = earlier["first_total"]
+        for field in ROLLUP_FIELDS:
+            merged[f"{field}_min"] = min(earlier[f"{field}_min"], later[f"{field}_min"])
+            merged[f"{field}_max"] = max(earlier[f"{field}_max"], later[f"{field}_max"])
+            merged[f"{field}_mean"] = (earlier[f"{field}_mean"] * earlier["count"] +
+                                       later[f"{field}_mean"] * later["count"]) / merged["count"]
+        return merged
+
+    def aggregate_rollups(self, collection, start, end, seconds):
+        """Return rollup documents for [start, end) computed from a finer rollup collection."""
+        bucket_ms = seconds * 1000
+        group = {"_id": {"$subtract": ["$t", {"$mod": ["$t", bucket_ms]}]}, "count": {"$sum": "$count"},
+                 "energy": {"$sum": "$energy"}, "total": {"$last": "$total"}}
+        for field in ROLLUP_FIELDS:
+            group.update({f"{field}_min": {"$min": f"${field}.min"}, f"{field}_max": {"$max": f"${field}.max"},
+                          f"{field}_sum": {"$sum": {"$multiply": [f"${field}.mean", "$count"]}},
+                          f"{field}_last": {"$last": f"${field}.last"}})
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            {"$sort": {"timestamp": 1}},
+            {"$addFields": {"t": {"$subtract": ["$timestamp", EPOCH]}}},
+            {"$group": group},
+        ]
+        documents = []
+        for row in sorted(collection.aggregate(pipeline), key=lambda row: row["_id"]):
+            document = {"timestamp": datetime.fromtimestamp(row["_id"] / 1000, timezone.utc),
+                        "count": row["count"], "energy": row["energy"], "total": row["total"]}
+            for field in ROLLUP_FIELDS:
+                document[field] = {"min": row[f"{field}_min"], "max": row[f"{field}_max"],
+                                   "mean": row[f"{field}_sum"] / row["count"], "last": row[f"{field}_last"]}
+            documents.append(document)
+        return documents
+
+    def expire_raw(self, ip_address, now):
+        """Drop day collections past the raw retention window that the 1-minute rollup already covers."""
+        if not self.raw_retention_days:
+            return
+        db = self.client[format_ip_address(ip_address)]
+        state = db.rollup_state.find_one({"_id": ROLLUP_LEVELS[0][0]})
+        if state is None:
+            return
+        cutoff = min(now - timedelta(days=self.raw_retention_days), as_utc(state["until"]))
+        for name in db.list_collection_names():
+            if self.is_day_collection(name) and parse_day(name) + timedelta(days=1) <= cutoff:
+                logging.info(f"Dropping raw samples of {ip_address} for {name}")
+                db.drop_collection(name)
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import quote, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from metrics import REGISTRY
+
+RPC_LATENCY = REGISTRY.histogram("shelly_rpc_latency_seconds", "Time from issuing an RPC attempt to its answer, including waiting for a worker.", ("device", "method"))
+RPC_RETRIES = REGISTRY.counter("shelly_rpc_retries_total", "RPC attempts repeated after a transport error.", ("device",))
+RPC_TIMEOUTS = REGISTRY.counter("shelly_rpc_timeouts_total", "RPC attempts that timed out.", ("device",))
+RPC_FAILURES = REGISTRY.counter("shelly_rpc_failures_total", "RPC calls that failed after every attempt, or were answered with an error.", ("device",))
+
+
+def is_idempotent(method):
+    """Return whether repeating an RPC method has the same effect as calling it once.
+
+    Reads (``*.Get*``, ``*.List``) and ``Switch.Set``, which names the state to
+    set, are idempotent; toggles and schedule changes are not.
+    """
+    verb = method.rsplit(".", 1)[-1]
+    return verb.startswith("Get") or verb == "List" or method == "Switch.Set"
+
+
+def request_not_sent(error):
+    """Return whether a transport error happened before the request reached the device."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused or unreachable connections: urllib3's NewConnectionError derives from ConnectTimeoutError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+class RpcError(requests.RequestException):
+    """Raised when a device answers an RPC call with an error object."""
+
+    def __init__(self, code, message):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class ShellyRpcClient:
+    """Shared HTTP client for Shelly Gen2 RPC calls.
+
+    Keeps one keep-alive session per device so repeated calls reuse the same
+    TCP connection. The per-host pool is small and blocking, since Shelly Plus
+    devices only accept a handful of concurrent sockets.
+
+    Devices are named by the address they were first monitored under;
+    ``set_address`` points a name at the device's current IP after DHCP moves it.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=3, backoff_base=0.5, backoff_max=8.0, pool_size=2):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.addresses = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a client using the timeouts and retry count configured in the environment."""
+        return cls(connect_timeout=float(os.getenv("RPC_CONNECT_TIMEOUT", 3.05)),
+                   read_timeout=float(os.getenv("RPC_READ_TIMEOUT", 10)),
+                   retries=int(os.getenv("RPC_RETRIES", 3)))
+
+    def resolve(self, ip_address):
+        """Return the current address of a device."""
+        return self.addresses.get(ip_address, ip_address)
+
+    def set_address(self, ip_address, current_address):
+        """Send future calls for a device to ``current_address`` and drop its old connections."""
+        with self.lock:
+            self.addresses[ip_address] = current_address
+            session = self.sessions.pop(ip_address, None)
+        if session is not None:
+            session.close()
+
+    def session_for(self, ip_address):
+        """Return the pooled session for a device, creating it on first use."""
+        with self.lock:
+            session = self.sessions.get(ip_address)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+                session.mount("http://", adapter)
+                session.headers["Connection"] = "keep-alive"
+                self.sessions[ip_address] = session
+            return session
+
+    def call(self, ip_address, method, params=None):
+        """Perform a single RPC call and return the decoded JSON result."""
+        url = f"http://{self.resolve(ip_address)}/rpc/{method}"
+        if params:
+            # Shelly's query parser reads values as JSON, so booleans must be true/false, and
+            # expects %20 rather than '+' for spaces (e.g. in timespecs)
+            query = {name: json.dumps(value) if isinstance(value, (bool, dict, list)) else value for name, value in params.items()}
+            url = f"{url}?{urlencode(query, quote_via=quote)}"
+        response = self.session_for(ip_address).get(url, timeout=self.timeout)
+        return self.decode_response(response)
+
+    def decode_response(self, response):
+        """Decode an RPC response, raising RpcError for device-reported errors."""
+        try:
+            data = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise
+        if isinstance(data, dict) and "code" in data and "message" in data:
+            raise RpcError(data["code"], data["message"])
+        response.raise_for_status()
+        return data
+
+    def backoff_delay(self, attempt):
+        """Return an exponential backoff delay with full jitter for a retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call_async(self, ip_address, method, params=None, executor=None, retries=None):
+        """Perform an RPC call from an event loop, retrying transport errors with backoff.
+
+        The HTTP request runs on ``executor`` and the wait between attempts is an
+        ``asyncio.sleep``, so a retrying device never holds a worker thread idle.
+        ``retries`` overrides the client's attempt count for this call. Methods
+        that are not idempotent (see ``is_idempotent``) are only retried when the
+        request never reached the device, so a timed-out toggle or schedule
+        change is never applied twice.
+        """
+        request = functools.partial(self.call, ip_address, method, params)
+        return await self.run_with_retries(ip_address, method, request, executor, retries, is_idempotent(method))
+
+    async def run_with_retries(self, ip_address, method, request, executor, retries, idempotent=True):
+        """Run a blocking request on ``executor``, retrying transport errors with backoff.
+
+        Unless ``idempotent``, only errors raised before the request was sent are retried.
+        """
+        loop = asyncio.get_running_loop()
+        retries = retries or self.retries
+        latency = RPC_LATENCY.labels(ip_address, method)
+        for attempt in range(retries):
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(executor, request)
+                latency.observe(time.perf_counter() - started)
+                return result
+            except RpcError:
+                latency.observe(time.perf_counter() - started)
+                RPC_FAILURES.labels(ip_address).inc()
+                raise  # The device answered, retrying will not change the outcome
+            except requests.RequestException as e:
+                if isinstance(e, requests.Timeout):
+                    RPC_TIMEOUTS.labels(ip_address).inc()
+                if attempt == retries - 1 or not (idempotent or request_not_sent(e)):
+                    RPC_FAILURES.labels(ip_address).inc()
+                    logging.error(f"Error calling {method} on {ip_address}: {e}")
+                    raise
+                RPC_RETRIES.labels(ip_address).inc()
+                await asyncio.sleep(self.backoff_delay(attempt))
+
+    def close(self):
+        """Close all pooled connections."""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
@@ -0,0 +1,265 @@
+"""Sharded collection: devices are polled by worker processes and stored by one coordinator.
+
+Each worker process runs its own ``DevicePoller`` over a hash partition of
+the devices and streams its results to the coordinator over a pipe as packed
+binary records, so polling and JSON parsing are spread over several cores
+while storage, energy accounting, alerts and the GUI keep a single view of
+every device.
+"""
+import json
+import logging
+import math
+import multiprocessing
+import queue
+import socket
+import struct
+import threading
+import zlib
+from multiprocessing.connection import wait
+
+import requests
+
+from collector import Collector
+from health import DEGRADED, HALF_OPEN, HEALTHY, OPEN
+from poller import DevicePoller
+from rpc_client import ShellyRpcClient
+from status import DeviceStatus
+
+HEALTH_STATES = (HEALTHY, DEGRADED, OPEN, HALF_OPEN)
+
+# Frames start with one type byte: a batch of SAMPLE records, or one ERROR record followed by its UTF-8 message
+SAMPLES, ERROR = b"S", b"E"
+# Device index, then its health: state, whether push is active, effective poll interval and next probe time (NaN when none)
+HEALTH = "HB?dd"
+ERROR_RECORD = struct.Struct("<" + HEALTH)
+# Then the sample, with NaN or -1 standing in for fields the device did not report:
+# output, apower, voltage, current, aenergy total, by_minute (3), minute_ts, tC, tF,
+# uptime, unixtime, ram_free, wifi rssi, wifi IPv4 address and cloud connected (-1, 0 or 1)
+SAMPLE_RECORD = struct.Struct("<" + HEALTH + "?4d3dI2dqdqh4sb")
+
+
+def shard_of(ip_address, shards):
+    """Return the shard a device belongs to; stable across processes and runs."""
+    return zlib.crc32(ip_address.encode()) % shards
+
+
+def health_fields(index, health):
+    """Return the HEALTH fields of a device's record."""
+    return (index, HEALTH_STATES.index(health.state), health.push_active, health.effective_interval(),
+            health.next_probe if health.next_probe is not None else math.nan)
+
+
+def optional(value, missing):
+    """Return ``value``, or the stand-in for a field the device did not report."""
+    return missing if value is None else value
+
+
+def encode_sample(index, health, status):
+    """Pack a device's health and DeviceStatus into a fixed-size SAMPLE record."""
+    by_minute = (tuple(status.aenergy_by_minute) + (math.nan,) * 3)[:3]
+    try:
+        wifi_ip = socket.inet_aton(status.wifi_ip) if status.wifi_ip else bytes(4)
+    except OSError:
+        wifi_ip = bytes(4)
+    return SAMPLE_RECORD.pack(*health_fields(index, health), status.output, status.apower, status.voltage, status.current,
+                              status.aenergy_total, *by_minute, status.aenergy_minute_ts, status.temperature_c, status.temperature_f,
+                              optional(status.uptime, -1), optional(status.unixtime, math.nan), optional(status.ram_free, -1),
+                              optional(status.wifi_rssi, -32768), wifi_ip, optional(status.cloud_connected, -1))
+
+
+def decode_sample(record):
+    """Return ``(index, health_state, push_active, interval, next_probe, status)`` from an unpacked SAMPLE record."""
+    (index, state, push_active, interval, next_probe, output, apower, voltage, current, total, minute_1, minute_2, minute_3, minute_ts,
+     temperature_c, temperature_f, uptime, unixtime, ram_free, wifi_rssi, wifi_ip, cloud_connected) = record
+    status = DeviceStatus(output=output, apower=apower, voltage=voltage, current=current, aenergy_total=total,
+                          aenergy_by_minute=tuple(value for value in (minute_1, minute_2, minute_3) if not math.isnan(value)),
+                          aenergy_minute_ts=minute_ts, temperature_c=temperature_c, temperature_f=temperature_f,
+                          uptime=None if uptime < 0 else uptime, unixtime=None if math.isnan(unixtime) else unixtime,
+                          ram_free=None if ram_free < 0 else ram_free, wifi_rssi=None if wifi_rssi == -32768 else wifi_rssi,
+                          wifi_ip=socket.inet_ntoa(wifi_ip) if any(wifi_ip) else None,
+                          cloud_connected=None if cloud_connected < 0 else bool(cloud_connected))
+    return index, HEALTH_STATES[state], push_active, interval, None if math.isnan(next_probe) else next_probe, status
+
+
+def run_shard(devices, options, connection):
+    """Worker process entry point: poll ``devices`` (``(index, key, address)`` triples) and stream results to ``connection``.
+
+    Results are drained from the poller's queue every ``batch_interval``
+    seconds, so packing happens off the poll loop. The coordinator sends JSON
+    control messages back on the same pipe: ``moved`` to follow a device to a
+    new address and ``stop`` to exit.
+    """
+    logging.basicConfig(level=options.get("log_level", "ERROR"), format=f'%(asctime)s - shard {options["shard"]} - %(levelname)s - %(message)s')
+    client = ShellyRpcClient(**options["client"])
+    indexes = {}
+    for index, key, address in devices:
+        indexes[key] = index
+        if address != key:
+            client.set_address(key, address)
+    poller = DevicePoller(list(indexes), client, method=options["method"], interval=options["interval"],
+                          steady_interval=options["steady_interval"], off_interval=options["off_interval"])
+    push_listener = None
+    if options["push"]:
+        from push import PushListener
+        push_listener = PushListener(poller, reconcile_interval=options["reconcile_interval"])
+    if options.get("metrics_port"):
+        from metrics import MetricsServer
+        MetricsServer(options["metrics_port"]).start()
+    poller.start()
+    if push_listener:
+        push_listener.start()
+
+    try:
+        while True:
+            if connection.poll(options["batch_interval"]):
+                message = json.loads(connection.recv_bytes())
+                if message["type"] == "stop":
+                    break
+                if message["type"] == "moved":
+                    client.set_address(message["key"], message["address"])
+            records = []
+            while True:
+                try:
+                    kind, ip_address, payload = poller.results.get_nowait()
+                except queue.Empty:
+                    break
+                index, health = indexes[ip_address], poller.health[ip_address]
+                if kind == "data":
+                    records.append(encode_sample(index, health, payload))
+                elif kind == "error":
+                    connection.send_bytes(ERROR + ERROR_RECORD.pack(*health_fields(index, health)) + str(payload).encode())
+            if records:
+                connection.send_bytes(SAMPLES + b"".join(records))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass  # The coordinator went away
+    finally:
+        poller.stop()
+        client.close()
+
+
+class ShardedCollector(Collector):
+    """A collector whose devices are polled by ``shards`` worker processes.
+
+    Devices are hash-partitioned by their key, so each keeps its shard across
+    restarts. The coordinator (this process) reads every worker's pipe on one
+    thread and replays each batch on its own poller loop, where samples reach
+    the ring buffers, storage, energy meter, alerts and GUI queue exactly as
+    in a single-process collector; device health is mirrored from the workers.
+    Commands such as toggles and schedules are still sent from the coordinator.
+
+    Samples are stamped when the coordinator receives them, up to
+    ``batch_interval`` seconds after they were polled. Each worker serves its
+    own RPC metrics on ``metrics_port + shard + 1`` when metrics are enabled.
+    """
+
+    def __init__(self, ip_addresses, rpc_client, shards=2, batch_interval=0.1, steady_interval=5.0, off_interval=10.0, **kwargs):
+        self.push = kwargs.pop("push", False)
+        self.reconcile_interval = kwargs.get("reconcile_interval", 60.0)
+        super().__init__(ip_addresses, rpc_client, **kwargs)
+        self.poller.poll = False
+        self.shards = shards
+        self.batch_interval = batch_interval
+        self.steady_interval = steady_interval
+        self.off_interval = off_interval
+        self.metrics_port = kwargs.get("metrics_port")
+        self.workers = []
+        self.connections = {}  # shard -> pipe to its worker
+        self.stopping = threading.Event()
+        self.reader = threading.Thread(target=self.read_results, name="shard-reader", daemon=True)
+
+    def start(self):
+        """Start the coordinator's storage and sinks, then the worker processes and the pipe reader."""
+        super().start()
+        context = multiprocessing.get_context("spawn")  # Forking a process with running threads (and Tk) is unsafe
+        partitions = [[] for _ in range(self.shards)]
+        for index, ip_address in enumerate(self.ip_addresses):
+            partitions[shard_of(ip_address, self.shards)].append((index, ip_address, self.rpc_client.resolve(ip_address)))
+        for shard, devices in enumerate(partitions):
+            if not devices:
+                continue
+            options = {
+                "shard": shard,
+                "client": {"connect_timeout": self.rpc_client.timeout[0], "read_timeout": self.rpc_client.timeout[1],
+                           "retries": self.rpc_client.retries, "pool_size": self.rpc_client.pool_size},
+                "method": self.poller.method,
+                "interval": self.poller.interval,
+                "steady_interval": self.steady_interval,
+                "off_interval": self.off_interval,
+                "push": self.push,
+                "reconcile_interval": self.reconcile_interval,
+                "batch_interval": self.batch_interval,
+                "metrics_port": self.metrics_port + shard + 1 if self.metrics_port else None,
+                "log_level": logging.getLevelName(logging.getLogger().getEffectiveLevel()),
+            }
+            connection, worker_connection = context.Pipe()
+            worker = context.Process(target=run_shard, args=(devices, options, worker_connection), name=f"shard-{shard}", daemon=True)
+            worker.start()
+            worker_connection.close()
+            self.workers.append(worker)
+            self.connections[shard] = connection
+        self.reader.start()
+
+    def stop(self):
+        """Stop the workers, then the coordinator."""
+        self.stopping.set()
+        for connection in self.connections.values():
+            self.send(connection, {"type": "stop"})
+        for worker in self.workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+        super().stop()
+
+    @staticmethod
+    def send(connection, message):
+        """Send a control message to a worker, ignoring workers that have exited."""
+        try:
+            connection.send_bytes(json.dumps(message).encode())
+        except (OSError, ValueError):
+            pass  # Worker already gone
+
+    def device_moved(self, ip_address, current_address):
+        """Point the coordinator and the device's worker at its new address."""
+        super().device_moved(ip_address, current_address)
+        connection = self.connections.get(shard_of(ip_address, self.shards))
+        if connection is not None:
+            self.send(connection, {"type": "moved", "key": ip_address, "address": current_address})
+
+    def read_results(self):
+        """Decode frames from every worker and hand them to the poller loop, one call per frame."""
+        connections = list(self.connections.values())
+        while connections and not self.stopping.is_set():
+            for connection in wait(connections, timeout=0.5):
+                try:
+                    frame = connection.recv_bytes()
+                except (EOFError, OSError):
+                    connections.remove(connection)
+                    if not self.stopping.is_set():
+                        logging.error("A collector shard exited unexpectedly")
+                    continue
+                if frame[:1] == SAMPLES:
+                    samples = [decode_sample(record) for record in SAMPLE_RECORD.iter_unpack(frame[1:])]
+                    self.poller.loop.call_soon_threadsafe(self.apply_samples, samples)
+                elif frame[:1] == ERROR:
+                    header = ERROR_RECORD.unpack_from(frame, 1)
+                    message = frame[1 + ERROR_RECORD.size:].decode(errors="replace")
+                    self.poller.loop.call_soon_threadsafe(self.apply_error, header, message)
+
+    def mirror_health(self, ip_address, state, push_active, interval, next_probe):
+        """Copy a worker's view of a device's health onto the coordinator's, which the GUI shows."""
+        health = self.poller.health[ip_address]
+        health.state, health.push_active, health.current_interval, health.next_probe = state, push_active, interval, next_probe
+
+    def apply_samples(self, samples):
+        """Publish a batch of worker samples; runs on the poller loop."""
+        for index, state, push_active, interval, next_probe, status in samples:
+            ip_address = self.ip_addresses[index]
+            self.mirror_health(ip_address, state, push_active, interval, next_probe)
+            self.poller.publish(ip_address, status)
+
+    def apply_error(self, header, message):
+        """Report a worker's failed poll like a local one; runs on the poller loop."""
+        index, state, push_active, interval, next_probe = header
+        ip_address = self.ip_addresses[index]
+        self.mirror_health(ip_address, HEALTH_STATES[state], push_active, interval, None if math.isnan(next_probe) else next_probe)
+        self.poller.post(("error", ip_address, requests.RequestException(message)))
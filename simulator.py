@@ -0,0 +1,415 @@
+"""Simulated Shelly Plus Plugs for developing and load-testing without hardware.
+
+Each virtual plug listens on its own localhost port and serves the Gen2 RPC
+endpoints the app uses over HTTP (``GET /rpc/<Method>``, ``POST /rpc`` and
+``GET /shelly``) and over a WebSocket on ``/rpc`` with ``NotifyStatus``
+pushes. Loads follow appliance-like waveforms, and every response can be
+delayed by a latency with jitter or dropped to simulate packet loss.
+
+    python simulator.py --devices 200 --base-port 9000 --latency 0.02 --jitter 0.01 --loss 0.01 --inventory inventory.json
+
+Writing the inventory lets ``monitor.py`` and ``collector.py`` pick up every
+virtual plug, beyond the 99 that fit in IP_ADDRESS_n entries.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from websockets.frames import Opcode
+from websockets.server import ServerProtocol
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+# Appliance loads: (power factor, idle watts); the shape of each is in FakeShellyDevice.load_power
+PROFILES = {
+    "fridge": (0.85, 0.8),
+    "heater": (1.0, 1.0),
+    "computer": (0.95, 2.0),
+    "tv": (0.9, 0.5),
+    "charger": (0.6, 0.3),
+}
+
+
+class DeviceError(Exception):
+    """An RPC error answered by a simulated device."""
+
+    def __init__(self, code, message, status=500):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def parse_query_value(value):
+    """Decode a GET RPC parameter, which devices read as JSON when it parses as JSON."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeShellyDevice:
+    """A simulated Shelly Plus Plug speaking Gen2 RPC over HTTP and WebSocket.
+
+    State advances lazily whenever the device is asked for it, integrating the
+    waveform into ``aenergy`` (total in Wh, ``by_minute`` in mWh for the last
+    three complete minutes). WebSocket peers that identify themselves with
+    ``src`` receive ``NotifyStatus`` deltas every ``notify_interval`` seconds.
+    """
+
+    def __init__(self, device_id="shellyplusplugus-fake", profile=None, notify_interval=0.5, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.device_id = device_id
+        self.rng = random.Random(seed)
+        self.profile = profile or self.rng.choice(list(PROFILES))
+        self.power_factor, self.idle_power = PROFILES[self.profile]
+        self.notify_interval = notify_interval
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.mac = "".join(self.rng.choice("0123456789ABCDEF") for _ in range(12))
+        self.phase = self.rng.uniform(0, 3600)
+        self.started = self.updated = time.time()
+        self.minute_energy = 0.0
+        self.status = {
+            "id": 0,
+            "source": "init",
+            "output": True,
+            "apower": 0.0,
+            "voltage": 120.0,
+            "current": 0.0,
+            "aenergy": {"total": 0.0, "by_minute": [0.0, 0.0, 0.0], "minute_ts": int(self.started // 60 * 60)},
+            "temperature": {"tC": 30.0, "tF": 86.0},
+        }
+        self.jobs = []
+        self.next_job_id = 1
+        self.schedule_rev = 0
+        self.peers = set()
+        self.advance(self.started)
+
+    def load_power(self, now):
+        """Return the appliance's power draw in watts at ``now``."""
+        t = now + self.phase
+        noise = self.rng.gauss(0, 1)
+        if self.profile == "fridge":
+            # Compressor runs 15 of every 45 minutes, with an inrush spike as it starts
+            cycle = t % 2700
+            if cycle >= 900:
+                return self.idle_power
+            return 110 + 300 * math.exp(-cycle / 1.5) + 2 * noise
+        if self.profile == "heater":
+            # Thermostat cycling at full power
+            return 1450 + 10 * noise if t % 600 < 240 else self.idle_power
+        if self.profile == "computer":
+            return 65 + 80 * (0.5 + 0.5 * math.sin(t / 7)) ** 4 + 8 * abs(noise)
+        if self.profile == "tv":
+            return 95 + 5 * math.sin(t / 120) + 1.5 * noise
+        # Charger: constant current, then a tapering constant-voltage phase, over two hours
+        cycle = t % 7200
+        return 45 + 0.5 * noise if cycle < 4320 else max(self.idle_power, 45 * math.exp(-(cycle - 4320) / 600))
+
+    def advance(self, now):
+        """Bring the simulated measurements up to ``now``."""
+        dt = now - self.updated
+        if dt < 0:
+            return
+        previous_power = self.status["apower"]
+        power = max(0.0, self.load_power(now)) if self.status["output"] else 0.0
+        voltage = 120.5 - 0.0015 * power + 0.8 * math.sin(2 * math.pi * (now + self.phase) / 3600) + 0.2 * self.rng.gauss(0, 1)
+        energy = (previous_power + power) / 2 * dt / 3600  # Wh, trapezoidal
+
+        aenergy = self.status["aenergy"]
+        minute_start = int(now // 60 * 60)
+        if minute_start > aenergy["minute_ts"]:
+            # Split the interval's energy at the minute boundary and shift completed minutes in
+            after = energy * min(1.0, (now - minute_start) / dt) if dt else 0.0
+            completed = min(3, (minute_start - aenergy["minute_ts"]) // 60)
+            finished = round((self.minute_energy + energy - after) * 1000, 3)
+            aenergy["by_minute"] = ([finished] + [0.0] * (completed - 1) + aenergy["by_minute"])[:3]
+            aenergy["minute_ts"] = minute_start
+            self.minute_energy = after
+        else:
+            self.minute_energy += energy
+        aenergy["total"] = round(aenergy["total"] + energy, 3)
+
+        temperature = self.status["temperature"]["tC"]
+        temperature += (28 + power / 100 - temperature) * min(1.0, dt / 600)
+        self.status.update({
+            "apower": round(power, 1),
+            "voltage": round(voltage, 1),
+            "current": round(power / (voltage * self.power_factor), 3),
+            "temperature": {"tC": round(temperature, 1), "tF": round(temperature * 9 / 5 + 32, 1)},
+        })
+        self.updated = now
+
+    def device_info(self):
+        """Return the ``/shelly`` identification."""
+        return {"name": None, "id": self.device_id, "mac": self.mac, "model": "SNPL-00116US", "gen": 2,
+                "fw_id": "20240625-122917/1.3.3-gbdfd9b3", "ver": "1.3.3", "app": "PlusPlugUS", "auth_en": False}
+
+    def full_status(self):
+        """Return the ``Shelly.GetStatus`` result."""
+        now = time.time()
+        return {
+            "switch:0": dict(self.status),
+            "sys": {"mac": self.mac, "uptime": int(now - self.started), "unixtime": now, "ram_free": 140000},
+            "wifi": {"sta_ip": "127.0.0.1", "status": "got ip", "ssid": "simulated", "rssi": -55},
+            "cloud": {"connected": False},
+        }
+
+    def handle_rpc(self, method, params):
+        """Run an RPC method against the simulated state and return its result."""
+        self.advance(time.time())
+        method = method.lower()
+        if method == "switch.getstatus":
+            return dict(self.status)
+        if method == "shelly.getstatus":
+            return self.full_status()
+        if method == "shelly.getdeviceinfo":
+            return self.device_info()
+        if method == "switch.toggle":
+            was_on = self.status["output"]
+            self.set_output(not was_on)
+            return {"was_on": was_on}
+        if method == "switch.set":
+            was_on = self.status["output"]
+            self.set_output(bool(params.get("on", was_on)))
+            return {"was_on": was_on}
+        if method == "schedule.list":
+            return {"jobs": [dict(job) for job in self.jobs], "rev": self.schedule_rev}
+        if method == "schedule.create":
+            if "timespec" not in params or "calls" not in params:
+                raise DeviceError(-103, "Invalid argument 'timespec' or 'calls'")
+            calls = params["calls"]
+            job = {"id": self.next_job_id, "enable": params.get("enable", True), "timespec": params["timespec"],
+                   "calls": json.loads(calls) if isinstance(calls, str) else calls}
+            self.jobs.append(job)
+            self.next_job_id += 1
+            self.schedule_rev += 1
+            return {"id": job["id"], "rev": self.schedule_rev}
+        if method == "schedule.delete":
+            job_ids = [job["id"] for job in self.jobs]
+            if params.get("id") not in job_ids:
+                raise DeviceError(-103, f"Invalid argument 'id': no such job {params.get('id')}")
+            self.jobs.pop(job_ids.index(params["id"]))
+            self.schedule_rev += 1
+            return {"rev": self.schedule_rev}
+        raise DeviceError(404, f"No handler for {method}", status=404)
+
+    def set_output(self, on):
+        """Switch the simulated relay and notify peers of the change."""
+        self.status["output"] = on
+        self.status["source"] = "HTTP_in"
+        self.notify({"id": 0, "output": on})
+
+    def delay(self):
+        """Return this response's simulated network latency in seconds."""
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def handle_client(self, reader, writer):
+        """Serve HTTP requests on one keep-alive connection, handing WebSocket upgrades over."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self.handle_websocket(head, reader, writer)
+                    return
+                if self.loss and self.rng.random() < self.loss:
+                    return  # Lost: the connection drops without an answer
+                status, payload = self.handle_http(method, target, body)
+                await asyncio.sleep(self.delay())  # The answer is stamped before it travels back
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def handle_http(self, method, target, body):
+        """Route an HTTP request and return ``(status, payload)``."""
+        url = urlsplit(target)
+        try:
+            if url.path == "/shelly":
+                return 200, self.device_info()
+            if method == "POST" and url.path == "/rpc":
+                frame = json.loads(body)
+                reply = {"id": frame.get("id"), "src": self.device_id}
+                try:
+                    reply["result"] = self.handle_rpc(frame.get("method", ""), frame.get("params") or {})
+                except DeviceError as e:
+                    reply["error"] = {"code": e.code, "message": e.message}
+                return 200, reply
+            if method == "GET" and url.path.startswith("/rpc/"):
+                params = {name: parse_query_value(value) for name, value in parse_qsl(url.query)}
+                return 200, self.handle_rpc(url.path[len("/rpc/"):], params)
+        except DeviceError as e:
+            return e.status, {"code": e.code, "message": e.message}
+        except ValueError as e:
+            return 400, {"code": -103, "message": str(e)}
+        return 404, {"code": 404, "message": f"Not found: {url.path}"}
+
+    async def handle_websocket(self, head, reader, writer):
+        """Answer RPC frames from one WebSocket peer until it disconnects."""
+        protocol = ServerProtocol()
+        protocol.receive_data(head)
+        request = protocol.events_received()[0]
+        protocol.send_response(protocol.accept(request))
+        peer = (protocol, writer)
+        try:
+            while True:
+                self.flush(protocol, writer)
+                data = await reader.read(65536)
+                if not data:
+                    return
+                protocol.receive_data(data)
+                for frame in protocol.events_received():
+                    if frame.opcode is not Opcode.TEXT:
+                        continue
+                    message = json.loads(frame.data)
+                    if message.get("src"):
+                        self.peers.add(peer)
+                    reply = {"id": message.get("id"), "src": self.device_id, "dst": message.get("src")}
+                    try:
+                        reply["result"] = self.handle_rpc(message.get("method", ""), message.get("params") or {})
+                    except DeviceError as e:
+                        reply["error"] = {"code": e.code, "message": e.message}
+                    protocol.send_text(json.dumps(reply).encode())
+                if protocol.close_expected():
+                    self.flush(protocol, writer)
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.peers.discard(peer)
+
+    @staticmethod
+    def flush(protocol, writer):
+        """Write out whatever the WebSocket protocol has queued."""
+        for data in protocol.data_to_send():
+            if data:
+                writer.write(data)
+
+    def notify(self, delta):
+        """Send a NotifyStatus frame with a ``switch:0`` delta to every identified peer."""
+        if not self.peers:
+            return
+        frame = json.dumps({"src": self.device_id, "method": "NotifyStatus",
+                            "params": {"ts": round(time.time(), 2), "switch:0": delta}}).encode()
+        for protocol, writer in list(self.peers):
+            protocol.send_text(frame)
+            self.flush(protocol, writer)
+
+    def step(self):
+        """Advance the measurements and return the fields a notification carries."""
+        self.advance(time.time())
+        return {key: self.status[key] for key in ("id", "apower", "voltage", "current", "aenergy")}
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """Serve this device alone, forever."""
+        fleet = SimulatedFleet([self], host, port)
+        await fleet.serve()
+
+
+class SimulatedFleet:
+    """Runs many simulated devices on consecutive localhost ports from one event loop.
+
+    A ``base_port`` of 0 lets the OS pick a free port for each device.
+    """
+
+    def __init__(self, devices, host="127.0.0.1", base_port=0):
+        self.devices = list(devices)
+        self.host = host
+        self.base_port = base_port
+        self.addresses = []
+        self.ready = threading.Event()
+        self.loop = None
+
+    @classmethod
+    def create(cls, count, host="127.0.0.1", base_port=0, seed=None, **device_options):
+        """Create a fleet of ``count`` devices with mixed load profiles."""
+        rng = random.Random(seed)
+        devices = [FakeShellyDevice(f"shellyplusplugus-sim{i:04d}", seed=rng.random(), **device_options) for i in range(count)]
+        return cls(devices, host, base_port)
+
+    async def serve(self):
+        """Open every device's port, then push notifications to WebSocket peers forever."""
+        servers = []
+        for i, device in enumerate(self.devices):
+            server = await asyncio.start_server(device.handle_client, self.host, self.base_port + i if self.base_port else 0)
+            servers.append(server)
+            self.addresses.append(f"{self.host}:{server.sockets[0].getsockname()[1]}")
+        self.loop = asyncio.get_running_loop()
+        self.ready.set()
+        interval = min(device.notify_interval for device in self.devices)
+        while True:
+            await asyncio.sleep(interval)
+            for device in self.devices:
+                if device.peers:
+                    device.notify(device.step())
+
+    def start_in_thread(self):
+        """Serve the fleet from a background thread and return the device addresses once listening."""
+        threading.Thread(target=lambda: asyncio.run(self.serve()), name="simulator", daemon=True).start()
+        self.ready.wait()
+        return self.addresses
+
+    def write_inventory(self, path):
+        """Record every device in an inventory file so the monitor and collector pick them up."""
+        from discovery import Inventory
+        inventory = Inventory(path)
+        for device, address in zip(self.devices, self.addresses):
+            inventory.record(address, device.device_info())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated Shelly Plus Plugs on localhost.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", "--base-port", dest="base_port", type=int, default=8765, help="port of the first device; 0 picks free ports")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum +/- seconds of random latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of HTTP requests dropped without an answer")
+    parser.add_argument("--notify-interval", type=float, default=0.5)
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="load profile of every device (default: mixed)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--inventory", help="write the devices to this inventory file")
+    parser.add_argument("--ready-file", help="write the device addresses here, one per line, once listening")
+    args = parser.parse_args()
+
+    fleet = SimulatedFleet.create(args.devices, args.host, args.base_port, seed=args.seed, profile=args.profile,
+                                  notify_interval=args.notify_interval, latency=args.latency, jitter=args.jitter, loss=args.loss)
+    addresses = fleet.start_in_thread()
+    if args.inventory:
+        fleet.write_inventory(args.inventory)
+    if args.ready_file:
+        with open(args.ready_file, "w", encoding="utf-8") as file:
+            file.write("\n".join(addresses) + "\n")
+    print(f"Simulating {len(addresses)} devices on {addresses[0]} .. {addresses[-1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
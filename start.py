@@ -1,9 +1,11 @@
 import os
 import requests
 import logging
+import threading
 from dotenv import load_dotenv
 import customtkinter as ctk
 from CTkMessagebox import CTkMessagebox
+from discovery import Discovery, Inventory, read_ip_addresses
 
 class LoginApp:
     def __init__(self, root):
@@ -30,6 +32,14 @@ class LoginApp:
                                            command=self.add_ip_entry_frame)
         self.button_add_ip.grid(row=1, column=0, pady=10, padx=10, sticky="ew")
 
+        # Button to find devices on the local network
+        self.button_discover = ctk.CTkButton(self.main_frame,
+                                             text="Discover Devices",
+                                             fg_color="#1f538d",
+                                             border_width=0,
+                                             command=self.discover_devices)
+        self.button_discover.grid(row=0, column=0, pady=10, padx=10, sticky="ew")
+
         # Button to update credentials
         self.button_update = ctk.CTkButton(self.main_frame,
                                            text="Update",
@@ -61,6 +71,29 @@ class LoginApp:
         self.button_update.grid(row=len(self.ip_entry_frames) + 2, pady=10, padx=10, sticky="ew")
         self.button_begin_monitoring.grid(row=len(self.ip_entry_frames) + 3, padx=5, pady=5)
 
+    def discover_devices(self):
+        # Function to sweep the local network for devices in the background
+        load_dotenv(override=True)
+        self.inventory = Inventory.from_env()
+        discovery = Discovery.from_env(self.inventory)
+        self.button_discover.configure(state="disabled", text="Discovering...")
+        self.discovery_thread = threading.Thread(target=discovery.sweep, daemon=True)
+        self.discovery_thread.start()
+        self.root.after(200, self.check_discovery)
+
+    def check_discovery(self):
+        # Function to add an entry for each discovered device once the sweep finishes
+        if self.discovery_thread.is_alive():
+            self.root.after(200, self.check_discovery)
+            return
+        self.button_discover.configure(state="normal", text="Discover Devices")
+        known = set(self.get_ip_addresses())
+        found = [key for key in self.inventory.keys() if key not in known]
+        for key in found:
+            self.add_ip_entry_frame()
+            self.ip_entry_frames[-1].grid_slaves(row=0, column=0)[0].insert(0, key)
+        CTkMessagebox(master=self.root, title="Discovery", message=f"Found {len(found)} new device(s).", icon="info")
+
     def update(self):
         # Function to write IP addresses to ".env" file
         ip_addresses = self.get_ip_addresses()
@@ -95,29 +128,20 @@ class LoginApp:
 
     def open_monitoring(self):
         # Function to open the monitoring functionality after verifying IP addresses
-        if not self.check_env_file():
-            # Check if .env file exists
-            CTkMessagebox(title="Error", message="No .env file found. Please set IP addresses.")
-            return
-
         # Load environment variables
         load_dotenv(override=True)
 
-        # Retrieve IP addresses from .env
-        ip_addresses = [os.getenv(f'IP_ADDRESS_{i}') for i in range(1, 100) if os.getenv(f'IP_ADDRESS_{i}')]
+        # Retrieve IP addresses from .env and the discovered device inventory
+        ip_addresses = read_ip_addresses(Inventory.from_env())
 
         if not ip_addresses:
-            # Check if IP addresses are set in .env
-            CTkMessagebox(title="Error", message="No IP addresses found in .env file. Please add at least one IP address.")
+            # Check if IP addresses are set in .env or have been discovered
+            CTkMessagebox(title="Error", message="No IP addresses found. Please add or discover at least one device.")
             return
 
         # Open the monitoring app if IP addresses are set
         os.system("python monitor.py")
 
-    def check_env_file(self):
-        # Function to check if the .env file exists
-        return os.path.exists(".env")
-
 def main():
     # Main function to initialize the application
     logging.basicConfig(filename='login_app.log', level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,109 @@
+from dataclasses import dataclass, replace
+
+
+def number(value, default=0.0):
+    """Return ``value`` as a float, or ``default`` when the device reported nothing."""
+    return default if value is None else float(value)
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceStatus:
+    """Status of a switch device, parsed once from an RPC result.
+
+    Built from either ``Switch.GetStatus`` (switch fields only) or
+    ``Shelly.GetStatus`` (switch plus sys, wifi and cloud state). Instances are
+    immutable, so one can be shared by the GUI, storage and other consumers.
+    """
+    output: bool = False
+    apower: float = 0.0
+    voltage: float = 0.0
+    current: float = 0.0
+    aenergy_total: float = 0.0
+    aenergy_by_minute: tuple = ()
+    aenergy_minute_ts: int = 0
+    temperature_c: float = 0.0
+    temperature_f: float = 0.0
+    uptime: int = None
+    unixtime: float = None
+    ram_free: int = None
+    wifi_rssi: int = None
+    wifi_ip: str = None
+    cloud_connected: bool = None
+
+    @classmethod
+    def from_switch_status(cls, switch, **extra):
+        """Parse a ``Switch.GetStatus`` result (or the ``switch:N`` part of a full status)."""
+        aenergy = switch.get("aenergy") or {}
+        temperature = switch.get("temperature") or {}
+        return cls(output=bool(switch.get("output", False)),
+                   apower=number(switch.get("apower")),
+                   voltage=number(switch.get("voltage")),
+                   current=number(switch.get("current")),
+                   aenergy_total=number(aenergy.get("total")),
+                   aenergy_by_minute=tuple(aenergy.get("by_minute") or ()),
+                   aenergy_minute_ts=int(aenergy.get("minute_ts") or 0),
+                   temperature_c=number(temperature.get("tC")),
+                   temperature_f=number(temperature.get("tF")),
+                   **extra)
+
+    @classmethod
+    def from_shelly_status(cls, data, component="switch:0"):
+        """Parse a ``Shelly.GetStatus`` result, which covers switch, sys, wifi and cloud in one call."""
+        return cls.from_switch_status(data.get(component) or {}, **cls.device_fields(data))
+
+    @staticmethod
+    def device_fields(data):
+        """Extract the sys, wifi and cloud fields present in a full status or notification."""
+        fields = {}
+        sys_status, wifi, cloud = data.get("sys"), data.get("wifi"), data.get("cloud")
+        if sys_status:
+            if "uptime" in sys_status:
+                fields["uptime"] = sys_status["uptime"]
+            if sys_status.get("unixtime") is not None:
+                fields["unixtime"] = float(sys_status["unixtime"])
+            if "ram_free" in sys_status:
+                fields["ram_free"] = sys_status["ram_free"]
+        if wifi:
+            if "rssi" in wifi:
+                fields["wifi_rssi"] = wifi["rssi"]
+            if "sta_ip" in wifi:
+                fields["wifi_ip"] = wifi["sta_ip"]
+        if cloud and "connected" in cloud:
+            fields["cloud_connected"] = cloud["connected"]
+        return fields
+
+    def with_notification(self, params, component="switch:0"):
+        """Return a copy with the partial state of a NotifyStatus frame applied."""
+        changes = self.device_fields(params)
+        # The copy is as old as this notification, not the sample it is applied to
+        changes.setdefault("unixtime", float(params["ts"]) if params.get("ts") is not None else None)
+        switch = params.get(component) or {}
+        if "output" in switch:
+            changes["output"] = bool(switch["output"])
+        for key in ("apower", "voltage", "current"):
+            if key in switch:
+                changes[key] = number(switch[key])
+        aenergy = switch.get("aenergy") or {}
+        if "total" in aenergy:
+            changes["aenergy_total"] = number(aenergy["total"])
+        if "by_minute" in aenergy:
+            changes["aenergy_by_minute"] = tuple(aenergy["by_minute"])
+        if "minute_ts" in aenergy:
+            changes["aenergy_minute_ts"] = int(aenergy["minute_ts"])
+        temperature = switch.get("temperature") or {}
+        if "tC" in temperature:
+            changes["temperature_c"] = number(temperature["tC"])
+        if "tF" in temperature:
+            changes["temperature_f"] = number(temperature["tF"])
+        return replace(self, **changes) if changes else self
+
+    def to_document(self):
+        """Return the ``Switch.GetStatus``-shaped document stored in MongoDB."""
+        return {
+            "apower": self.apower,
+            "voltage": self.voltage,
+            "current": self.current,
+            "aenergy": {"total": self.aenergy_total, "by_minute": list(self.aenergy_by_minute), "minute_ts": self.aenergy_minute_ts},
+            "temperature": {"tC": self.temperature_c, "tF": self.temperature_f},
+            "output": self.output,
+        }
@@ -0,0 +1,127 @@
+import logging
+import time
+
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+from metrics import REGISTRY, TIMING_BUCKETS
+from timeseries import BufferedWriter, collection_name_for, format_ip_address
+
+MONGO_WRITE_SECONDS = REGISTRY.histogram("mongo_write_seconds", "Time to insert one device's share of a sample batch.", buckets=TIMING_BUCKETS)
+MONGO_SAMPLES_WRITTEN = REGISTRY.counter("mongo_samples_written_total", "Samples inserted into MongoDB.")
+MONGO_SAMPLES_DROPPED = REGISTRY.counter("mongo_samples_dropped_total", "Samples discarded because the write queue was full.")
+MONGO_WRITE_ERRORS = REGISTRY.counter("mongo_write_errors_total", "Failed sample batch writes, each retried.")
+
+
+class SampleWriter(BufferedWriter):
+    """Buffers device samples and writes them to MongoDB in batches.
+
+    ``add`` never blocks: samples go on a bounded queue that a background thread
+    drains with ``insert_many`` whenever ``batch_size`` samples are pending or
+    ``flush_interval`` seconds have passed. While the database is slow or down,
+    the writer keeps retrying its current batch and the queue fills up; once
+    full, the oldest samples are dropped and counted in ``dropped``.
+    ``oldest_unwritten`` tells the compactor how far back samples may still
+    arrive in the database.
+
+    ``client`` may be a ``MongoClient`` or any stand-in with the same
+    ``client[db][collection].insert_many`` interface (e.g. mongomock).
+    """
+    dropped_metric = MONGO_SAMPLES_DROPPED
+
+    def __init__(self, client, batch_size=500, flush_interval=5.0, max_pending=50000, retry_interval=2.0, retry_max=30.0):
+        super().__init__(batch_size, flush_interval, max_pending, "sample-writer")
+        self.client = client
+        self.retry_interval = retry_interval
+        self.retry_max = retry_max
+        self.prepared_collections = set()
+
+    def flush(self, batch):
+        """Write a batch grouped by device database and day collection, retrying on failure."""
+        groups = {}
+        for ip_address, status, timestamp in batch:
+            document = status.to_document()
+            document["timestamp"] = timestamp
+            groups.setdefault((format_ip_address(ip_address), collection_name_for(timestamp)), []).append(document)
+
+        delay = self.retry_interval
+        while groups:
+            try:
+                for key in list(groups):
+                    collection = self.prepare_collection(*key)
+                    started = time.perf_counter()
+                    collection.insert_many(groups[key], ordered=False)
+                    MONGO_WRITE_SECONDS.labels().observe(time.perf_counter() - started)
+                    written = len(groups.pop(key))
+                    self.written += written
+                    MONGO_SAMPLES_WRITTEN.labels().inc(written)
+            except PyMongoError as e:
+                MONGO_WRITE_ERRORS.labels().inc()
+                if self.stopping.is_set():
+                    logging.error(f"Discarding {sum(map(len, groups.values()))} samples on shutdown: {e}")
+                    return
+                logging.error(f"Failed to write samples to MongoDB, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+
+    def prepare_collection(self, db_name, collection_name):
+        """Return a day collection, creating it as an indexed time-series collection on first use."""
+        db = self.client[db_name]
+        if (db_name, collection_name) not in self.prepared_collections:
+            try:
+                db.create_collection(collection_name, timeseries={"timeField": "timestamp", "granularity": "seconds"})
+            except CollectionInvalid:
+                pass  # Already exists
+            except (NotImplementedError, OperationFailure):
+                pass  # Server or stand-in without time-series support; a regular collection is created on insert
+            db[collection_name].create_index([("timestamp", ASCENDING)])
+            self.prepared_collections.add((db_name, collection_name))
+        return db[collection_name]
+
+
+class EnergyStore:
+    """MongoDB persistence for ``EnergyMeter``.
+
+    Rollups live in each device database's ``energy_hour``, ``energy_day``
+    and ``energy_month`` collections, keyed by period, and the last counter
+    reading in ``energy_state``.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def load(self, ip_address, keys):
+        """Return a device's saved ``(total, timestamp)`` counter (or None) and its rollups for ``(period, key)`` pairs.
+
+        Returns None if the database cannot be read.
+        """
+        db = self.client[format_ip_address(ip_address)]
+        try:
+            state = db.energy_state.find_one({"_id": "counter"})
+            rollups = {}
+            for period, key in keys:
+                document = db[f"energy_{period}"].find_one({"_id": key})
+                if document:
+                    rollups[(period, key)] = [document["kwh"], document["cost"]]
+        except PyMongoError as e:
+            logging.error(f"Failed to load energy state for {ip_address}: {e}")
+            return None
+        return ((state["total"], state["timestamp"]) if state else None), rollups
+
+    def write(self, ip_address, increments, counter=None):
+        """Add ``{(period, key): [kwh, cost]}`` increments and save the counter; return False on failure.
+
+        Written increments are removed from ``increments``, so on failure it holds what is left to retry.
+        """
+        db = self.client[format_ip_address(ip_address)]
+        try:
+            for (period, key), (kwh, cost) in list(increments.items()):
+                db[f"energy_{period}"].update_one({"_id": key}, {"$inc": {"kwh": kwh, "cost": cost}}, upsert=True)
+                del increments[(period, key)]
+            if counter is not None:
+                total, timestamp = counter
+                db.energy_state.update_one({"_id": "counter"}, {"$set": {"total": total, "timestamp": timestamp}}, upsert=True)
+        except PyMongoError as e:
+            logging.error(f"Failed to write energy rollups for {ip_address}: {e}")
+            return False
+        return True
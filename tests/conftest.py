@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulator import FakeShellyDevice, SimulatedFleet  # noqa: E402
+
+
+@pytest.fixture
+def serve_devices():
+    """Serve FakeShellyDevice instances on free localhost ports and return their addresses."""
+    def serve(*devices):
+        return SimulatedFleet(devices).start_in_thread()
+    return serve
+
+
+@pytest.fixture
+def device():
+    """A quiet simulated plug with a fixed seed."""
+    return FakeShellyDevice(profile="fridge", seed=1)
@@ -0,0 +1,99 @@
+import time
+
+from alerts import AlertEngine, RateRule, StuckRule, ThresholdRule, ZScoreRule, build_rule
+from poller import DevicePoller
+from rpc_client import ShellyRpcClient
+from status import DeviceStatus
+
+DEVICE = "10.0.0.1"
+
+
+def feed(engine, rule, samples):
+    """Run ``(now, value)`` samples through a rule and the engine's debounce, as ``add_sample`` would."""
+    for now, value in samples:
+        engine.update(DEVICE, rule, value, rule.check(DEVICE, value, now), now)
+
+
+def recorder():
+    alerts = []
+    return alerts, AlertEngine([], notifiers=[alerts.append])
+
+
+def test_threshold_fires_after_its_duration_and_resolves():
+    alerts, engine = recorder()
+    rule = build_rule({"name": "Overload", "type": "threshold", "metric": "apower", "above": 1800, "for": 5})
+    feed(engine, rule, [(0, 1900), (3, 1900), (4, 100), (5, 1900), (9, 1900)])
+    assert alerts == []  # Dipped below before 5 s had passed
+    feed(engine, rule, [(10, 1900), (11, 1950)])
+    assert [(alert.state, alert.value) for alert in alerts] == [("firing", 1900)]
+    assert alerts[0].message == "apower 1900 above 1800"
+    feed(engine, rule, [(12, 1200)])
+    assert [(alert.state, alert.value) for alert in alerts] == [("firing", 1900), ("resolved", 1200)]
+
+
+def test_cooldown_silences_refiring_and_its_resolution():
+    alerts, engine = recorder()
+    rule = ThresholdRule("Low voltage", "voltage", below=110, cooldown=60)
+    feed(engine, rule, [(0, 100), (1, 120), (10, 100), (11, 120)])
+    assert [alert.state for alert in alerts] == ["firing", "resolved"]
+    feed(engine, rule, [(61, 100), (62, 120)])
+    assert [alert.state for alert in alerts] == ["firing", "resolved", "firing", "resolved"]
+
+
+def test_zscore_waits_for_warmup_and_ignores_small_deviations():
+    alerts, engine = recorder()
+    rule = ZScoreRule("Spike", "apower", threshold=4, warmup=10, min_deviation=50)
+    feed(engine, rule, [(t, 100.0 + t % 2) for t in range(5)] + [(5, 1000.0)])
+    assert alerts == []  # Still warming up
+    feed(engine, rule, [(t, 100.0 + t % 2) for t in range(6, 40)] + [(40, 140.0)])
+    assert alerts == []  # Many standard deviations, but under min_deviation
+    feed(engine, rule, [(41, 100.0), (42, 1000.0)])
+    assert [(alert.state, alert.value) for alert in alerts] == [("firing", 1000.0)]
+
+
+def test_stuck_fires_once_the_value_has_not_moved_long_enough():
+    alerts, engine = recorder()
+    rule = StuckRule("Stuck voltage", "voltage", seconds=60, tolerance=0.2)
+    feed(engine, rule, [(0, 120.0), (30, 120.1), (59, 119.9)])
+    assert alerts == []
+    feed(engine, rule, [(60, 120.0)])
+    assert alerts[-1].state == "firing" and alerts[-1].message == "voltage stuck at 120 for 60s"
+    feed(engine, rule, [(61, 121.0)])
+    assert alerts[-1].state == "resolved"
+
+
+def test_rate_matches_fast_changes_in_either_direction():
+    alerts, engine = recorder()
+    rule = RateRule("Jump", "apower", max_rate=100, cooldown=0)
+    feed(engine, rule, [(0, 0.0), (1, 50.0), (2, 400.0)])
+    assert [alert.state for alert in alerts] == ["firing"]
+    assert alerts[0].message == "apower changing +350.0/s, over 100/s"
+    feed(engine, rule, [(3, 400.0), (4, 0.0)])
+    assert [alert.state for alert in alerts] == ["firing", "resolved", "firing"]
+
+
+def test_rules_skip_other_devices_and_samples_taken_while_off():
+    alerts = []
+    rules = [ThresholdRule("Hot", "apower", above=10, devices=["10.0.0.2"]), ThresholdRule("On", "apower", above=10, when_on=True)]
+    engine = AlertEngine(rules, notifiers=[alerts.append])
+    engine.add_sample(DEVICE, DeviceStatus(output=False, apower=100.0))
+    assert alerts == []
+    engine.add_sample(DEVICE, DeviceStatus(output=True, apower=100.0))
+    assert [alert.rule for alert in alerts] == ["On"]
+
+
+def test_auto_off_switches_the_outlet_off(serve_devices, device):
+    (address,) = serve_devices(device)
+    poller = DevicePoller([address], ShellyRpcClient(), poll=False, keep_results=False)
+    alerts = []
+    engine = AlertEngine([ThresholdRule("Overload", "apower", above=1800, auto_off=True)], poller, notifiers=[alerts.append])
+    poller.start()
+    try:
+        poller.loop.call_soon_threadsafe(engine.add_sample, address, DeviceStatus(output=True, apower=2000.0))
+        deadline = time.monotonic() + 5
+        while device.status["output"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert device.status["output"] is False
+        assert alerts[0].message == "apower 2000 above 1800, switching off"
+    finally:
+        poller.stop()
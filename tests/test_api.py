@@ -0,0 +1,82 @@
+import http.client
+import json
+
+import pytest
+
+from api import LiveApi
+from status import DeviceStatus
+
+FRIDGE, HEATER = "10.0.0.1", "10.0.0.2"
+
+
+@pytest.fixture
+def api():
+    api = LiveApi(0, backlog=4)
+    api.start()
+    yield api
+    api.stop()
+
+
+def get(api, path, headers=None):
+    connection = http.client.HTTPConnection(api.host, api.server.server_address[1], timeout=5)
+    connection.request("GET", path, headers=headers or {})
+    return connection.getresponse()
+
+
+def read_events(response, count):
+    """Return ``(id, event, data)`` for the next ``count`` events of a stream, skipping comments."""
+    events, fields = [], {}
+    while len(events) < count:
+        line = response.fp.readline().decode().rstrip("\n")
+        if not line:
+            if fields:
+                events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+                fields = {}
+        elif not line.startswith(":"):
+            name, value = line.split(": ", 1)
+            fields[name] = value
+    return events
+
+
+def publish(api, ip_address, apower):
+    api.add_sample(ip_address, DeviceStatus(output=True, apower=apower, voltage=120.0))
+
+
+def test_snapshot_serves_the_latest_sample_of_each_device(api):
+    publish(api, FRIDGE, 90.0)
+    publish(api, HEATER, 1500.0)
+    publish(api, FRIDGE, 95.0)
+    snapshot = json.loads(get(api, "/api/devices").read())
+    assert {ip_address: sample["apower"] for ip_address, sample in snapshot.items()} == {FRIDGE: 95.0, HEATER: 1500.0}
+    assert json.loads(get(api, f"/api/devices/{HEATER}").read())["device"] == HEATER
+    assert get(api, "/api/devices/10.9.9.9").status == 404
+
+
+def test_devices_filter_limits_snapshot_and_stream(api):
+    publish(api, FRIDGE, 90.0)
+    publish(api, HEATER, 1500.0)
+    assert list(json.loads(get(api, f"/api/devices?devices={FRIDGE}").read())) == [FRIDGE]
+    response = get(api, f"/api/stream?devices={FRIDGE}")
+    [(_, event, data)] = read_events(response, 1)
+    assert event == "snapshot" and list(data) == [FRIDGE]
+    publish(api, HEATER, 1400.0)
+    publish(api, FRIDGE, 80.0)
+    [(event_id, event, data)] = read_events(response, 1)
+    assert (event_id, event, data["device"], data["apower"]) == (4, "sample", FRIDGE, 80.0)
+
+
+def test_stream_resumes_after_last_event_id(api):
+    for apower in (1.0, 2.0, 3.0):
+        publish(api, FRIDGE, apower)
+    response = get(api, "/api/stream", {"Last-Event-ID": "1"})
+    events = read_events(response, 2)
+    assert [(event_id, event, data["apower"]) for event_id, event, data in events] == [(2, "sample", 2.0), (3, "sample", 3.0)]
+
+
+def test_stream_sends_a_snapshot_when_missed_events_left_the_backlog(api):
+    for apower in range(6):
+        publish(api, FRIDGE if apower % 2 else HEATER, float(apower))
+    response = get(api, "/api/stream", {"Last-Event-ID": "1"})  # Events 2 and 3 were dropped from the 4-event backlog
+    [(event_id, event, data)] = read_events(response, 1)
+    assert (event_id, event) == (6, "snapshot")
+    assert {ip_address: sample["apower"] for ip_address, sample in data.items()} == {FRIDGE: 5.0, HEATER: 4.0}
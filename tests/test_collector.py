@@ -0,0 +1,13 @@
+import threading
+
+from collector import Collector
+from rpc_client import ShellyRpcClient
+
+
+def test_background_work_does_not_use_the_poll_pool():
+    collector = Collector(["10.0.0.1"], ShellyRpcClient(), keep_results=False)
+    try:
+        name = collector.run_in_background(lambda: threading.current_thread().name).result(5)
+        assert name.startswith("background")
+    finally:
+        collector.stop()
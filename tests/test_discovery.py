@@ -0,0 +1,68 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from discovery import Inventory, probe, read_ip_addresses
+
+GEN2 = {"id": "shellyplusplugus-a", "mac": "AAAAAAAAAAAA", "model": "SNPL-00116US", "gen": 2, "ver": "1.0.0"}
+
+
+def info(device_id):
+    return dict(GEN2, id=device_id, mac=device_id[-12:].upper())
+
+
+def test_new_device_at_a_moved_devices_key_gets_its_own_key(tmp_path, monkeypatch):
+    inventory = Inventory(str(tmp_path / "inventory.json"))
+    inventory.record("10.0.0.10", info("shellyplusplugus-a"))
+    assert inventory.record("10.0.0.11", info("shellyplusplugus-a")) == "10.0.0.10"
+    inventory.record("10.0.0.10", info("shellyplusplugus-b"))
+
+    assert sorted(inventory.keys()) == ["10.0.0.10", "shellyplusplugus-b"]
+    assert inventory.addresses() == {"10.0.0.10": "10.0.0.11", "shellyplusplugus-b": "10.0.0.10"}
+    monkeypatch.setenv("IP_ADDRESS_1", "10.0.0.10")
+    assert read_ip_addresses(inventory) == ["10.0.0.10", "shellyplusplugus-b"]
+
+    reloaded = Inventory(inventory.path)
+    assert reloaded.key_of("shellyplusplugus-b") == "shellyplusplugus-b"
+
+
+def test_known_device_keeps_its_key(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.json"))
+    inventory.record("10.0.0.10", info("shellyplusplugus-a"))
+    inventory.record("10.0.0.12", info("shellyplusplugus-a"))
+    inventory.record("10.0.0.10", info("shellyplusplugus-a"))
+    assert inventory.keys() == ["10.0.0.10"]
+    assert inventory.addresses() == {}
+
+
+def serve_json(routes):
+    """Serve ``{path: payload}`` as JSON on a free localhost port, 404 for other paths, and return the address."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            body = json.dumps(routes.get(path, {"code": 404, "message": f"No handler for {path}"})).encode()
+            self.send_response(200 if path in routes else 404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"127.0.0.1:{server.server_address[1]}"
+
+
+def test_probe_accepts_gen2_devices_only(serve_devices, device):
+    address, = serve_devices(device)
+    assert probe(address)["id"] == device.device_id
+    assert probe(serve_json({"/shelly": {"type": "SHPLG-U1", "mac": "BBBBBBBBBBBB", "auth": False, "fw": "1.11"}})) is None
+    assert probe(serve_json({"/shelly": {"hello": "world"}})) is None
+
+
+def test_probe_rejects_devices_without_a_switch():
+    dimmer = {"id": "shellyplusdimmer-c", "mac": "CCCCCCCCCCCC", "model": "SNDM-0013US", "gen": 2, "app": "PlusWallDimmer"}
+    assert probe(serve_json({"/shelly": dimmer})) is None
+    relay = dict(dimmer, id="shellyplus1-d", model="SNSW-001X16EU", app="Plus1")
+    assert probe(serve_json({"/shelly": relay, "/rpc/Switch.GetStatus": {"id": 0, "output": False}}))["id"] == "shellyplus1-d"
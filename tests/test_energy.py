@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime
+
+from energy import EnergyMeter, Tariff, period_keys
+from status import DeviceStatus
+
+
+def local_timestamp(*args):
+    return datetime(*args).timestamp()
+
+
+class SlowStore:
+    """An EnergyStore stand-in whose loads block until released, or fail."""
+
+    def __init__(self, counters=None, fail=False):
+        self.counters = counters or {}
+        self.fail = fail
+        self.release = threading.Event()
+        self.loads = []
+        self.writes = []
+
+    def load(self, ip_address, keys):
+        self.loads.append(ip_address)
+        self.release.wait(5)
+        return None if self.fail else (self.counters.get(ip_address), {})
+
+    def write(self, ip_address, increments, counter=None):
+        self.writes.append((ip_address, dict(increments), counter))
+        increments.clear()
+        return True
+
+
+def test_tariff_time_of_use_and_weekend():
+    tariff = Tariff("00:00=0.10,07:00=0.30,21:00=0.10", "00:00=0.05")
+    assert tariff.rate_at(local_timestamp(2024, 5, 15, 6, 59)) == 0.10  # Wednesday
+    assert tariff.rate_at(local_timestamp(2024, 5, 15, 7, 0)) == 0.30
+    assert tariff.rate_at(local_timestamp(2024, 5, 15, 23, 0)) == 0.10
+    assert tariff.rate_at(local_timestamp(2024, 5, 18, 12, 0)) == 0.05  # Saturday
+
+
+def test_tariff_wraps_to_previous_day():
+    tariff = Tariff("07:00=0.30,21:00=0.10")
+    assert tariff.rate_at(local_timestamp(2024, 5, 15, 3, 0)) == 0.10
+
+
+def test_counter_deltas_are_accounted():
+    meter = EnergyMeter(tariff=Tariff("00:00=0.20"))
+    meter.start(["a"])
+    start = time.time()
+    meter.add_sample("a", DeviceStatus(aenergy_total=1000.0), start)
+    meter.add_sample("a", DeviceStatus(aenergy_total=1500.0), start + 10)
+    kwh, cost = meter.totals("a", "day", start + 10)
+    assert abs(kwh - 0.5) < 1e-9 and abs(cost - 0.1) < 1e-9
+    meter.add_sample("a", DeviceStatus(aenergy_total=100.0), start + 20)  # Rebooted: the new total is the delta
+    assert abs(meter.totals("a", "day", start + 20)[0] - 0.6) < 1e-9
+    meter.stop()
+
+
+def test_gap_is_spread_over_hours():
+    meter = EnergyMeter(gap_seconds=90)
+    meter.start(["a"])
+    start = local_timestamp(2024, 5, 15, 10, 30)
+    meter.add_sample("a", DeviceStatus(aenergy_total=0.0), start)
+    meter.add_sample("a", DeviceStatus(aenergy_total=2000.0), start + 3600)
+    assert abs(meter.totals("a", "hour", start)[0] - 1.0) < 1e-9
+    assert abs(meter.totals("a", "hour", start + 3600)[0] - 1.0) < 1e-9
+    meter.stop()
+
+
+def test_start_does_not_wait_for_the_store():
+    store = SlowStore(counters={"a": (1000.0, time.time() - 10)})
+    meter = EnergyMeter(store, flush_interval=60)
+    started = time.perf_counter()
+    meter.start(["a", "b"])
+    assert time.perf_counter() - started < 0.5
+    meter.add_sample("a", DeviceStatus(aenergy_total=1200.0))  # Not metered before its counter is loaded
+    assert meter.totals("a", "day") == (0.0, 0.0)
+    store.release.set()
+    deadline = time.time() + 5
+    while meter.ready != {"a", "b"} and time.time() < deadline:
+        time.sleep(0.01)
+    meter.add_sample("a", DeviceStatus(aenergy_total=1500.0))
+    assert abs(meter.totals("a", "day")[0] - 0.5) < 1e-9  # Metered from the saved counter
+    meter.stop()
+
+
+def test_failed_load_stops_asking_the_store():
+    store = SlowStore(fail=True)
+    store.release.set()
+    meter = EnergyMeter(store, flush_interval=60)
+    meter.start(["a", "b", "c"])
+    deadline = time.time() + 5
+    while meter.ready != {"a", "b", "c"} and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.loads == ["a"]
+    meter.stop()
+
+
+def test_past_rollups_are_pruned_without_a_store():
+    meter = EnergyMeter(flush_interval=0.05)
+    meter.start(["a"])
+    with meter.lock:
+        meter.record("a", time.time() - 2 * 86400, 500.0)
+        meter.record("a", time.time(), 500.0)
+    time.sleep(0.3)
+    current = period_keys(time.time())
+    with meter.lock:
+        assert all(key >= current[period] for period, key in meter.rollups["a"])
+    meter.stop()
@@ -0,0 +1,31 @@
+from fleet import run_fleet_operation
+from poller import DevicePoller
+from rpc_client import ShellyRpcClient
+from simulator import FakeShellyDevice
+
+
+def run(addresses, method, params, read_timeout=2.0):
+    poller = DevicePoller(addresses, ShellyRpcClient(read_timeout=read_timeout, backoff_base=0.01), poll=False, keep_results=False)
+    poller.start()
+    try:
+        return poller.submit(run_fleet_operation(poller, addresses, method, params, limit=4)).result(10)
+    finally:
+        poller.stop()
+
+
+def test_slow_device_is_toggled_once(serve_devices):
+    fast = FakeShellyDevice(profile="fridge", seed=1)
+    slow = FakeShellyDevice(profile="fridge", latency=0.6, seed=2)
+    addresses = serve_devices(fast, slow)
+    outcomes = run(addresses, "Switch.Toggle", {"id": 0}, read_timeout=0.5)
+    assert [outcome[1] for outcome in outcomes] == ["ok", "unknown"]
+    assert fast.status["output"] is False
+    assert slow.status["output"] is False  # Toggled exactly once
+
+
+def test_schedule_create_on_every_device(serve_devices):
+    devices = [FakeShellyDevice(profile="fridge", seed=i) for i in range(3)]
+    addresses = serve_devices(*devices)
+    outcomes = run(addresses, "Schedule.Create", {"timespec": "0 0 12 * * 1", "calls": [{"method": "switch.toggle"}]})
+    assert [outcome[1] for outcome in outcomes] == ["ok"] * 3
+    assert [len(device.jobs) for device in devices] == [1, 1, 1]
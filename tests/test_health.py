@@ -0,0 +1,37 @@
+from health import DEGRADED, HEALTHY, OPEN, DeviceHealth
+from status import DeviceStatus
+
+
+def test_interval_adapts_to_load():
+    health = DeviceHealth(interval=1.0, steady_interval=5.0, off_interval=10.0)
+    health.record_success(DeviceStatus(output=True, apower=100.0))
+    assert health.next_delay() == 1.0
+    for _ in range(10):
+        health.record_success(DeviceStatus(output=True, apower=100.0))
+    assert health.next_delay() == 5.0
+    health.record_success(DeviceStatus(output=False))
+    assert health.next_delay() == 10.0
+
+
+def test_circuit_opens_and_closes():
+    health = DeviceHealth(open_after=3, backoff_base=5.0)
+    health.record_failure()
+    assert health.state == DEGRADED and health.retries == 1
+    health.record_failure()
+    health.record_failure()
+    assert health.state == OPEN
+    assert 4.5 <= health.next_delay() <= 5.5
+    health.begin_attempt()
+    health.record_failure()
+    assert health.state == OPEN and health.backoff == 10.0
+    health.begin_attempt()
+    health.record_success(DeviceStatus(output=True))
+    assert health.state == HEALTHY and health.retries is None
+
+
+def test_describe_shows_push_and_reconcile_interval():
+    health = DeviceHealth(interval=1.0)
+    assert health.describe() == "polling every 1.0s"
+    health.interval_override = 60.0
+    health.push_active = True
+    assert health.describe() == "push active, polling every 60.0s"
@@ -0,0 +1,112 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import numpy as np
+import pytest
+
+from history import HistoryCache, HistoryQuery, lttb
+from status import DeviceStatus
+from storage import SampleWriter
+from timeseries import bucket_seconds_for, collection_name_for
+
+DEVICE = "10.0.0.1"
+START = datetime(2024, 5, 15, 0, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def chicago_time(monkeypatch):
+    """Run with a local time zone whose days do not line up with UTC buckets."""
+    monkeypatch.setenv("TZ", "America/Chicago")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def write_minutes(client, minutes):
+    """Write one sample per minute from START, with apower counting the minutes."""
+    writer = SampleWriter(client)
+    writer.flush([(DEVICE, DeviceStatus(apower=float(minute), voltage=120.0), START + timedelta(minutes=minute))
+                  for minute in range(minutes)])
+
+
+def test_buckets_straddling_day_collections_are_merged(chicago_time):
+    client = mongomock.MongoClient()
+    write_minutes(client, 24 * 60)
+    assert collection_name_for(START) != collection_name_for(START + timedelta(hours=23))  # Local midnight at 05:00 UTC
+    rows = HistoryQuery(client).query(DEVICE, "apower", START, START + timedelta(days=1), bucket_seconds=86400)
+    assert len(rows) == 1
+    bucket, low, high, avg = rows[0]
+    assert bucket == START
+    assert (low, high, avg) == (0.0, 1439.0, 719.5)
+
+
+def test_rows_are_bucketed_in_range():
+    client = mongomock.MongoClient()
+    write_minutes(client, 120)
+    rows = HistoryQuery(client).query(DEVICE, "apower", START + timedelta(minutes=30), START + timedelta(minutes=90), bucket_seconds=900)
+    assert [row[0] for row in rows] == [START + timedelta(minutes=m) for m in (30, 45, 60, 75)]
+    assert rows[0][1:] == (30.0, 44.0, 37.0)
+
+
+def test_unsupported_field_is_rejected():
+    with pytest.raises(ValueError):
+        HistoryQuery(mongomock.MongoClient()).query(DEVICE, "$where", START, START + timedelta(hours=1))
+
+
+def test_bucket_size_keeps_points_under_target():
+    assert bucket_seconds_for(START, START + timedelta(minutes=30), 2000) == 1
+    assert bucket_seconds_for(START, START + timedelta(days=1), 2000) == 60
+    assert bucket_seconds_for(START, START + timedelta(days=30), 2000) == 3600
+    assert bucket_seconds_for(START, START + timedelta(days=3650), 2000) == 86400
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 500)
+    y[4321] = 50.0
+    sampled_x, sampled_y = lttb(x, y, 200)
+    assert len(sampled_x) == len(sampled_y) == 200
+    assert sampled_x[0] == 0 and sampled_x[-1] == 9999
+    assert np.all(np.diff(sampled_x) > 0)
+    assert 4321 in sampled_x
+
+
+def test_lttb_returns_short_series_unchanged():
+    x, y = lttb([1, 2, 3], [4, 5, 6], 10)
+    assert x.tolist() == [1, 2, 3] and y.tolist() == [4, 5, 6]
+
+
+class CountingHistory:
+    """Answers queries with one row per bucket and counts them."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, ip_address, field, start, end, bucket_seconds):
+        self.queries.append((start, end))
+        count = int((end - start).total_seconds() // bucket_seconds)
+        return [(start + timedelta(seconds=i * bucket_seconds), 1.0, 2.0, 1.5) for i in range(count)]
+
+
+def test_cache_queries_only_missing_tiles():
+    history = CountingHistory()
+    cache = HistoryCache(history)
+    tile = timedelta(seconds=60 * HistoryCache.TILE_BUCKETS)
+    start = datetime.fromtimestamp(START.timestamp() // tile.total_seconds() * tile.total_seconds(), timezone.utc)
+    times, mins, maxes, avgs = cache.fetch(DEVICE, "apower", start + tile / 2, start + tile * 2, 60)
+    assert len(history.queries) == 2
+    assert len(times) == HistoryCache.TILE_BUCKETS * 3 // 2
+    assert times[0] == (start + tile / 2).timestamp()
+    cache.fetch(DEVICE, "apower", start + tile, start + tile * 3, 60)  # Pan right by a tile
+    assert len(history.queries) == 3
+
+
+def test_cache_does_not_keep_tiles_still_filling_up():
+    history = CountingHistory()
+    cache = HistoryCache(history)
+    now = datetime.now(timezone.utc)
+    for _ in range(2):
+        cache.fetch(DEVICE, "apower", now - timedelta(minutes=5), now, 60)
+    assert len(history.queries) == 2
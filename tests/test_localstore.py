@@ -0,0 +1,79 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from history import HistoryQuery
+from localstore import RECORD, LocalHistoryQuery, LocalSampleWriter, LocalStore
+from status import DeviceStatus
+from storage import SampleWriter
+from timeseries import collection_name_for
+
+DEVICE = "10.0.0.1"
+START = datetime(2024, 5, 15, 22, 0, tzinfo=timezone.utc)
+
+
+def samples(seconds, start=START):
+    """One sample every 10 seconds with varying readings and a rising energy counter."""
+    return [(DEVICE, DeviceStatus(output=True, apower=100.0 + second % 7, voltage=120.0 + second % 3 / 10, current=0.8,
+                                  aenergy_total=50000.0 + second / 36, temperature_f=90.0), start + timedelta(seconds=second))
+            for second in range(0, seconds, 10)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalStore(str(tmp_path))
+
+
+def test_queries_match_mongodb(store):
+    batch = samples(4 * 3600)  # Crosses into the next day
+    writer = LocalSampleWriter(store)
+    writer.flush(batch)
+    writer.stop()
+    assert len(store.days(DEVICE)) == len({collection_name_for(timestamp) for _, _, timestamp in batch})
+    client = mongomock.MongoClient()
+    SampleWriter(client).flush(batch)
+    local, mongo = LocalHistoryQuery(store), HistoryQuery(client)
+    end = START + timedelta(hours=4)
+    for field in ("apower", "voltage", "aenergy.total"):
+        for bucket_seconds in (60, 900):
+            expected = mongo.query(DEVICE, field, START, end, bucket_seconds)
+            rows = local.query(DEVICE, field, START, end, bucket_seconds)
+            assert [row[0] for row in rows] == [row[0] for row in expected]
+            for row, expected_row in zip(rows, expected):
+                assert row[1:] == pytest.approx(expected_row[1:], abs=1e-3)  # float32 records
+
+
+def test_torn_record_is_dropped_on_reopen(store):
+    writer = LocalSampleWriter(store)
+    writer.flush(samples(100))
+    writer.stop()
+    day = collection_name_for(START)
+    with open(store.path(DEVICE, day), "ab") as file:
+        file.write(b"\x01" * (RECORD.size // 2))  # A crash mid-write
+    writer = LocalSampleWriter(store)
+    writer.flush(samples(100, START + timedelta(seconds=100)))
+    writer.stop()
+    _, _, records = store.read_day(DEVICE, day)
+    assert len(records) == 20
+    assert records["t"].tolist() == sorted(records["t"].tolist())
+    rows = LocalHistoryQuery(store).query(DEVICE, "apower", START, START + timedelta(seconds=200), 200)
+    assert rows[0][1:3] == (100.0, 106.0)
+
+
+def test_old_days_are_pruned_when_a_new_day_starts(store):
+    writer = LocalSampleWriter(store, retention_days=2)
+    for days_ago in (5, 3):
+        writer.flush(samples(10, START - timedelta(days=days_ago)))
+    assert len(store.days(DEVICE)) == 2  # Two days apart, so both are kept
+    writer.flush(samples(10, START - timedelta(days=1)))
+    assert store.days(DEVICE) == sorted(collection_name_for(START - timedelta(days=d)) for d in (3, 1))
+    writer.flush(samples(10, START))
+    writer.stop()
+    assert store.days(DEVICE) == sorted(collection_name_for(START - timedelta(days=d)) for d in (1, 0))
+    assert not os.path.exists(store.path(DEVICE, collection_name_for(START - timedelta(days=5))))
+
+
+def test_missing_device_has_no_history(store):
+    assert LocalHistoryQuery(store).query("10.9.9.9", "apower", START, START + timedelta(hours=1)) == []
@@ -0,0 +1,68 @@
+from metrics import Histogram, Registry
+
+
+def test_quantile_interpolates_within_buckets():
+    histogram = Histogram((1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 2.0, 3.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 0]  # A value on a bound counts in that bucket, as le is inclusive
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1.0) == 4.0
+    assert histogram.quantile(0.25) == 1.0
+
+
+def test_quantile_beyond_the_largest_bound_is_that_bound():
+    histogram = Histogram((1.0, 2.0))
+    histogram.observe(100.0)
+    assert histogram.quantile(0.99) == 2.0
+
+
+def test_quantile_since_a_snapshot_only_counts_later_observations():
+    histogram = Histogram((1.0, 2.0, 4.0))
+    for _ in range(100):
+        histogram.observe(0.1)
+    before = histogram.snapshot()
+    assert histogram.quantile(0.5, since=before) is None
+    histogram.observe(3.0)
+    histogram.observe(3.0)
+    assert histogram.quantile(0.5, since=before) == 3.0
+    assert histogram.quantile(0.5) < 1.0
+
+
+def test_series_are_kept_per_label_values():
+    registry = Registry()
+    requests = registry.counter("rpc_requests_total", "RPC requests.", ("device", "method"))
+    assert registry.counter("rpc_requests_total", "Registered again.", ("device", "method")) is requests
+    requests.labels("10.0.0.1", "Switch.GetStatus").inc()
+    requests.labels("10.0.0.1", "Switch.GetStatus").inc(2)
+    requests.labels("10.0.0.2", "Switch.GetStatus").inc()
+    assert requests.labels("10.0.0.1", "Switch.GetStatus").value == 3
+    gauge = registry.gauge("loop_lag_seconds", "Event loop lag.")
+    gauge.labels().set(0.25)
+    gauge.labels().set(0.5)
+    assert gauge.labels().value == 0.5
+
+
+def test_exposition_format():
+    registry = Registry()
+    registry.counter("errors_total", "Errors.", ("device",)).labels('plug "a"\\1\n').inc()
+    registry.gauge("subscribers", "Subscribers.").labels().set(3)
+    latency = registry.histogram("rpc_seconds", "RPC latency.", ("method",), buckets=(0.1, 1.0))
+    latency.labels("Switch.Set").observe(0.05)
+    latency.labels("Switch.Set").observe(0.5)
+    latency.labels("Switch.Set").observe(5.0)
+    assert registry.render() == "\n".join([
+        "# HELP errors_total Errors.",
+        "# TYPE errors_total counter",
+        'errors_total{device="plug \\"a\\"\\\\1\\n"} 1',
+        "# HELP rpc_seconds RPC latency.",
+        "# TYPE rpc_seconds histogram",
+        'rpc_seconds_bucket{method="Switch.Set",le="0.1"} 1',
+        'rpc_seconds_bucket{method="Switch.Set",le="1.0"} 2',
+        'rpc_seconds_bucket{method="Switch.Set",le="+Inf"} 3',
+        'rpc_seconds_sum{method="Switch.Set"} 5.55',
+        'rpc_seconds_count{method="Switch.Set"} 3',
+        "# HELP subscribers Subscribers.",
+        "# TYPE subscribers gauge",
+        "subscribers 3",
+    ]) + "\n"
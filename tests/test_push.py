@@ -0,0 +1,74 @@
+import time
+
+from poller import DevicePoller
+from push import PushListener
+from rpc_client import ShellyRpcClient
+from simulator import FakeShellyDevice, SimulatedFleet
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def start(fleet, poll, reconcile_interval=60.0):
+    """Start a poller with fast polling and a push listener on every device of a running fleet."""
+    poller = DevicePoller(fleet.addresses, ShellyRpcClient(), interval=0.1, steady_interval=0.1, off_interval=0.1,
+                          keep_results=False, poll=poll)
+    samples = []
+    poller.sample_sinks.append(lambda ip_address, status: samples.append(status))
+    poller.start()
+    PushListener(poller, reconcile_interval=reconcile_interval).start()
+    return poller, samples
+
+
+def drop_channels(fleet, device):
+    """Close every WebSocket connection to a simulated device, as a reboot or Wi-Fi drop would."""
+    fleet.loop.call_soon_threadsafe(lambda: [writer.close() for _, writer in list(device.peers)])
+
+
+def test_notifications_are_published_and_slow_polling():
+    # Periodic deltas are pushed once a minute, so the change below can only arrive as a notification
+    device = FakeShellyDevice(profile="fridge", notify_interval=60, seed=1)
+    fleet = SimulatedFleet([device])
+    (address,) = fleet.start_in_thread()
+    poller, samples = start(fleet, poll=False, reconcile_interval=30.0)
+    try:
+        health = poller.health[address]
+        wait_until(lambda: health.push_active and samples)
+        assert health.interval_override == 30.0
+        assert health.effective_interval() == 30.0
+        assert samples[0].output is True  # Seeded from the Shelly.GetStatus reply
+
+        fleet.loop.call_soon_threadsafe(device.set_output, False)
+        wait_until(lambda: poller.latest[address].output is False)
+        assert samples[-1].apower == samples[0].apower  # The delta is applied to the cached state
+    finally:
+        poller.stop()
+
+
+def test_polling_resumes_while_the_channel_is_down_and_slows_after_reconnect():
+    device = FakeShellyDevice(profile="fridge", notify_interval=60, seed=1)
+    fleet = SimulatedFleet([device])
+    (address,) = fleet.start_in_thread()
+    poller, samples = start(fleet, poll=True)
+    try:
+        health = poller.health[address]
+        wait_until(lambda: health.push_active)
+        time.sleep(0.3)  # The poll woken by the interval change may still be in flight
+        count = len(samples)
+        time.sleep(0.5)
+        assert len(samples) == count  # Only reconcile polling once a minute
+
+        drop_channels(fleet, device)
+        wait_until(lambda: not health.push_active)
+        assert health.interval_override is None
+        count = len(samples)
+        wait_until(lambda: len(samples) >= count + 3)  # Back to polling every 0.1s
+
+        wait_until(lambda: health.push_active)  # Reconnects after the backoff
+        assert health.interval_override == 60.0
+    finally:
+        poller.stop()
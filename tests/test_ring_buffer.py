@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from ring_buffer import RingBuffer
+from status import DeviceStatus
+
+START = 1_700_000_000_000
+
+
+def fill(buffer, seconds, first=0):
+    """Append one sample per second, apower counting the seconds and a large energy counter rising 0.3 Wh each."""
+    for second in range(first, first + seconds):
+        buffer.append(DeviceStatus(apower=float(second), aenergy_total=12_345_678.0 + second * 0.3), START + second * 1000)
+
+
+def test_wraparound_keeps_the_newest_samples_in_order():
+    buffer = RingBuffer(capacity=10)
+    fill(buffer, 25)
+    assert buffer.count == 10
+    times, values = buffer.window("apower", 0, START + 10**9)
+    assert values.tolist() == list(range(15, 25))
+    assert np.all(np.diff(times) == 1000)
+    assert buffer.latest() == (START + 24000, {"apower": 24.0, "voltage": 0.0, "current": 0.0,
+                                               "aenergy.total": 12_345_678.0 + 24 * 0.3, "temperature.tF": 0.0})
+
+
+def test_window_is_half_open_across_the_wrap():
+    buffer = RingBuffer(capacity=10)
+    fill(buffer, 14)  # Slots 0-3 hold seconds 10-13, slots 4-9 seconds 4-9
+    times, values = buffer.window("apower", START + 8000, START + 12000)
+    assert values.tolist() == [8.0, 9.0, 10.0, 11.0]
+    assert times.tolist() == [START + s * 1000 for s in (8, 9, 10, 11)]
+
+
+def test_out_of_order_samples_are_ignored():
+    buffer = RingBuffer(capacity=10)
+    fill(buffer, 3)
+    assert buffer.append(DeviceStatus(apower=99.0), START + 2000) is False
+    assert buffer.count == 3
+
+
+def test_covers_from_the_oldest_sample():
+    buffer = RingBuffer(capacity=10)
+    assert not buffer.covers(START)
+    fill(buffer, 15)
+    assert buffer.oldest_time() == START + 5000
+    assert buffer.covers(START + 5000)
+    assert not buffer.covers(START + 4999)
+
+
+def test_rate_across_the_wrap_keeps_counter_precision():
+    buffer = RingBuffer(capacity=10)
+    fill(buffer, 14)
+    assert buffer.rate("aenergy.total", 6) == pytest.approx(0.3)  # float32 keeps whole watt-hours at this size
+    assert buffer.rate("apower", 100) == 1.0  # Limited to what the buffer holds
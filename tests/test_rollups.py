@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+from history import HistoryQuery
+from rollups import Compactor
+from status import DeviceStatus
+from storage import SampleWriter
+from timeseries import format_ip_address
+
+DEVICE = "10.0.0.1"
+START = datetime(2024, 5, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def write(writer, seconds, start=START):
+    """Queue one sample per second for ``seconds``, with apower counting the seconds."""
+    for second in range(seconds):
+        writer.add(DEVICE, DeviceStatus(output=True, apower=float(second), voltage=120.0, aenergy_total=second / 10),
+                   start + timedelta(seconds=second))
+
+
+def drain(writer):
+    """Write everything queued, as the writer thread would."""
+    batch = []
+    while not writer.pending.empty():
+        batch.append(writer.pending.get_nowait())
+    writer.flush(batch)
+
+
+def test_rollup_levels_summarize_raw_samples():
+    client = mongomock.MongoClient()
+    writer = SampleWriter(client)
+    write(writer, 7200)
+    drain(writer)
+    compactor = Compactor(client, [DEVICE], settle=0)
+    compactor.compact(DEVICE, now=START + timedelta(hours=2))
+    db = client[format_ip_address(DEVICE)]
+    minutes = list(db.rollup_1m.find(sort=[("timestamp", 1)]))
+    assert len(minutes) == 120
+    assert minutes[0]["count"] == 60
+    assert minutes[0]["apower"] == {"min": 0.0, "max": 59.0, "mean": 29.5, "last": 59.0}
+    assert db.rollup_15m.count_documents({}) == 8
+    hours = list(db.rollup_1h.find(sort=[("timestamp", 1)]))
+    assert [hour["count"] for hour in hours] == [3600, 3600]
+    assert abs(sum(hour["energy"] for hour in hours) - 719.9) < 1e-6
+
+    # Queries at rollup resolution agree with the raw samples
+    rows = HistoryQuery(client).query(DEVICE, "apower", START, START + timedelta(hours=2), 3600)
+    assert [(row[1], row[2]) for row in rows] == [(0.0, 3599.0), (3600.0, 7199.0)]
+    assert abs(rows[0][3] - 1799.5) < 1e-9
+
+
+def test_watermark_waits_for_unwritten_samples():
+    client = mongomock.MongoClient()
+    writer = SampleWriter(client)
+    write(writer, 600)
+    drain(writer)
+    write(writer, 600, start=START + timedelta(seconds=600))  # Still queued, e.g. while MongoDB was down
+    compactor = Compactor(client, [DEVICE], settle=0, writer=writer)
+    compactor.compact(DEVICE, now=START + timedelta(hours=1))
+    db = client[format_ip_address(DEVICE)]
+    until = db.rollup_state.find_one({"_id": "rollup_1m"})["until"].replace(tzinfo=timezone.utc)
+    assert until == START + timedelta(seconds=600)
+
+    drain(writer)
+    assert writer.oldest_unwritten() is None
+    compactor.compact(DEVICE, now=START + timedelta(hours=1))
+    assert sum(minute["count"] for minute in db.rollup_1m.find()) == 1200
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+import requests
+
+from rpc_client import ShellyRpcClient, is_idempotent, request_not_sent
+from simulator import FakeShellyDevice
+
+
+def test_is_idempotent():
+    assert is_idempotent("Switch.GetStatus")
+    assert is_idempotent("Shelly.GetDeviceInfo")
+    assert is_idempotent("Schedule.List")
+    assert is_idempotent("Switch.Set")
+    assert not is_idempotent("Switch.Toggle")
+    assert not is_idempotent("Schedule.Create")
+    assert not is_idempotent("Schedule.Delete")
+
+
+def test_timed_out_create_is_not_retried(serve_devices):
+    device = FakeShellyDevice(profile="fridge", latency=0.6, seed=1)
+    address, = serve_devices(device)
+    client = ShellyRpcClient(read_timeout=0.5, retries=3, backoff_base=0.01)
+    params = {"timespec": "0 0 12 * * 1", "calls": [{"method": "switch.toggle", "params": {"id": 0}}]}
+    with pytest.raises(requests.ReadTimeout):
+        asyncio.run(client.call_async(address, "Schedule.Create", params))
+    assert len(device.jobs) == 1
+    client.close()
+
+
+def test_timed_out_read_is_retried(serve_devices):
+    device = FakeShellyDevice(profile="fridge", latency=0.6, seed=1)
+    address, = serve_devices(device)
+    client = ShellyRpcClient(read_timeout=0.5, retries=2, backoff_base=0.01)
+    calls = []
+    original = client.call
+    client.call = lambda *args: calls.append(args) or original(*args)
+    with pytest.raises(requests.ReadTimeout):
+        asyncio.run(client.call_async(address, "Switch.GetStatus", {"id": 0}))
+    assert len(calls) == 2
+    client.close()
+
+
+def test_refused_connection_counts_as_not_sent():
+    client = ShellyRpcClient(connect_timeout=0.5, retries=1)
+    with pytest.raises(requests.ConnectionError) as raised:
+        client.call("127.0.0.1:9", "Switch.Toggle", {"id": 0})
+    assert request_not_sent(raised.value)
+    client.close()
@@ -0,0 +1,34 @@
+from health import DeviceHealth, OPEN
+from shards import SAMPLE_RECORD, decode_sample, encode_sample, shard_of
+from status import DeviceStatus
+
+
+def test_sample_round_trip():
+    health = DeviceHealth(interval=1.0)
+    health.push_active = True
+    health.interval_override = 60.0
+    status = DeviceStatus(output=True, apower=123.5, voltage=120.1, current=1.03, aenergy_total=4567.25,
+                          aenergy_by_minute=(1.5, 2.5, 3.5), aenergy_minute_ts=1700000000, temperature_c=30.0,
+                          temperature_f=86.0, uptime=1234, unixtime=1700000012.5, ram_free=50000, wifi_rssi=-60,
+                          wifi_ip="192.168.1.50", cloud_connected=True)
+    record = encode_sample(7, health, status)
+    assert len(record) == SAMPLE_RECORD.size
+    index, state, push_active, interval, next_probe, decoded = decode_sample(SAMPLE_RECORD.unpack(record))
+    assert (index, state, push_active, interval, next_probe) == (7, "healthy", True, 60.0, None)
+    assert decoded == status
+
+
+def test_missing_fields_stay_missing():
+    health = DeviceHealth()
+    health.state, health.next_probe = OPEN, 1700000000.0
+    status = DeviceStatus(output=False, apower=0.0)
+    _, state, _, _, next_probe, decoded = decode_sample(SAMPLE_RECORD.unpack(encode_sample(0, health, status)))
+    assert state == OPEN and next_probe == 1700000000.0
+    assert decoded == status
+    assert decoded.uptime is None and decoded.wifi_ip is None and decoded.cloud_connected is None
+
+
+def test_shard_of_is_stable_and_in_range():
+    shards = [shard_of(f"10.0.0.{i}", 4) for i in range(1, 101)]
+    assert shards == [shard_of(f"10.0.0.{i}", 4) for i in range(1, 101)]
+    assert set(shards) == {0, 1, 2, 3}
@@ -0,0 +1,55 @@
+import dataclasses
+
+import pytest
+
+from status import DeviceStatus
+
+# A Switch.GetStatus result as a Plus Plug US reports it
+SWITCH_STATUS = {
+    "id": 0, "source": "HTTP_in", "output": True, "apower": 101.2, "voltage": 121.4, "current": 0.892,
+    "aenergy": {"total": 12345.678, "by_minute": [1683.4, 1687.0, 1690.1], "minute_ts": 1718000040},
+    "temperature": {"tC": 41.3, "tF": 106.3},
+}
+
+
+def test_parses_switch_status():
+    assert DeviceStatus.from_switch_status(SWITCH_STATUS) == DeviceStatus(
+        output=True, apower=101.2, voltage=121.4, current=0.892, aenergy_total=12345.678,
+        aenergy_by_minute=(1683.4, 1687.0, 1690.1), aenergy_minute_ts=1718000040, temperature_c=41.3, temperature_f=106.3)
+
+
+def test_missing_and_null_fields_fall_back_to_defaults():
+    # Switches without metering omit aenergy and power readings, and a failed sensor reports null
+    status = DeviceStatus.from_switch_status({"id": 0, "output": False, "apower": None, "temperature": {"tC": None, "tF": None}})
+    assert status == DeviceStatus(output=False)
+    status = DeviceStatus.from_switch_status({"id": 0, "aenergy": None, "temperature": None, "voltage": 120})
+    assert (status.output, status.voltage, status.aenergy_total, status.aenergy_by_minute) == (False, 120.0, 0.0, ())
+    assert status.uptime is None and status.unixtime is None
+
+
+def test_parses_full_shelly_status():
+    data = {
+        "switch:0": SWITCH_STATUS,
+        "sys": {"uptime": 86400, "unixtime": 1718000065, "ram_free": 151000},
+        "wifi": {"sta_ip": "192.168.1.50", "status": "got ip", "rssi": -58},
+        "cloud": {"connected": False},
+    }
+    status = DeviceStatus.from_shelly_status(data)
+    assert status.apower == 101.2 and status.temperature_f == 106.3
+    assert (status.uptime, status.unixtime, status.ram_free) == (86400, 1718000065.0, 151000)
+    assert (status.wifi_rssi, status.wifi_ip, status.cloud_connected) == (-58, "192.168.1.50", False)
+    assert DeviceStatus.from_shelly_status({"sys": {"unixtime": None}}) == DeviceStatus()
+
+
+def test_notification_updates_only_the_fields_it_carries():
+    status = DeviceStatus.from_switch_status(SWITCH_STATUS)
+    updated = status.with_notification({"ts": 1718000070.5, "switch:0": {"id": 0, "apower": 0.0, "output": False}})
+    assert (updated.output, updated.apower, updated.voltage, updated.unixtime) == (False, 0.0, 121.4, 1718000070.5)
+    assert status.output is True  # The original is left alone
+
+
+def test_status_is_immutable_and_slotted():
+    status = DeviceStatus()
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        status.apower = 1.0
+    assert not hasattr(status, "__dict__")
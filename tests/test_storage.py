@@ -0,0 +1,88 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+from pymongo.errors import AutoReconnect
+
+from status import DeviceStatus
+from storage import SampleWriter
+from timeseries import collection_name_for, format_ip_address
+
+DEVICE = "10.0.0.1"
+START = datetime(2024, 5, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def sample(second):
+    return DEVICE, DeviceStatus(output=True, apower=float(second), voltage=120.0), START + timedelta(seconds=second)
+
+
+def stored(client, day=START):
+    return client[format_ip_address(DEVICE)][collection_name_for(day)].count_documents({})
+
+
+def test_full_batches_are_written_and_the_rest_on_stop():
+    client = mongomock.MongoClient()
+    writer = SampleWriter(client, batch_size=10, flush_interval=60)
+    writer.start()
+    for second in range(25):
+        writer.add(*sample(second))
+    deadline = time.monotonic() + 5
+    while writer.written < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.written == 20  # Two full batches, the remainder waits for the interval
+    writer.stop()
+    assert writer.written == 25
+    assert stored(client) == 25
+    document = client[format_ip_address(DEVICE)][collection_name_for(START)].find_one({"apower": 3.0})
+    assert document["timestamp"] == (START + timedelta(seconds=3)).replace(tzinfo=None)
+
+
+def test_samples_go_to_their_day_collection():
+    client = mongomock.MongoClient()
+    writer = SampleWriter(client)
+    midnight = datetime.combine(START.astimezone().date() + timedelta(days=1), datetime.min.time()).astimezone()
+    before = midnight - timedelta(seconds=1)
+    writer.flush([(DEVICE, DeviceStatus(apower=1.0), before - timedelta(seconds=1)), (DEVICE, DeviceStatus(apower=2.0), before),
+                  (DEVICE, DeviceStatus(apower=3.0), midnight)])
+    assert collection_name_for(before) != collection_name_for(midnight)
+    assert stored(client, before) == 2
+    assert stored(client, midnight) == 1
+
+
+def test_full_queue_drops_the_oldest_samples():
+    writer = SampleWriter(mongomock.MongoClient(), max_pending=3)
+    for second in range(5):
+        writer.add(*sample(second))
+    assert writer.dropped == 2
+    assert [item[2] for item in writer.pending.queue] == [START + timedelta(seconds=s) for s in (2, 3, 4)]
+    assert writer.oldest_unwritten() == START + timedelta(seconds=2)
+
+
+def test_failed_writes_are_retried(monkeypatch):
+    client = mongomock.MongoClient()
+    insert_many = mongomock.collection.Collection.insert_many
+    failures = []
+
+    def flaky_insert_many(collection, documents, *args, **kwargs):
+        if len(failures) < 2:
+            failures.append(len(documents))
+            raise AutoReconnect("connection reset")
+        return insert_many(collection, documents, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", flaky_insert_many)
+    writer = SampleWriter(client, retry_interval=0.01)
+    writer.flush([sample(second) for second in range(5)])
+    assert failures == [5, 5]
+    assert writer.written == 5
+    assert stored(client) == 5  # Nothing written twice
+
+
+def test_failed_writes_are_discarded_on_shutdown(monkeypatch):
+    def failing_insert_many(collection, documents, *args, **kwargs):
+        raise AutoReconnect("connection refused")
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", failing_insert_many)
+    writer = SampleWriter(mongomock.MongoClient(), retry_interval=0.01)
+    writer.stopping.set()
+    writer.flush([sample(second) for second in range(5)])
+    assert writer.written == 0
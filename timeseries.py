@@ -0,0 +1,130 @@
+"""Sample layout shared by the MongoDB and local stores, kept free of pymongo.
+
+Both stores key a device's samples by ``format_ip_address`` and split them
+into local-time ``YYYY_MM_DD`` days, and both answer history queries with the
+same bucket sizes and bucket merging, so the local store can run without
+pymongo installed. ``BufferedWriter`` is the write queue both stores share.
+"""
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+QUERYABLE_FIELDS = ("apower", "voltage", "current", "aenergy.total", "temperature.tF")
+BUCKET_SECONDS = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 86400)
+
+
+def format_ip_address(ip_address):
+    """Return the database name used for a device's samples."""
+    return ip_address.replace('.', '_').replace(':', '_')
+
+
+def collection_name_for(timestamp):
+    """Return the day collection (YYYY_MM_DD, local time) a sample belongs to."""
+    return timestamp.astimezone().strftime("%Y_%m_%d")
+
+
+def parse_day(value):
+    """Parse a YYYY_MM_DD day string into a local-time datetime at midnight."""
+    return datetime.strptime(value.strip(), "%Y_%m_%d").astimezone()
+
+
+def bucket_seconds_for(start, end, target_points):
+    """Pick the smallest standard bucket size that keeps the span under ``target_points`` buckets."""
+    span = (end - start).total_seconds()
+    for seconds in BUCKET_SECONDS:
+        if span / seconds <= target_points:
+            return seconds
+    return BUCKET_SECONDS[-1]
+
+
+def merge_buckets(buckets, rows):
+    """Add aggregated rows to ``buckets``, merging partial buckets that straddle collections."""
+    for row in rows:
+        key = int(row["_id"])
+        if key in buckets:
+            merged = buckets[key]
+            merged["min"] = min(merged["min"], row["min"])
+            merged["max"] = max(merged["max"], row["max"])
+            merged["sum"] += row["sum"]
+            merged["count"] += row["count"]
+        else:
+            buckets[key] = row
+
+
+class BufferedWriter:
+    """Buffers device samples on a bounded queue and writes them in batches from a background thread.
+
+    ``add`` never blocks: a full queue drops its oldest sample, counted in
+    ``dropped``. The thread hands ``flush`` a batch of ``(ip_address, status,
+    timestamp)`` samples whenever ``batch_size`` are pending or
+    ``flush_interval`` seconds have passed; subclasses implement ``flush``.
+    """
+    dropped_metric = None  # Counter of samples dropped when the queue is full
+
+    def __init__(self, batch_size, flush_interval, max_pending, name):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self.batch = []  # Samples taken off the queue and not yet written
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        """Start the background writer thread."""
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Flush pending samples and stop the writer thread."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def add(self, ip_address, status, timestamp=None):
+        """Queue a DeviceStatus sample for writing without blocking."""
+        item = (ip_address, status, timestamp or datetime.now(timezone.utc))
+        while True:
+            try:
+                self.pending.put_nowait(item)
+                return
+            except queue.Full:
+                # Backpressure: make room by discarding the oldest pending sample
+                try:
+                    self.pending.get_nowait()
+                    self.dropped += 1
+                    if self.dropped_metric is not None:
+                        self.dropped_metric.labels().inc()
+                except queue.Empty:
+                    pass
+
+    def oldest_unwritten(self):
+        """Return the timestamp of the oldest sample queued or being written, or None; safe from any thread."""
+        # The queue is read before the batch, so a sample moving from one to the other is seen in either
+        with self.pending.mutex:
+            queued = self.pending.queue[0][2] if self.pending.queue else None
+        batch = self.batch
+        oldest = batch[0][2] if batch else None
+        return min(filter(None, (queued, oldest)), default=None)
+
+    def run(self):
+        """Collect queued samples into batches and flush them on size or time."""
+        deadline = time.monotonic() + self.flush_interval
+        while not (self.stopping.is_set() and self.pending.empty()):
+            try:
+                self.batch.append(self.pending.get(timeout=max(0.0, min(deadline - time.monotonic(), 0.5))))
+            except queue.Empty:
+                pass
+            if len(self.batch) >= self.batch_size or time.monotonic() >= deadline or self.stopping.is_set():
+                if self.batch:
+                    self.flush(self.batch)
+                    self.batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if self.batch:
+            self.flush(self.batch)
+            self.batch = []
+
+    def flush(self, batch):
+        """Write a batch of ``(ip_address, status, timestamp)`` samples."""
+        raise NotImplementedError